@@ -1,2 +1,5 @@
 from .portfolio import runPortfolio
-from .interface import BacktestInterface
\ No newline at end of file
+from .sweep import runSweep
+from .interface import Portfolio
+from .store import saveResult, loadResult
+from .incremental import snapshotPortfolio, extendPortfolio
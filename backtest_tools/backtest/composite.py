@@ -1,20 +1,165 @@
 from bt.core import Strategy
 from bt.algos import run_always
+import copy
 import uuid
-import importlib
-from .strategy import *
+import inspect
+from . import strategy as algo_factory
+from .signal_engine import getSignal
 from backtest_tools.helper import _check_params
 from backtest_tools.data import getDataTable
+from backtest_tools.exceptions import RequirementNotMeetException
+from backtest_tools import profiling
 
 
+# class name of a strategy entry -> algo factory, fn(data_table, params)
+# filled with the factories of `strategy.py` on first use, see `registerAlgo`
+ALGO_REGISTRY = {}
+
+
+def _load_registry():
+    if ALGO_REGISTRY:
+        return
+    for name, func in vars(algo_factory).items():
+        if not name.startswith('_') and inspect.isfunction(func)\
+                and list(inspect.signature(func).parameters) == ['data_table', 'params']:
+            ALGO_REGISTRY.setdefault(name, func)
+
+
+def registerAlgo(name, factory):
+    '''
+    make `factory` (fn(data_table, params) -> bt Algo) usable as {'class': name} of a strategy
+    '''
+    _load_registry()
+    ALGO_REGISTRY[name] = factory
+
+
+def resolveAlgo(name):
+    _load_registry()
+    factory = ALGO_REGISTRY.get(name)
+    if factory is None:
+        raise RequirementNotMeetException('no such strategy class %s\n' % name)
+    return factory
+
+
+def _valid_action(action):
+    '''
+    check an action of `weigh_target` without data, return it with asset_id as str
+    '''
+    _check_params(action, ['indicator_id', 'method', 'asset_id', 'strategy'])
+    signal = getSignal(action['method'])
+    if action['strategy'] not in ['buy', 'sell', 'hold']:
+        raise RequirementNotMeetException('no such strategy %s\n' % action['strategy'])
+    if isinstance(action['asset_id'], (int, float)):
+        action['asset_id'] = str(action['asset_id'])
+    if not isinstance(action['asset_id'], str):
+        raise RequirementNotMeetException('asset ID should be str(preferred), int, or float\n')
+    signal.validate(action.get('params') or {})
+    return action
+
+
+class StrategyPlan(list):
+    '''
+    strategy spec validated once, with the algo factory of each entry resolved,
+    see `compileStrategy`
+
+    a list of the (copied) spec entries, so it can be used wherever params['strategy'] is,
+    treat it as read-only and use `update` for new action params
+
+    plan = compileStrategy(params['strategy'])
+    data_table, s = plan.bind(data_table)
+    '''
+    def __init__(self, spec, factories):
+        super(StrategyPlan, self).__init__(spec)
+        self.factories = factories
+
+    def bind(self, data_table):
+        '''
+        build the bt Strategy of the plan on `data_table`
+        return data_table, bt.core.Strategy
+        '''
+        data_table = getDataTable(data_table)
+        StrategyList = []
+        for stra, factory in zip(self, self.factories):
+            func = run_always(factory)
+            if profiling.enabled():
+                with profiling.current().span('build.' + stra['class'], 'algo.build'):
+                    algo = func(data_table=data_table, params=stra['params'])
+                StrategyList.append(profiling.TracedAlgo(algo, stra['class']))
+            else:
+                StrategyList.append(func(data_table=data_table, params=stra['params']))
+
+        s = Strategy(**{
+            'name': uuid.uuid4(),
+            'algos': StrategyList,
+            'children': None
+        })
+        return data_table, s
+
+    def update(self, action_params, step=None):
+        '''
+        action_params (dict): {(action index, param name): value} of `weigh_target`
+        step (int): index of the `weigh_target` entry, default the first one
+        return a new plan, only the changed actions are copied and checked again
+        '''
+        if step is None:
+            steps = [i for i, stra in enumerate(self) if stra['class'] == 'weigh_target']
+            if not steps:
+                raise RequirementNotMeetException('no weigh_target in the strategy\n')
+            step = steps[0]
+        entry = dict(self[step], params=dict(self[step]['params']))
+        actions = list(entry['params']['action'])
+        for idx in set(idx for idx, _ in action_params):
+            if not (isinstance(idx, int) and 0 <= idx < len(actions)):
+                raise RequirementNotMeetException('no such action index %s\n' % idx)
+            actions[idx] = dict(actions[idx], params=dict(actions[idx].get('params') or {}))
+        for (idx, name), value in action_params.items():
+            actions[idx]['params'][name] = value
+        for idx in set(idx for idx, _ in action_params):
+            _valid_action(actions[idx])
+        entry['params']['action'] = actions
+
+        spec = list(self)
+        spec[step] = entry
+        return StrategyPlan(spec, self.factories)
+
+
+@profiling.traced('compileStrategy', 'algo.build')
+def compileStrategy(strategy):
+    '''
+    strategy (list of dict): params['strategy'] of `runPortfolio`, or a `StrategyPlan`
+    validate every entry and the actions of `weigh_target`, resolve the algo factories
+    return StrategyPlan, reusable on any DataTable
+    '''
+    if isinstance(strategy, StrategyPlan):
+        return strategy
+    if not isinstance(strategy, list) or not strategy:
+        raise RequirementNotMeetException('strategy should be a non-empty list of dict\n')
+
+    spec, factories = [], []
+    for stra in copy.deepcopy(strategy):
+        _check_params(stra, ['class'])
+        factories.append(resolveAlgo(stra['class']))
+        stra['params'] = stra.get('params') or {}
+        if not isinstance(stra['params'], dict):
+            raise RequirementNotMeetException('params of %s should be a dict\n' % stra['class'])
+        if stra['class'] == 'weigh_target':
+            _check_params(stra['params'], ['action'])
+            for action in stra['params']['action']:
+                _valid_action(action)
+        spec.append(stra)
+    return StrategyPlan(spec, factories)
+
+
+@profiling.traced('composite', 'algo.build')
 def composite(params):
     '''
     construct strategy composite for portfolio
     using bt.core.Strategy
-    Args: 
-        params (dict): containing keys `data`, `strategy` 
+    Args:
+        params (dict): containing keys `data`, `strategy`
             data_table (dict): follow the rules of data.py
-            strategy (list): list of dictionary, containing all params that each strategy needs
+            strategy (list): list of dictionary, containing all params that each strategy needs,
+                or a `StrategyPlan` of `compileStrategy`, then it is not validated again
 
     --------------------------------------------------
     Strategy(class):
@@ -32,27 +177,5 @@ def composite(params):
             another. Not cleared on each pass.
     '''
     _check_params(params, ['data_table', 'strategy'])
-
-    name = uuid.uuid4()
-    data_table = getDataTable(params['data_table'])
-    
-    StrategyList = []
-    for stra in params['strategy']:
-        pkg = importlib.import_module('backtest_tools.backtest.strategy')
-        func = getattr(pkg, stra['class'])
-        func = run_always(func)
-
-        inputs = {}
-        inputs['data_table'] = data_table
-        inputs['params'] = {}
-        if stra.get('params'):
-            inputs['params'] = stra['params']
-        
-        StrategyList.append(func(**inputs))
-    
-    s = Strategy(**{
-        'name': name,
-        'algos': StrategyList,
-        'children': None
-    })
-    return data_table, s
\ No newline at end of file
+    plan = compileStrategy(params['strategy'])
+    return plan.bind(params['data_table'])
@@ -1,11 +1,17 @@
 from bt.algos import SelectWhere, WeighTarget
 import pandas as pd
 import numpy as np
-import importlib
-from backtest_tools.helper import _check_params, _valid_id, _convert_type
+from backtest_tools.helper import _check_params
 from backtest_tools.exceptions import RequirementNotMeetException
+from backtest_tools.profiling import traced
+from .signal_engine import (
+    SignalEngine, Param, SIGN, registerSignal, signal_cache,
+    _need_threshold, _need_growth, _need_return, _need_ma_ma, _need_ma_price,
+    _eval_threshold, _eval_growth, _eval_return, _eval_crossover,
+)
 
 
+@traced('weigh_target', 'algo.build')
 def weigh_target(data_table, params):
     '''
     params (list of dict):
@@ -22,28 +28,75 @@ def weigh_target(data_table, params):
                 }, {...}
             ]
         }
+        'vectorize' (optional, bool): build weights from an event frame
+            instead of assigning each action row by row, default True
+        'use_cache' (optional, bool): reuse the dates of signals computed before,
+            see `signal_engine.signal_cache`, default True
+    '''
+    actionList = _collect_actions(data_table, params)
+    if params.get('vectorize', True):
+        weight = _weight_by_event(data_table.asset, actionList)
+    else:
+        weight = _weight_by_loop(data_table.asset, actionList)
+    return WeighTarget(weights=weight)
+
+
+def _collect_actions(data_table, params):
+    '''
+    run the method of each action,
+    signals found in `signal_cache` are not computed again unless params['use_cache'] is False,
+    methods supported by `SignalEngine` are computed together in one batch
+    unless params['vectorize'] is False
+    return list of [strategy, asset_id, date] sorted by date
     '''
     _check_params(params, ['action'])
+    engine = SignalEngine(data_table)
+    # each action is validated once, the signals get the converted params
+    prepared = [engine.prepare(id_params) for id_params in params['action']]
+
+    dateLists = {}
+    keys = {}
+    if params.get('use_cache', True):
+        digests = {}
+        for i, (signal, indicatorID, method_params) in enumerate(prepared):
+            key = signal_cache.key(data_table, signal, indicatorID, method_params, digests)
+            dateList = signal_cache.get(key)
+            if dateList is None:
+                keys[i] = key
+            else:
+                dateLists[i] = dateList
+    pending = [i for i in range(len(prepared)) if i not in dateLists]
+
+    if params.get('vectorize', True):
+        index = [i for i in pending if prepared[i][0].vectorizable]
+        dateLists.update(zip(index, engine.evaluate([prepared[i] for i in index])))
+
+    for i in pending:
+        if i not in dateLists:
+            signal, indicatorID, method_params = prepared[i]
+            dateLists[i] = signal.func(
+                data_table=data_table, 
+                indicatorID=indicatorID, 
+                params=method_params
+            )
+        if i in keys:
+            dateLists[i] = signal_cache.put(keys[i], dateLists[i])
+
     actionList = []
-    for id_params in params['action']:
-        pkg = importlib.import_module('backtest_tools.backtest.customized_strategy')
-        func = getattr(pkg, id_params['method'])
-
-        dateList = func(
-            data_table=data_table, 
-            indicatorID=id_params['indicator_id'], 
-            params=id_params['params']
-        )
-
-        if isinstance(id_params['asset_id'], (int, float)): 
-            id_params['asset_id'] = str(id_params['asset_id'])
-        if not isinstance(id_params['asset_id'], str):
+    for i, id_params in enumerate(params['action']):
+        dateList = dateLists[i]
+
+        # actions of a `StrategyPlan` are read-only, their asset ID is already str
+        assetID = id_params['asset_id']
+        if isinstance(assetID, (int, float)): 
+            assetID = str(assetID)
+        if not isinstance(assetID, str):
             raise RequirementNotMeetException('asset ID should be str(preferred), int, or float')
         if id_params['strategy'] not in ['buy', 'sell', 'hold']:
             raise RequirementNotMeetException('no such strategy %s' % id_params['strategy'])
         
         action = [
-            [id_params['strategy'], id_params['asset_id'], date]
+            [id_params['strategy'], assetID, date]
             for date in dateList
         ]
         if not actionList:
@@ -55,28 +108,86 @@ def weigh_target(data_table, params):
             actionList.extend(action)
 
     # actionList contains [strategy, asset_id, date]
-    actionList = sorted(actionList, key=lambda x: x[2])
-    weight = data_table.asset.copy(deep=True)
+    # stable sort by date, same order as sorted(actionList, key=lambda x: x[2])
+    # without comparing the dates one pair at a time
+    dates = np.array([x[2] for x in actionList], dtype='datetime64[ns]')
+    return [actionList[i] for i in np.argsort(dates, kind='stable')]
+
+
+def _action_value(strategy):
+    if strategy == 'buy':
+        return 1
+    elif strategy == 'sell':
+        return -1
+    elif strategy == 'hold':
+        return 0
+    raise RequirementNotMeetException('unknown action\n')
+
+
+def _weight_by_loop(asset, actionList):
+    '''
+    set weight from each action date onwards, one action at a time
+    actionList (list): [strategy, asset_id, date] sorted by date
+    '''
+    weight = asset.copy(deep=True)
     weight[:] = 0
 
     # if need `action1` And `action2` 
     # -> pd.DataFrame(actionList).groupby(2).agg(np.array)
     for action in actionList:
-        if action[0] == 'buy':
-            insert_value = 1
-        elif action[0] == 'sell':
-            insert_value = -1
-        elif action[0] == 'hold':
-            insert_value = 0
-        else:
-            raise RequirementNotMeetException('unknown action\n')
+        insert_value = _action_value(action[0])
         weight.loc[action[2]:, action[1]] = insert_value
 
     weight.fillna(0, inplace=True)
-    return WeighTarget(weights=weight)
+    return weight
 
 
+def _weight_by_event(asset, actionList, initial=None):
+    '''
+    same result as `_weight_by_loop`, but pivot all actions onto 
+    the asset index as a sparse event frame and forward-fill once
+    actionList (list): [strategy, asset_id, date] sorted by date
+    initial (pd.Series): weight before the first action, default 0
+    '''
+    weight = asset.copy(deep=True)
+    weight[:] = 0
+    if initial is not None:
+        for col, value in initial.items():
+            weight[col] = value
+    if not actionList:
+        return weight
+
+    events = pd.DataFrame(actionList, columns=['strategy', 'asset_id', 'date'])
+    events['value'] = [_action_value(x) for x in events['strategy']]
+
+    # `weight.loc[date:, asset_id]` creates the column for unknown asset
+    for asset_id in pd.unique(events['asset_id']):
+        if asset_id not in weight.columns:
+            weight[asset_id] = np.nan
+
+    # `weight.loc[date:]` starts from the first row at or after date
+    events['row'] = weight.index.searchsorted(
+        pd.to_datetime(events['date']).values, side='left'
+    )
+    events = events.loc[events['row'] < len(weight.index)]
+    # later action on the same row overwrites the earlier one
+    events = events.drop_duplicates(['row', 'asset_id'], keep='last')
+
+    sparse = events.pivot(index='row', columns='asset_id', values='value')
+    filled = sparse.reindex(np.arange(len(weight.index))).ffill()
+    filled.index = weight.index
+    for col in filled.columns:
+        weight[col] = filled[col].where(filled[col].notnull(), weight[col])
 
+    weight.fillna(0, inplace=True)
+    return weight
+
+
+@registerSignal(
+    'trade_at_threshold', params={'threshold': float, 'n': int, 'sign': SIGN},
+    needs=_need_threshold, evaluate=_eval_threshold, lookback=lambda p: p['n'] + 2
+)
+@traced('signal.trade_at_threshold', 'signal')
 def trade_at_threshold(data_table, indicatorID, params):
     '''
     reference: py/Strategy.py DataThreshold
@@ -93,13 +204,6 @@ def trade_at_threshold(data_table, indicatorID, params):
     sign (int): set([1, -1]) 做多為1，做空為-1
                 若是做多平倉則為-1，做空平倉為1
     '''
-    _check_params(params, ['threshold', 'n', 'sign'])
-    params = _convert_type(params, ['n', 'sign'], int)
-    params = _convert_type(params, ['threshold'], float)
-    indicatorID = _valid_id(indicatorID)
-    if indicatorID not in data_table.use_id['indicator']:
-        raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % indicatorID)
-
     indicatorDF = data_table.indicator[indicatorID]\
                             .copy(deep=True)\
                             .shift(1)
@@ -131,6 +235,11 @@ def trade_at_threshold(data_table, indicatorID, params):
     return dateList
 
 
+@registerSignal(
+    'continuous_growth', params={'n': int, 'sign': SIGN},
+    needs=_need_growth, evaluate=_eval_growth, lookback=lambda p: p['n'] + 3
+)
+@traced('signal.continuous_growth', 'signal')
 def continuous_growth(data_table, indicatorID, params):
     '''
     reference: py/Strategy.py ContinuousGrowth
@@ -145,12 +254,6 @@ def continuous_growth(data_table, indicatorID, params):
     sign (int): set([1, -1]) 做多為1，做空為-1
                 若是做多平倉則為-1，做空平倉為1
     '''
-    _check_params(params, ['n', 'sign'])
-    params = _convert_type(params, ['n', 'sign'], int)
-    indicatorID = _valid_id(indicatorID)
-    if indicatorID not in data_table.use_id['indicator']:
-        raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % indicatorID)
-    
     indicatorDF = data_table.indicator[indicatorID]\
                             .copy(deep=True)\
                             .shift(1)
@@ -178,6 +281,11 @@ def continuous_growth(data_table, indicatorID, params):
     return dateList
 
 
+@registerSignal(
+    'cumulative_return_threshold', params={'threshold': float, 'n': int, 'sign': SIGN},
+    needs=_need_return, evaluate=_eval_return, lookback=lambda p: p['n'] + 2
+)
+@traced('signal.cumulative_return_threshold', 'signal')
 def cumulative_return_threshold(data_table, indicatorID, params):
     '''
     reference: py/Strategy.py CumulativeReturnThreshold
@@ -194,13 +302,6 @@ def cumulative_return_threshold(data_table, indicatorID, params):
     sign (int): set([1, -1]) 做多為1，做空為-1
                 若是做多平倉則為-1，做空平倉為1
     '''
-    _check_params(params, ['threshold', 'n', 'sign'])
-    params = _convert_type(params, ['n', 'sign'], int)
-    params = _convert_type(params, ['threshold'], float)
-    indicatorID = _valid_id(indicatorID)
-    if indicatorID not in data_table.use_id['indicator']:
-        raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % indicatorID)
-
     indicatorDF = data_table.indicator[indicatorID]\
                             .copy(deep=True)\
                             .shift(1)
@@ -224,6 +325,10 @@ def cumulative_return_threshold(data_table, indicatorID, params):
     return dateList
 
 
+@registerSignal(
+    'specific_date', params={'sign': SIGN, 'date': list}, lookback=lambda p: 0
+)
+@traced('signal.specific_date', 'signal')
 def specific_date(data_table, indicatorID, params):
     '''
     reference: py/Strategy.py SelfChoice
@@ -238,19 +343,14 @@ def specific_date(data_table, indicatorID, params):
     sign (int): set([1, -1]) 做多為1，做空為-1
                 若是做多平倉則為-1，做空平倉為1
     '''
-    _check_params(params, ['sign', 'date'])
-    params = _convert_type(params, ['sign'], int)
-    indicatorID = _valid_id(indicatorID)
-    if indicatorID not in data_table.use_id['indicator']:
-        raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % indicatorID)
-    if params['sign'] not in [1, -1]:
-        raise RequirementNotMeetException('sign should be either 1 or -1\n')
-    if not isinstance(params['date'], list):
-        raise RequirementNotMeetException('date should be list of datetime format\n')
-    
     return pd.to_datetime(params['date'], format='%Y-%m-%d').values
 
 
+@registerSignal(
+    'ma_crossover_ma', params={'sign': SIGN, 'ma1': int, 'ma2': int},
+    needs=_need_ma_ma, evaluate=_eval_crossover, lookback=lambda p: max(p['ma1'], p['ma2']) + 1
+)
+@traced('signal.ma_crossover_ma', 'signal')
 def ma_crossover_ma(data_table, indicatorID, params):
     '''
     params (dict):
@@ -265,14 +365,6 @@ def ma_crossover_ma(data_table, indicatorID, params):
     sign (int): set([1, -1]) 做多為1，做空為-1
                 若是做多平倉則為-1，做空平倉為1
     '''
-    _check_params(params, ['sign', 'ma1', 'ma2'])
-    params = _convert_type(params, ['sign', 'ma1', 'ma2'], int)
-    indicatorID = _valid_id(indicatorID)
-    if indicatorID not in data_table.use_id['indicator']:
-        raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % indicatorID)
-    if not (isinstance(params['ma1'], int) and isinstance(params['ma2'], int)):
-        raise RequirementNotMeetException('ma1 and ma2 should be int\n')
-
     use_col = []
     indicatorDF = data_table.indicator[[indicatorID]].copy(deep=True)
     for ma in [params['ma1'], params['ma2']]:
@@ -300,6 +392,11 @@ def ma_crossover_ma(data_table, indicatorID, params):
     return dateList
 
 
+@registerSignal(
+    'ma_crossover_price', params={'sign': SIGN, 'ma': int},
+    needs=_need_ma_price, evaluate=_eval_crossover, lookback=lambda p: p['ma'] + 1
+)
+@traced('signal.ma_crossover_price', 'signal')
 def ma_crossover_price(data_table, indicatorID, params):
     '''
     params (dict):
@@ -312,14 +409,6 @@ def ma_crossover_price(data_table, indicatorID, params):
     sign (int): set([1, -1]) 做多為1，做空為-1
                 若是做多平倉則為-1，做空平倉為1
     '''
-    _check_params(params, ['sign', 'ma'])
-    params = _convert_type(params, ['sign', 'ma'], int)
-    indicatorID = _valid_id(indicatorID)
-    if indicatorID not in data_table.use_id['indicator']:
-        raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % indicatorID)
-    if not isinstance(params['ma'], int):
-        raise RequirementNotMeetException('ma should be int\n')
-
     use_col = [str(indicatorID)]
     indicatorDF = data_table.indicator[[indicatorID]].copy(deep=True)
     for ma in [params['ma']]:
@@ -344,4 +433,4 @@ def ma_crossover_price(data_table, indicatorID, params):
         (indicatorDF['sign'] == 1)
     ].index.values
 
-    return dateList
\ No newline at end of file
+    return dateList
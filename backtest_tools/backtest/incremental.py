@@ -0,0 +1,225 @@
+import copy
+import pandas as pd
+from bt.core import Algo, AlgoStack, Strategy
+from bt.algos import WeighTarget, RunPeriod
+from bt.backtest import Backtest
+from .portfolio import RunBacktest
+from .customized_strategy import _collect_actions, _weight_by_event
+from .signal_engine import getSignal
+from backtest_tools.data import getDataTable
+from backtest_tools.helper import _check_params
+from backtest_tools.exceptions import RequirementNotMeetException
+from backtest_tools.profiling import TracedAlgo
+
+
+def _check_run_algo(algos):
+    '''
+    the stack should start with a run_daily|weekly|monthly|quarterly|yearly algo
+    that does not run on the last date, so it has not run after the snapshot date
+    '''
+    run = algos[0] if algos else None
+    if isinstance(run, TracedAlgo):
+        run = run.algo
+    if not isinstance(run, RunPeriod) or run._run_on_last_date:
+        raise RequirementNotMeetException(
+            'snapshot needs run_daily, run_weekly, run_monthly, run_quarterly or run_yearly '
+            'with run_on_last_date False as the first algo of the strategy\n'
+        )
+
+
+class PortfolioSnapshot(object):
+    '''
+    state of a portfolio at the end of a run, enough to continue the run
+    with new dates without replaying the history
+
+    the algo stack does not run on the last date of a backtest (run_on_last_date=False),
+    so the snapshot is taken at the date before, and the last date runs again when extended,
+    other run algos raise RequirementNotMeetException
+
+    Attributes:
+        * params (dict): `runPortfolio` params without data_table
+        * date (Timestamp): last date the algo stack ran
+        * capital (float): cash
+        * positions (dict): security -> quantity
+        * weight (pd.Series): `WeighTarget` weights at `date`, None if not used
+        * algos (list): algos of the strategy, keep their own states
+        * perm (dict): strategy.perm
+        * equity (pd.Series): strategy prices of all runs
+    '''
+    def __init__(self, params, strategy, algos, equity):
+        if len(strategy.prices.index) < 3:
+            raise RequirementNotMeetException('need at least two dates to take a snapshot\n')
+        _check_run_algo(algos)
+        self.params = params
+        self.date = strategy.prices.index[-2]
+        self.capital = strategy.capital
+        self.positions = {
+            x.name: x.position for x in strategy.securities if x.position != 0
+        }
+        self.weight = None
+        for algo in algos:
+            if isinstance(algo, WeighTarget):
+                self.weight = algo.weights.loc[self.date].copy()
+        self.algos = copy.deepcopy(list(algos))
+        self.perm = copy.deepcopy(strategy.perm)
+        self.equity = equity
+
+
+class SeedPositions(Algo):
+    '''
+    restore positions and perm of a snapshot on its last date,
+    then stop the stack so nothing else runs on that date
+    '''
+    def __init__(self, positions, perm, commissions=None):
+        super(SeedPositions, self).__init__()
+        self.positions = positions
+        self.perm = perm
+        self.commissions = commissions
+        self.done = False
+
+    def __call__(self, target):
+        if self.done:
+            return True
+        self.done = True
+        target.perm.update(copy.deepcopy(self.perm))
+        # buying back the positions should not cost anything
+        target.set_commissions(lambda q, p: 0.)
+        for name, q in self.positions.items():
+            target.transact(q, name)
+        target.set_commissions(self.commissions or (lambda q, p: 0.))
+        return False
+
+
+def snapshotPortfolio(res, params):
+    '''
+    args:
+        res (dict): return of `runPortfolio`
+        params (dict): params passed to `runPortfolio`
+    return PortfolioSnapshot
+    '''
+    if not isinstance(res['strategy'], Backtest):
+        raise RequirementNotMeetException(
+            'snapshot needs the bt algo stack, run the portfolio with engine=\'bt\'\n'
+        )
+    strategy = res['strategy'].strategy
+    spec = {k: v for k, v in params.items() if k != 'data_table'}
+    return PortfolioSnapshot(
+        params=copy.deepcopy(spec),
+        strategy=strategy,
+        algos=strategy.stack.algos,
+        equity=strategy.prices.copy()
+    )
+
+
+def _tail_table(data_table, start):
+    '''
+    DataTable view from row `start`, used to recompute signals near the end
+    '''
+    tail = copy.copy(data_table)
+    tail.asset = data_table.asset.iloc[start:]
+    if not data_table.indicator.empty:
+        tail.indicator = data_table.indicator.iloc[start:]
+    tail.date = tail.asset.index
+    return tail
+
+
+def _tail_actions(data_table, weigh_params, after):
+    '''
+    actions after date `after`,
+    each action only recomputes the rolling windows it needs
+    '''
+    date = pd.DatetimeIndex(data_table.date)
+    first_new = date.searchsorted(after, side='right')
+    actionList = []
+    for action in weigh_params['action']:
+        # indicator rows before a date that decide whether the date is signaled
+        signal = getSignal(action['method'])
+        start = 0
+        if signal.lookback is not None:
+            start = max(0, first_new - signal.lookback(signal.validate(action['params'])))
+        actionList.extend(
+            _collect_actions(
+                _tail_table(data_table, start),
+                # signals of a truncated table are not reused, keep them out of `signal_cache`
+                {'action': [copy.deepcopy(action)], 'use_cache': False}
+            )
+        )
+    actionList = [a for a in actionList if pd.Timestamp(a[2]) > after]
+    return sorted(actionList, key=lambda x: x[2])
+
+
+def extendPortfolio(snapshot, data_table):
+    '''
+    continue a portfolio from `snapshot` over the dates of `data_table`
+    after `snapshot.date`, history before it is not run again
+
+    args:
+        snapshot (PortfolioSnapshot): from `snapshotPortfolio` or previous `extendPortfolio`
+        data_table (dict or DataTable): the same data with new rows appended
+    return dict
+        result, strategy: as `runPortfolio`, for the new dates only, 
+            positions are bought back without commission at snapshot.date
+        equity (pd.Series): strategy prices from the first run to the last date
+        snapshot (PortfolioSnapshot): to extend again
+
+    algos comparing with the next date (e.g. run_on_end_of_period)
+    can not know the new dates at the snapshot, their results may differ from a full run
+    '''
+    params = snapshot.params
+    _check_params(params, ['strategy'])
+    data_table = getDataTable(data_table)
+
+    asset = data_table.asset.loc[data_table.asset.index >= snapshot.date]
+    if params.get('end_date'):
+        asset = asset.loc[asset.index <= params['end_date']]
+    if len(asset.index) < 2 or asset.index[0] != snapshot.date:
+        raise RequirementNotMeetException('no new date after %s in data table\n' % snapshot.date)
+    # value of the snapshot at the first row
+    capital = snapshot.capital + sum(
+        q * asset[name].iloc[0] for name, q in snapshot.positions.items()
+    )
+
+    algos = copy.deepcopy(snapshot.algos)
+    for i, stra in enumerate(params['strategy']):
+        if stra['class'] == 'weigh_target' and snapshot.weight is not None:
+            actionList = _tail_actions(data_table, stra['params'], snapshot.date)
+            weight = _weight_by_event(asset, actionList, initial=snapshot.weight)
+            algos[i] = WeighTarget(weights=weight)
+
+    s = Strategy(**{
+        'name': params.get('name', 'incremental'),
+        'algos': [
+            SeedPositions(snapshot.positions, snapshot.perm, params.get('commissions')),
+            AlgoStack(*algos)
+        ],
+        'children': None
+    })
+    trade = Backtest(**{
+        'strategy': s,
+        'data': asset,
+        'initial_capital': capital,
+        'commissions': params.get('commissions'),
+        'progress_bar': False
+    })
+    result = RunBacktest(trade)
+    if params.get('riskfree_rate'):
+        result.set_riskfree_rate(params['riskfree_rate'])
+
+    # tail prices start from 100 at snapshot.date
+    prices = trade.strategy.prices
+    base = snapshot.equity.loc[:snapshot.date]
+    tail = prices.loc[prices.index > snapshot.date] * base.iloc[-1] / 100.
+    equity = pd.concat([base, tail])
+
+    new_snapshot = PortfolioSnapshot(
+        params=copy.deepcopy(params),
+        strategy=trade.strategy,
+        algos=trade.strategy.stack.algos[1].algos,
+        equity=equity
+    )
+    return {
+        'result': result,
+        'strategy': trade,
+        'equity': equity,
+        'snapshot': new_snapshot
+    }
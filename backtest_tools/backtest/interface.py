@@ -1,13 +1,21 @@
+import os
 import json
 import pickle
-# from tools.ChartStat import ChartStat
 from .portfolio import runPortfolio
-from .exceptions import RequirementNotMeetException
+from .store import saveResult, loadResult
+from backtest_tools.source import DataSource, AsyncDataSource
+from backtest_tools.exceptions import RequirementNotMeetException
 
 
 class Portfolio(object):
 
-    def __init__(self, asset, frequency='daily', commissions=None, start_date=None, end_date=None, **kwargs):
+    def __init__(self, asset, frequency='daily', commissions=None, start_date=None, end_date=None, source=None, **kwargs):
+        '''
+        source (DataSource): data source of `train`, see `backtest_tools.source`,
+            a blocking source is wrapped by `AsyncDataSource` to fetch all series concurrently,
+            wrap it in `CachedDataSource` to keep the series on disk between trainings
+        '''
+        self.source = source
         self.params = dict.fromkeys(['data_table', 'strategy'], {})
         self.params['start_date'] = start_date
         self.params['end_date'] = end_date
@@ -91,11 +99,19 @@ class Portfolio(object):
         return self.params
 
 
-    def train(self):
+    def train(self, source=None):
+        '''
+        fetch every asset and indicator series from `source` (default `self.source`)
+        concurrently, then run the portfolio
+        '''
+        source = source or self.source
+        if not isinstance(source, DataSource):
+            raise RequirementNotMeetException('train needs a DataSource, see backtest_tools.source\n')
+        if not isinstance(source, AsyncDataSource):
+            source = AsyncDataSource(source)
+
         assetList, indList = [], []
-        for stat_param in self.indicator:
-            # TODO: implement data source 
-            # tmp = ChartStat.formatter(stat_param, [], outputPandas=True)
+        for stat_param, tmp in zip(self.indicator, source.fetch_all(self.indicator)):
             tmp_params = {
                 'name': tmp['id'], 'freq': tmp['info']['frequency'], 
                 'id': tmp['id'],
@@ -115,13 +131,29 @@ class Portfolio(object):
         return result
 
 
-    def save(res, path):
+    @staticmethod
+    def save(res, path, output='pickle'):
+        '''
+        output (str): 
+            'pickle': the whole result dict, including bt objects (default)
+            'store': directory of arrays, see `store.saveResult`,
+                loaded read-only without bt
+        '''
+        if output not in ['pickle', 'store']:
+            raise RequirementNotMeetException('output should be pickle or store\n')
+        if output == 'store':
+            return saveResult(res, path)
         with open(path, 'wb') as f:
             pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-    
-    def load(path): 
+    @staticmethod
+    def load(path, mmap=True): 
+        '''
+        load a pickle file of `save`, or a result store as read-only `StoredResult`,
+        the format is detected from the path
+        '''
+        if os.path.isdir(path):
+            return {'result': loadResult(path, mmap=mmap), 'strategy': None}
         with open(path, 'rb') as f:
             res = pickle.load(f)
         return res
-
@@ -0,0 +1,121 @@
+import numpy as np
+from backtest_tools.exceptions import RequirementNotMeetException
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# event kernels of the built-in signals,
+# each takes contiguous float64 arrays and returns int64 row positions of the events
+# numba is used when it is installed, otherwise the numpy version
+BACKENDS = ['numpy', 'numba']
+
+
+def _as_array(x):
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+def _threshold_events_numpy(x, threshold, sign, inclusive):
+    prev, now = x[:-1], x[1:]
+    with np.errstate(invalid='ignore'):
+        if sign == 1:
+            if inclusive:
+                hit = (now >= threshold) & (prev < threshold)
+            else:
+                hit = (now > threshold) & (prev <= threshold)
+        else:
+            if inclusive:
+                hit = (now <= threshold) & (prev > threshold)
+            else:
+                hit = (now < threshold) & (prev >= threshold)
+    return np.flatnonzero(hit) + 1
+
+
+def _crossover_events_numpy(fast, slow, sign):
+    with np.errstate(invalid='ignore'):
+        flag = fast > slow if sign == 1 else fast < slow
+    return np.flatnonzero(flag[1:] & ~flag[:-1]) + 1
+
+
+def _threshold_events_loop(x, threshold, sign, inclusive):
+    out = np.empty(x.shape[0], dtype=np.int64)
+    n = 0
+    for i in range(1, x.shape[0]):
+        prev = x[i - 1]
+        now = x[i]
+        if sign == 1:
+            if inclusive:
+                hit = now >= threshold and prev < threshold
+            else:
+                hit = now > threshold and prev <= threshold
+        else:
+            if inclusive:
+                hit = now <= threshold and prev > threshold
+            else:
+                hit = now < threshold and prev >= threshold
+        if hit:
+            out[n] = i
+            n += 1
+    return out[:n]
+
+
+def _crossover_events_loop(fast, slow, sign):
+    out = np.empty(fast.shape[0], dtype=np.int64)
+    n = 0
+    before = False
+    for i in range(fast.shape[0]):
+        if sign == 1:
+            flag = fast[i] > slow[i]
+        else:
+            flag = fast[i] < slow[i]
+        if flag and not before and i > 0:
+            out[n] = i
+            n += 1
+        before = flag
+    return out[:n]
+
+
+_KERNELS = {
+    'numpy': (_threshold_events_numpy, _crossover_events_numpy),
+}
+if numba is not None:
+    _KERNELS['numba'] = (
+        numba.njit(cache=True, nogil=True)(_threshold_events_loop),
+        numba.njit(cache=True, nogil=True)(_crossover_events_loop),
+    )
+
+_backend = 'numba' if numba is not None else 'numpy'
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(name):
+    '''
+    name (str): 'numpy' or 'numba', numba must be installed
+    '''
+    global _backend
+    if name not in BACKENDS:
+        raise RequirementNotMeetException('backend should be one of %s\n' % BACKENDS)
+    if name not in _KERNELS:
+        raise RequirementNotMeetException('numba is required for backend numba\n')
+    _backend = name
+
+
+def threshold_events(x, threshold, sign, inclusive=True):
+    '''
+    rows where `x` crosses `threshold`, and it does not at the previous row
+    sign (int): 1 crossing upward, -1 crossing downward
+    inclusive (bool): reaching the threshold counts as crossing
+    '''
+    return _KERNELS[_backend][0](_as_array(x), float(threshold), int(sign), bool(inclusive))
+
+
+def crossover_events(fast, slow, sign):
+    '''
+    rows where `fast` turns above (sign 1) or below (sign -1) `slow`
+    '''
+    return _KERNELS[_backend][1](_as_array(fast), _as_array(slow), int(sign))
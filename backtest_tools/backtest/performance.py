@@ -1,8 +1,126 @@
-import operator
+import io
 import numpy as np
 import pandas as pd
 import scipy.stats as ss
+from collections import OrderedDict
 from itertools import product
+from backtest_tools.exceptions import RequirementNotMeetException
+from backtest_tools.profiling import traced
+
+
+def _round_trips(positions, prices):
+    '''
+    positions, prices (pd.DataFrame): one column for each security
+    return pd.DataFrame of closed trades, see `PerformanceMixin.returns`
+    '''
+    # calculate each trade and adjust first row
+    trades = positions.diff()
+    trades.iloc[0] = positions.iloc[0]
+
+    # long format of all non-zero trades, ordered by security then date
+    row = np.arange(len(trades.index))
+    trade_values = trades.values
+    col_idx, row_idx = np.nonzero((trade_values != 0).T & ~np.isnan(trade_values).T)
+    data = pd.DataFrame({
+        'security': trades.columns.values[col_idx],
+        'date': trades.index.values[row_idx],
+        'row': row[row_idx],
+        'trade': trade_values[row_idx, col_idx],
+        'price': prices.reindex(
+            index=trades.index, columns=trades.columns
+        ).values[row_idx, col_idx],
+    })
+
+    # label trade groups by the number of flat positions before each trade
+    by_security = data.groupby('security', sort=False)
+    flat = by_security['trade'].cumsum() == 0
+    data['group'] = flat.astype(int).groupby(data['security'], sort=False)\
+                        .cumsum() - flat.astype(int)
+    # drop the trades after the last flat position
+    closed = flat.groupby([data['security'], data['group']], sort=False)\
+                 .transform('any')
+    data = data.loc[closed]
+    flat = flat.loc[closed]
+
+    # pnl = value of the closing trade - value of all other trades
+    value = data['trade'].abs() * data['price']
+    grouped = data.assign(
+        other=value.where(~flat, 0),
+        close=value.where(flat, 0),
+    ).groupby(['security', 'group'], sort=False)
+    tradeList = pd.DataFrame({
+        'entry_date': grouped['date'].first(),
+        'exit_date': grouped['date'].last(),
+        'holding_period': grouped['row'].last() - grouped['row'].first(),
+        'pnl': grouped['close'].sum() - grouped['other'].sum(),
+    }).reset_index(level='security').reset_index(drop=True)
+
+    return tradeList
+
+
+_REPORT_FIELDS = [
+    'profit_dropdown', 'kelly', 'sharp_ratio', 'return_of_investment',
+    'annualized_returns', 'yearly_volatility', 'value_at_risk', 'equity',
+    'dropdown', 'weights', 'trade_returns', 'win_rate', 'trading_times',
+    'profit_factor', 'payoff_ratio', 'message', 'max_dropdown',
+]
+_SERIES_FIELDS = ['equity', 'dropdown', 'weights', 'trade_returns']
+# fields that need the round-trip trades, a strategy without any reports 0
+_TRADE_FIELDS = ['kelly', 'trade_returns', 'win_rate', 'profit_factor', 'payoff_ratio']
+# stats reported as '-' when missing
+_DASH_FIELDS = ['return_of_investment', 'annualized_returns', 'yearly_volatility', 'max_dropdown']
+_SERIES_FORMATS = ['list', 'columnar', 'npz', 'arrow']
+
+
+def _to_columnar(data):
+    '''
+    data (pd.Series or pd.DataFrame): indexed by date
+    return dict
+        date (np.array of int64): epoch milliseconds
+        columns (list): column names
+        values (np.array of float64): shape (len(date), len(columns))
+    '''
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    return {
+        'date': pd.DatetimeIndex(data.index).values\
+                  .astype('datetime64[ms]').astype(np.int64),
+        'columns': [str(col) for col in data.columns],
+        'values': np.ascontiguousarray(data.values, dtype=np.float64),
+    }
+
+
+def _to_npz(data):
+    '''
+    return bytes of `np.savez`, load with np.load(io.BytesIO(buf))
+    '''
+    col = _to_columnar(data)
+    buf = io.BytesIO()
+    np.savez(
+        buf, date=col['date'], values=col['values'],
+        columns=np.array(col['columns'], dtype=str)
+    )
+    return buf.getvalue()
+
+
+def _to_arrow(data):
+    '''
+    return bytes of Arrow IPC stream, 
+    one int64 `date` column and one float64 column for each series
+    '''
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RequirementNotMeetException('pyarrow is required for arrow output\n')
+    col = _to_columnar(data)
+    arrays = [pa.array(col['date'])] + [
+        pa.array(col['values'][:, i]) for i in range(len(col['columns']))
+    ]
+    table = pa.Table.from_arrays(arrays, names=['date'] + col['columns'])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
 
 
 class PerformanceMixin(object):
@@ -20,126 +138,147 @@ class PerformanceMixin(object):
     reference: https://www.amibroker.com/guide/h_report.html
     '''
 
-    def trading_times(self):
-        return len(self.get_transactions()['quantity'])
+    def _strategy_name(self, strategy_name=None):
+        if strategy_name is None:
+            return self.backtest_list[0].name
+        return strategy_name
+
+    def _memo(self, strategy_name, key, func):
+        '''
+        compute `func()` once for each (strategy_name, key)
+        backtest results do not change after run, so nothing is invalidated
+        '''
+        cache = self.__dict__.setdefault('_metric_cache', {})
+        if (strategy_name, key) not in cache:
+            cache[(strategy_name, key)] = func()
+        return cache[(strategy_name, key)]
+
+    def _trade_list(self, strategy_name=None):
+        strategy_name = self._strategy_name(strategy_name)
+        return self._memo(
+            strategy_name, 'trade_list',
+            lambda: self._extract_trades(strategy_name)
+        )
+
+    def _trade_returns(self, strategy_name=None):
+        return self._trade_list(strategy_name)['pnl'].values
+
+    def _daily_returns(self, strategy_name=None):
+        strategy_name = self._strategy_name(strategy_name)
+        s = self.backtests[strategy_name].strategy
+        return self._memo(
+            strategy_name, 'daily_returns',
+            lambda: s.prices.to_returns().dropna()
+        )
+
+    def _drawdown(self, strategy_name=None):
+        strategy_name = self._strategy_name(strategy_name)
+        s = self.backtests[strategy_name].strategy
+
+        def _to_drawdown(prices):
+            # modify from ffn/core.py def to_drawdown_series
+            p = prices.copy(deep=True)
+            p = p.fillna(method='ffill')
+            p[np.isnan(p)] = -np.Inf
+            return p - np.maximum.accumulate(p)
+
+        return self._memo(
+            strategy_name, 'drawdown',
+            lambda: _to_drawdown(s.prices)
+        )
+
+    @traced('metric.trading_times', 'metric')
+    def trading_times(self, strategy_name=None):
+        strategy_name = self._strategy_name(strategy_name)
+        return self._memo(
+            strategy_name, 'trading_times',
+            lambda: len(self.get_transactions(strategy_name)['quantity'])
+        )
 
+    @traced('metric.returns', 'metric')
     def returns(self, strategy_name=None):
-        # extract strategy given strategy_name
-        if strategy_name is None:
-            strategy_name = self.backtest_list[0].name
+        '''
+        extract each round-trip trade of every security in one pass
+        a trade starts after the position is flat and ends when it is flat again,
+        trades still open at the end are not counted
+
+        set self.returnsList (np.array): pnl of each trade
+        set self.tradeList (pd.DataFrame): one row for each trade
+            security, entry_date, exit_date, 
+            holding_period (number of periods from entry to exit), pnl
+        '''
+        tradeList = self._trade_list(strategy_name)
+        self.tradeList = tradeList
+        self.returnsList = tradeList['pnl'].values
+        return tradeList
+
+    def _extract_trades(self, strategy_name):
         s = self.backtests[strategy_name].strategy
 
         positions = pd.DataFrame({x.name: x.positions for x in s.securities})
         prices = pd.DataFrame({x.name: x.prices for x in s.securities})
+        return _round_trips(positions, prices)
 
-        # calculate each trade and adjust first row
-        trades = positions.diff()
-        trades.iloc[0] = positions.iloc[0]
-
-
-        def _between_date(start, end, all_dates):
-            '''modified pandas.DatetimeIndex.indexer_between_time'''
-            lop = operator.lt
-            if start is None:
-                lop = operator.le
-                start = all_dates[0]
-            mask = operator.and_(
-                lop(start, all_dates),
-                operator.le(all_dates, end)
-            )
-            return mask.nonzero()[0]
-        
-        
-        # calculate returns
-        returnsList = []
-        last_date = None
-        for col in trades.columns:
-            trading = trades[col]
-            trading = trading[trading != 0].dropna()
-            # get trading dates and the price
-            trading_dates = np.append(trading.index.tolist(), prices.index[-1])
-
-            data = pd.concat([trading, prices[col]], axis=1).loc[trading_dates]
-            data.columns = ['trade', 'price']
-            # find out when the portfolio takes profit (找到獲利了結的時間點)
-            for time in data.loc[data['trade'].cumsum() == 0].index:
-                tmp = data.iloc[ _between_date(last_date, time, trading.index) ]
-                tmp['value'] = tmp['trade'].abs() * tmp['price']
-                value = tmp['value'].iloc[-1] - tmp['value'].iloc[:-1].sum()
-                returnsList.append(value)
-
-                last_date = time
-            last_date = None
-        self.returnsList = np.array(returnsList)
-
-    def win_rate(self):
+    @traced('metric.win_rate', 'metric')
+    def win_rate(self, strategy_name=None):
         '''
         def: %Wins = Number of wins divided by total number of trades 
         '''
-        returns = self.returnsList
+        returns = self._trade_returns(strategy_name)
         win_rate = sum(returns > 0) / len(returns)
         return win_rate
 
-    def profit_factor(self):
+    @traced('metric.profit_factor', 'metric')
+    def profit_factor(self, strategy_name=None):
         '''
         def: Profit of winners divided by loss of losers
         '''
-        returns = self.returnsList
+        returns = self._trade_returns(strategy_name)
         return returns[returns > 0].sum() / np.abs(returns[returns < 0].sum())
 
-    def payoff_ratio(self):
+    @traced('metric.payoff_ratio', 'metric')
+    def payoff_ratio(self, strategy_name=None):
         '''
         def: avg win / avg loss
         '''
-        returns = self.returnsList
+        returns = self._trade_returns(strategy_name)
         return returns[returns > 0].mean() / np.abs(returns[returns < 0].mean())
 
+    @traced('metric.profit_dropdown', 'metric')
     def profit_dropdown(self, strategy_name=None):
         '''
         def: net profit / max dropdown value
         '''
-        # extract strategy given strategy_name
-        if strategy_name is None:
-            strategy_name = self.backtest_list[0].name
-        strat_info = self.backtests[strategy_name]
-
-        def _drawdown(prices):
-            # modify from ffn/core.py def to_drawdown_series
-            p = prices.copy(deep=True)
-            p = p.fillna(method='ffill')
-            p[np.isnan(p)] = -np.Inf
-            return p - np.maximum.accumulate(p)
+        strategy_name = self._strategy_name(strategy_name)
+        prices = self.backtests[strategy_name].strategy.prices
 
-        dropdown = abs(min( _drawdown(strat_info.strategy.prices) ))
-        net_profit = strat_info.strategy.prices.iloc[-1] - 100 # 期末權益-期初權益
+        dropdown = abs(min( self._drawdown(strategy_name) ))
+        net_profit = prices.iloc[-1] - 100 # 期末權益-期初權益
         return net_profit / dropdown
 
+    @traced('metric.value_at_risk', 'metric')
     def value_at_risk(self, alpha=0.05, strategy_name=None):
         '''
         def: estimate normal distribution for daily returns
             and return the lower bound of confidence interval in alpha
         '''
-        # extract strategy given strategy_name
-        if strategy_name is None:
-            strategy_name = self.backtest_list[0].name
-        s = self.backtests[strategy_name].strategy
-
-        daily_returns = s.prices.to_returns().dropna()
+        daily_returns = self._daily_returns(strategy_name)
         var = ss.norm.ppf(alpha, daily_returns.mean(), daily_returns.std())
         return var
 
-    def kelly(self):
+    @traced('metric.kelly', 'metric')
+    def kelly(self, strategy_name=None):
         '''
         def: win_rate - (1-win_rate)/payoff_ratio
         '''
-        p = self.win_rate()
+        p = self.win_rate(strategy_name)
         q = 1 - p
-        b = self.payoff_ratio()
+        b = self.payoff_ratio(strategy_name)
         return p - (q/b)
 
+    @traced('metric.sharp_ratio', 'metric')
     def sharp_ratio(self, strategy_name=None):
-        if strategy_name is None:
-            strategy_name = self.backtest_list[0].name
+        strategy_name = self._strategy_name(strategy_name)
         stats = self.backtests[strategy_name].stats.stats
         if not pd.isnull(stats.loc['daily_sharpe']):
             return stats.loc['daily_sharpe']
@@ -148,26 +287,128 @@ class PerformanceMixin(object):
         elif not pd.isnull(stats.loc['yearly_sharpe']):
             return stats.loc['yearly_sharpe']
 
-    def getReport(self, strategy_name=None):
-        try:
-            self.returns()
-        except IndexError as e:
-            if str(e) == 'single positional indexer is out-of-bounds':
-                e = "warnings: no any indicators meet the conditions"
-            result = dict.fromkeys(['profit_dropdown','kelly','sharp_ratio','ROI','annual_ROI','annual_VOL','value_at_risk','equity','dropdown','weights','trade_returns','win_rate','trading_times','profit_factor','payoff_ratio'], 0)
-            result['message'] = str(e)
-            return result
+    @traced('metric.batch_report', 'metric')
+    def _batch_report(self, fields=None, alpha=0.05):
+        '''
+        scalar metrics of every backtest, computed on panels 
+        with one column for each strategy (or strategy, security)
+        return pd.DataFrame, one row for each strategy
+        '''
+        names = [bkt.name for bkt in self.backtest_list]
+        if fields is None:
+            fields = [f for f in _REPORT_FIELDS if f not in _SERIES_FIELDS]
+        for field in fields:
+            if field in _SERIES_FIELDS or field not in _REPORT_FIELDS:
+                raise RequirementNotMeetException('no such field %s in batch report\n' % field)
 
-        if strategy_name is None:
-            strategy_name = self.backtest_list[0].name
+        # equity panel
+        prices = pd.DataFrame({
+            name: self.backtests[name].strategy.prices for name in names
+        })[names]
+        daily_returns = prices / prices.shift(1) - 1
+        filled = prices.fillna(method='ffill')
+        dropdown = (filled - filled.cummax()).min().abs()
+        stats = pd.DataFrame({
+            name: self.backtests[name].stats.stats for name in names
+        })[names]
+
+        # positions panel, columns are (strategy, security)
+        positions, security_prices = {}, {}
+        for name in names:
+            s = self.backtests[name].strategy
+            if len(s.securities) > 0:
+                positions[name] = pd.DataFrame({x.name: x.positions for x in s.securities})
+                security_prices[name] = pd.DataFrame({x.name: x.prices for x in s.securities})
+
+        traded = list(positions.keys())
+        trading_times = pd.Series(0, index=names)
+        pnl = pd.DataFrame(columns=['strategy', 'pnl'])
+        if positions:
+            positions = pd.concat(positions, axis=1)
+            positions = positions.fillna(method='ffill').fillna(0)
+            security_prices = pd.concat(security_prices, axis=1)\
+                                .reindex(positions.index).fillna(method='ffill')
+            trades = positions.diff()
+            trades.iloc[0] = positions.iloc[0]
+            trading_times = ((trades != 0) & trades.notnull()).sum()\
+                                .groupby(level=0).sum()\
+                                .reindex(names).fillna(0).astype(int)
+
+            trade_list = _round_trips(positions, security_prices)
+            pnl = pd.DataFrame({
+                'strategy': [x[0] for x in trade_list['security']],
+                'pnl': trade_list['pnl'].values
+            })
+
+        by_strategy = pnl.groupby('strategy')['pnl']
+        wins = pnl['pnl'].where(pnl['pnl'] > 0).groupby(pnl['strategy'])
+        losses = pnl['pnl'].where(pnl['pnl'] < 0).groupby(pnl['strategy'])
+        win_rate = (pnl['pnl'] > 0).groupby(pnl['strategy']).sum()\
+                        .div(by_strategy.size()).reindex(names)
+        payoff_ratio = (wins.mean() / losses.mean().abs()).reindex(names)
+
+        sharp_ratio = stats.loc['daily_sharpe']\
+                        .where(stats.loc['daily_sharpe'].notnull(), stats.loc['monthly_sharpe'])
+        sharp_ratio = sharp_ratio.where(sharp_ratio.notnull(), stats.loc['yearly_sharpe'])
+
+        report = pd.DataFrame({
+            'profit_dropdown': (filled.iloc[-1] - 100) / dropdown,  # 期末權益-期初權益
+            'kelly': win_rate - (1 - win_rate) / payoff_ratio,
+            'sharp_ratio': sharp_ratio,
+            'return_of_investment': stats.loc['total_return'],
+            'annualized_returns': stats.loc['cagr'],
+            'yearly_volatility': stats.loc['yearly_vol'],
+            'value_at_risk': pd.Series(ss.norm.ppf(
+                alpha, daily_returns.mean().values, daily_returns.std().values
+            ), index=names),
+            'win_rate': win_rate,
+            'trading_times': trading_times,
+            'profit_factor': (wins.sum() / losses.sum().abs()).reindex(names),
+            'payoff_ratio': payoff_ratio,
+            'message': 'succeed',
+            'max_dropdown': pd.Series({
+                name: self.backtests[name].stats.max_drawdown for name in names
+            }),
+        }, index=names)
+
+        # same sentinels as `getReport`: '-' for a missing stat, None for a missing sharpe
+        for field in _DASH_FIELDS:
+            report[field] = report[field].astype(object).where(report[field].notnull(), '-')
+        report['sharp_ratio'] = report['sharp_ratio'].astype(object)\
+                                    .where(report['sharp_ratio'].notnull(), None)
+
+        # same as `getReport`, strategy without any trade reports 0 when trades are asked for
+        if set(fields) & set(_TRADE_FIELDS):
+            no_trade = [name for name in names if name not in traded]
+            report.loc[no_trade] = 0
+            report.loc[no_trade, 'message'] = "warnings: no any indicators meet the conditions"
+        report.index.name = 'strategy'
+        return report[fields + (['message'] if 'message' not in fields else [])]
+
+    @traced('metric.getReport', 'metric')
+    def getReport(self, strategy_name=None, fields=None, batch=False, series_format='list'):
+        '''
+        Args:
+            strategy_name (str): default the first backtest
+            fields (list): only compute these fields of the report,
+                e.g. ['kelly', 'win_rate'] skips equity, dropdown and weights
+                default all fields
+            batch (bool): report every backtest as pd.DataFrame, 
+                one row for each strategy, series fields are not included
+            series_format (str): output of equity, dropdown and weights
+                'list': [[yyyy-mm-dd, value, ...], ...] (default)
+                'columnar': dict of int64 epoch ms `date`, `columns` 
+                    and float64 `values` arrays, trade_returns as np.array
+                'npz': bytes of np.savez with the same arrays
+                'arrow': bytes of Arrow IPC stream, requires pyarrow
+        '''
+        if series_format not in _SERIES_FORMATS:
+            raise RequirementNotMeetException('series_format should be one of %s\n' % _SERIES_FORMATS)
+        if batch:
+            return self._batch_report(fields)
+
+        strategy_name = self._strategy_name(strategy_name)
         strat_info = self.backtests[strategy_name]
-        
-        equity = strat_info.strategy.prices
-        equity.index = equity.index.strftime('%Y-%m-%d')
-        dropdown = strat_info.stats.drawdown
-        dropdown.index = dropdown.index.strftime('%Y-%m-%d')
-        weights = strat_info.security_weights
-        weights.index = weights.index.strftime('%Y-%m-%d')
 
         def _NullToDash(x):
             if pd.isnull(x):
@@ -175,22 +416,61 @@ class PerformanceMixin(object):
             else:
                 return x
 
-        return {
-            'profit_dropdown': self.profit_dropdown(),
-            'kelly': self.kelly(),
-            'sharp_ratio': self.sharp_ratio(),
-            'return_of_investment': _NullToDash(strat_info.stats.stats.loc['total_return']),
-            'annualized_returns': _NullToDash(strat_info.stats.stats.loc['cagr']),
-            'yearly_volatility': _NullToDash(strat_info.stats.stats.loc['yearly_vol']),
-            'value_at_risk': self.value_at_risk(),
-            'equity': equity.reset_index().values.tolist(),
-            'dropdown': dropdown.reset_index().values.tolist(),
-            'weights': weights.reset_index().values.tolist(),
-            'trade_returns': self.returnsList.tolist(),
-            'win_rate': self.win_rate(),
-            'trading_times': self.trading_times(),
-            'profit_factor': self.profit_factor(),
-            'payoff_ratio': self.payoff_ratio(),
-            'message': 'succeed',
-            'max_dropdown': _NullToDash(strat_info.stats.max_drawdown)
-        }
\ No newline at end of file
+        def _to_list(data):
+            data = data.copy()
+            data.index = data.index.strftime('%Y-%m-%d')
+            return data.reset_index().values.tolist()
+
+        convert = {
+            'list': _to_list, 'columnar': _to_columnar,
+            'npz': _to_npz, 'arrow': _to_arrow,
+        }[series_format]
+
+        def _trade_returns():
+            returns = self._trade_returns(strategy_name)
+            if series_format == 'list':
+                return returns.tolist()
+            return np.asarray(returns, dtype=np.float64)
+
+        stats = lambda: strat_info.stats.stats
+        report = OrderedDict([
+            ('profit_dropdown', lambda: self.profit_dropdown(strategy_name)),
+            ('kelly', lambda: self.kelly(strategy_name)),
+            ('sharp_ratio', lambda: self.sharp_ratio(strategy_name)),
+            ('return_of_investment', lambda: _NullToDash(stats().loc['total_return'])),
+            ('annualized_returns', lambda: _NullToDash(stats().loc['cagr'])),
+            ('yearly_volatility', lambda: _NullToDash(stats().loc['yearly_vol'])),
+            ('value_at_risk', lambda: self.value_at_risk(strategy_name=strategy_name)),
+            ('equity', lambda: convert(strat_info.strategy.prices)),
+            ('dropdown', lambda: convert(strat_info.stats.drawdown)),
+            ('weights', lambda: convert(strat_info.security_weights)),
+            ('trade_returns', _trade_returns),
+            ('win_rate', lambda: self.win_rate(strategy_name)),
+            ('trading_times', lambda: self.trading_times(strategy_name)),
+            ('profit_factor', lambda: self.profit_factor(strategy_name)),
+            ('payoff_ratio', lambda: self.payoff_ratio(strategy_name)),
+            ('message', lambda: 'succeed'),
+            ('max_dropdown', lambda: _NullToDash(strat_info.stats.max_drawdown)),
+        ])
+
+        all_fields = fields is None
+        if all_fields:
+            fields = list(report.keys())
+        for field in fields:
+            if field not in report:
+                raise RequirementNotMeetException('no such field %s in report\n' % field)
+
+        if all_fields or set(fields) & set(_TRADE_FIELDS):
+            try:
+                self.returns(strategy_name)
+            except IndexError as e:
+                if str(e) == 'single positional indexer is out-of-bounds':
+                    e = "warnings: no any indicators meet the conditions"
+                if all_fields:
+                    result = dict.fromkeys(['profit_dropdown','kelly','sharp_ratio','ROI','annual_ROI','annual_VOL','value_at_risk','equity','dropdown','weights','trade_returns','win_rate','trading_times','profit_factor','payoff_ratio'], 0)
+                else:
+                    result = dict.fromkeys(fields, 0)
+                result['message'] = str(e)
+                return result
+
+        return {field: report[field]() for field in fields}
@@ -4,6 +4,9 @@ from .composite import composite
 from .performance import PerformanceMixin
 from backtest_tools.helper import _check_params
 from backtest_tools.data import getDataTable
+from backtest_tools import profiling
+from backtest_tools.exceptions import EngineNotSupportedException
+from . import vectorized
 
 
 class BacktestResult(Result, PerformanceMixin):
@@ -15,15 +18,46 @@ def RunBacktest(*backtests):
     adjusted bt.run
     '''
     for bkt in backtests:
-        bkt.run()
+        if profiling.enabled():
+            with profiling.current().span('bt.run', 'backtest'):
+                bkt.run()
+        else:
+            bkt.run()
     return BacktestResult(*backtests)
 
 
 def runPortfolio(params):
+    '''
+    params (dict): data_table, strategy, 
+        start_date, end_date, commissions, riskfree_rate (optional)
+        profile (optional, bool or dict): record a `profiling.Trace` of every stage
+            in return['trace'], {'allocations': True} also records allocations
+        engine (optional, str): 'bt' (default) or 'vectorized',
+            'vectorized' runs `weigh_target` strategies with `vectorized.runVectorized`
+            and falls back to bt for anything else,
+            return['strategy'] then holds arrays only, not the bt algo stack
+    '''
+    if not params.get('profile'):
+        return _runPortfolio(params)
+
+    options = params['profile'] if isinstance(params['profile'], dict) else {}
+    with profiling.tracing(**options) as trace:
+        with trace.span('runPortfolio', 'pipeline'):
+            res = _runPortfolio(params)
+    res['trace'] = trace
+    return res
+
+
+def _runPortfolio(params):
     _check_params(
         params=params,
         list_to_check=['data_table', 'strategy']
     )
+    if params.get('engine', 'bt') == 'vectorized' and vectorized.supports(params['strategy']):
+        try:
+            return vectorized.runVectorized(params)
+        except EngineNotSupportedException:
+            pass
 
     data_table, comp = composite({
         'data_table': params['data_table'],
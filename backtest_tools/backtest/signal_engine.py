@@ -0,0 +1,477 @@
+import os
+import hashlib
+import weakref
+import functools
+import numpy as np
+import pandas as pd
+from backtest_tools.data import DataTableCache
+from backtest_tools.helper import _valid_id
+from backtest_tools.exceptions import RequirementNotMeetException
+from backtest_tools.profiling import traced
+from .kernels import threshold_events, crossover_events
+
+
+# requirement of a method: list of (source, stat, window)
+#     source: 'raw' indicator, 'shift' indicator.shift(1), 'diff' indicator.shift(1).diff()
+#     stat: 'min', 'max', 'mean' rolling window, 'pct' pct_change(window), 'value' no window
+
+
+class Param(object):
+    '''
+    schema of a signal parameter
+
+    Args:
+        * type: conversion of the value, e.g. int, float,
+            list is checked but not converted
+        * choices (list): allowed values after conversion
+        * default: value when it is not given, the parameter is required without default
+        * message (str): error when the value is not in choices
+    '''
+    _required = object()
+
+    def __init__(self, type, choices=None, default=_required, message=None):
+        self.type = type
+        self.choices = choices
+        self.default = default
+        self.message = message
+
+    def convert(self, name, value):
+        if self.type is list:
+            if not isinstance(value, list):
+                raise RequirementNotMeetException('%s should be a list\n' % name)
+        else:
+            try:
+                value = self.type(value)
+            except (TypeError, ValueError):
+                raise RequirementNotMeetException(
+                    '%s should be %s\n' % (name, getattr(self.type, '__name__', self.type))
+                )
+        if self.choices is not None and value not in self.choices:
+            raise RequirementNotMeetException(
+                self.message or '%s should be one of %s\n' % (name, self.choices)
+            )
+        return value
+
+
+SIGN = Param(int, choices=[1, -1], message='sign should be either 1 or -1\n')
+
+
+class Signal(object):
+    '''
+    a signal method of `weigh_target` actions, see `registerSignal`
+
+    Attributes:
+        * name (str): method name of actions
+        * func: fn(data_table, indicatorID, params) -> array of dates, params already validated
+        * schema (dict): parameter name -> Param
+        * needs: fn(params) -> list of (source, stat, window) for `SignalEngine`,
+            None if the signal is not vectorizable
+        * evaluate: fn(params, blocks) -> int row positions of the events, from the needed blocks
+        * lookback: fn(params) -> indicator rows before a date deciding its signal,
+            None if the whole history is needed
+    '''
+    def __init__(self, name, func, schema, needs=None, evaluate=None, lookback=None):
+        self.name = name
+        self.func = func
+        self.schema = {
+            key: value if isinstance(value, Param) else Param(value)
+            for key, value in schema.items()
+        }
+        self.needs = needs
+        self.evaluate = evaluate
+        self.lookback = lookback
+
+    @property
+    def vectorizable(self):
+        return self.needs is not None and self.evaluate is not None
+
+    def validate(self, params):
+        '''
+        one pass over the schema, return a converted copy of params
+        '''
+        if not isinstance(params, dict):
+            raise RequirementNotMeetException('params should be a dictionary\n')
+        checked = dict(params)
+        for key, param in self.schema.items():
+            value = params.get(key)
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                if param.default is Param._required:
+                    if key in params:
+                        raise RequirementNotMeetException('%s does not set value\n' % key)
+                    raise RequirementNotMeetException('%s not in params\n' % key)
+                checked[key] = param.default
+                continue
+            checked[key] = param.convert(key, value)
+        return checked
+
+    def indicator(self, data_table, indicatorID):
+        indicatorID = _valid_id(indicatorID)
+        if indicatorID not in (data_table.use_id.get('indicator') or []):
+            raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % indicatorID)
+        return indicatorID
+
+    def __call__(self, data_table, indicatorID, params):
+        return self.func(
+            data_table=data_table,
+            indicatorID=self.indicator(data_table, indicatorID),
+            params=self.validate(params)
+        )
+
+
+# method name -> Signal
+SIGNALS = {}
+
+
+def registerSignal(name, params, needs=None, evaluate=None, lookback=None):
+    '''
+    decorator making a function a signal method of `weigh_target` actions
+
+    @registerSignal('above_mean', params={'n': int, 'sign': SIGN}, lookback=lambda p: p['n'] + 1)
+    def above_mean(data_table, indicatorID, params):
+        ...
+        return dates
+
+    params (dict): name -> type or Param, validated once before the function is called
+    needs, evaluate (optional): make the signal vectorizable, evaluated by `SignalEngine`
+        together with the other actions
+    lookback (optional): see `Signal`, used by `extendPortfolio`
+
+    the decorated function keeps its signature and validates params itself,
+    `getSignal(name)` returns the Signal
+    '''
+    def decorator(func):
+        signal = Signal(name, func, params, needs, evaluate, lookback)
+
+        @functools.wraps(func)
+        def checked(data_table, indicatorID, params):
+            return signal(data_table, indicatorID, params)
+        checked.signal = signal
+        SIGNALS[name] = signal
+        return checked
+    return decorator
+
+
+def getSignal(name):
+    signal = SIGNALS.get(name)
+    if signal is None:
+        raise RequirementNotMeetException('no such method %s\n' % name)
+    return signal
+
+
+def _freeze(value):
+    '''
+    hashable form of a validated param value, with a stable repr across processes
+    '''
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _hash_values(values):
+    '''
+    sha1 digest of an array, from its bytes when they are the values
+    '''
+    values = np.asarray(values)
+    if values.dtype.kind in 'biufcmM':
+        return hashlib.sha1(np.ascontiguousarray(values).view(np.uint8)).digest()
+    return hashlib.sha1(pd.util.hash_array(values).tobytes()).digest()
+
+
+class SignalCache(DataTableCache):
+    '''
+    LRU cache of the dates of signals, keyed by (method, hash of the indicator column, validated params),
+    so the same signal is computed once across `runPortfolio` calls and tables sharing the column
+
+    Args:
+        * maxsize (int): maximum number of date arrays kept in memory
+        * max_bytes (int): maximum memory of all cached date arrays
+        * root (str): optional directory of a disk tier, kept across processes,
+            one .npy file for each signal, memory misses are looked up there
+        * disk_bytes (int): maximum size of the disk tier, least recently used files are removed
+
+    signal_cache.root = 'cache/signals'   # enable the disk tier
+    signal_cache.info()
+
+    cached arrays are read-only, the key does not cover the code of a method,
+    clear the cache after changing a registered signal
+    '''
+    def __init__(self, maxsize=4096, max_bytes=2 ** 28, root=None, disk_bytes=2 ** 30):
+        super(SignalCache, self).__init__(maxsize=maxsize, max_bytes=max_bytes)
+        self.root = root
+        self.disk_bytes = disk_bytes
+        self.disk_hits = 0
+        self._disk_nbytes = None
+        # id of a date index -> (weakref of the index, digest), an index never changes
+        self._index_digests = {}
+
+    def _index_digest(self, index):
+        entry = self._index_digests.get(id(index))
+        if entry is None or entry[0]() is not index:
+            digests = self._index_digests
+            ref = weakref.ref(index, lambda _, k=id(index): digests.pop(k, None))
+            entry = (ref, _hash_values(index.values))
+            digests[id(index)] = entry
+        return entry[1]
+
+    def digest(self, data_table, indicatorID):
+        '''
+        hash of an indicator column and the dates,
+        the column is read on each call, so a table changed in place gets a new digest
+        '''
+        column = data_table.indicator[indicatorID]
+        h = hashlib.sha1(self._index_digest(data_table.indicator.index))
+        h.update(_hash_values(column.values))
+        h.update(str(column.dtype).encode())
+        return h.hexdigest()
+
+    def key(self, data_table, signal, indicatorID, params, digests=None):
+        '''
+        return hashable key of a signal on `data_table`,
+        indicatorID and params already validated, see `SignalEngine.prepare`
+        digests (dict): optional indicatorID -> `digest`, shared by the keys of one pass
+            over a table that does not change meanwhile
+        '''
+        if digests is None:
+            digest = self.digest(data_table, indicatorID)
+        else:
+            digest = digests.get(indicatorID)
+            if digest is None:
+                digest = digests[indicatorID] = self.digest(data_table, indicatorID)
+        return (signal.name, digest, _freeze(params))
+
+    @staticmethod
+    def _sizeof(dates):
+        return int(dates.nbytes)
+
+    def _path(self, key):
+        return os.path.join(self.root, hashlib.sha1(repr(key).encode()).hexdigest() + '.npy')
+
+    def get(self, key):
+        if key in self._tables:
+            self.hits += 1
+            self._tables.move_to_end(key)
+            return self._tables[key]
+        dates = self._load(key) if self.root else None
+        if dates is not None:
+            self.disk_hits += 1
+            super(SignalCache, self).put(key, dates)
+            return dates
+        self.misses += 1
+        return None
+
+    def put(self, key, dates):
+        '''
+        dates (array-like): dates of the signal, stored as a read-only datetime64[ns] array
+        return the stored array
+        '''
+        dates = np.array(dates, dtype='datetime64[ns]')
+        dates.flags.writeable = False
+        super(SignalCache, self).put(key, dates)
+        if self.root:
+            self._save(key, dates)
+        return dates
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            dates = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        dates.flags.writeable = False
+        return dates
+
+    def _save(self, key, dates):
+        '''
+        write to a temporary file and rename, readers never see half an array
+        '''
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, dates, allow_pickle=False)
+        os.replace(tmp, path)
+        if self._disk_nbytes is None or self._disk_nbytes[0] != self.root:
+            self._disk_nbytes = (self.root, sum(size for _, _, size in self._files()))
+        else:
+            self._disk_nbytes = (self.root, self._disk_nbytes[1] + os.path.getsize(path))
+        if self._disk_nbytes[1] > self.disk_bytes:
+            self._evict_disk()
+
+    def _files(self):
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.npy'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        return files
+
+    def _evict_disk(self):
+        files = sorted(self._files())
+        nbytes = sum(size for _, _, size in files)
+        for _, path, size in files:
+            if nbytes <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            nbytes -= size
+        self._disk_nbytes = (self.root, nbytes)
+
+    def clear(self, disk=False):
+        '''
+        disk (bool): also remove the files of the disk tier
+        '''
+        super(SignalCache, self).clear()
+        self.disk_hits = 0
+        if disk and self.root and os.path.isdir(self.root):
+            for _, path, _ in self._files():
+                os.remove(path)
+            self._disk_nbytes = (self.root, 0)
+
+    def info(self):
+        info = super(SignalCache, self).info()
+        info.update({
+            'disk_hits': self.disk_hits,
+            'root': self.root,
+            'disk_nbytes': self._disk_nbytes[1] if self._disk_nbytes else None,
+            'disk_bytes': self.disk_bytes,
+        })
+        return info
+
+
+signal_cache = SignalCache()
+
+
+# params of the requirements and evaluations are validated by the signal schema
+
+
+def _need_threshold(params):
+    return [('shift', 'min' if params['sign'] == 1 else 'max', params['n'])]
+
+
+def _need_growth(params):
+    return [('diff', 'min' if params['sign'] == 1 else 'max', params['n'])]
+
+
+def _need_return(params):
+    return [('shift', 'pct', params['n'])]
+
+
+def _need_ma_ma(params):
+    return [('raw', 'mean', params['ma1']), ('raw', 'mean', params['ma2'])]
+
+
+def _need_ma_price(params):
+    return [('raw', 'value', None), ('raw', 'mean', params['ma'])]
+
+
+def _eval_threshold(params, blocks):
+    return threshold_events(blocks[0], params['threshold'], params['sign'], inclusive=True)
+
+
+def _eval_growth(params, blocks):
+    # falling below 0 is strict, reaching 0 is not a fall
+    return threshold_events(blocks[0], 0, params['sign'], inclusive=params['sign'] == 1)
+
+
+def _eval_return(params, blocks):
+    return threshold_events(blocks[0], params['threshold'], params['sign'], inclusive=params['sign'] == 1)
+
+
+def _eval_crossover(params, blocks):
+    fast, slow = blocks
+    return crossover_events(fast, slow, params['sign'])
+
+
+class SignalEngine(object):
+    '''
+    evaluate the signal of many actions on one DataTable,
+    actions sharing (indicator source, stat, window) share one computation,
+    and each (source, stat, window) is computed once for all indicators using it
+
+    engine = SignalEngine(data_table)
+    dateLists = engine.evaluate(actions)
+    '''
+    def __init__(self, data_table):
+        self.data_table = data_table
+        self._blocks = {}
+
+    @staticmethod
+    def supports(method):
+        signal = SIGNALS.get(method)
+        return signal is not None and signal.vectorizable
+
+    def _source(self, source, columns):
+        indicator = self.data_table.indicator[columns]
+        if source == 'raw':
+            return indicator
+        shifted = indicator.shift(1)
+        if source == 'shift':
+            return shifted
+        elif source == 'diff':
+            return shifted.diff()
+        raise RequirementNotMeetException('unknown source %s\n' % source)
+
+    def _compute(self, requirements):
+        '''
+        requirements (dict): (source, stat, window) -> list of indicator columns
+        '''
+        for key, columns in requirements.items():
+            cached = self._blocks.setdefault(key, {})
+            columns = [col for col in columns if col not in cached]
+            if not columns:
+                continue
+            source, stat, window = key
+            data = self._source(source, columns)
+            if stat == 'value':
+                block = data
+            elif stat == 'pct':
+                block = data.pct_change(window)
+            else:
+                rolling = data.rolling(window=window, center=False)
+                block = getattr(rolling, stat)()
+            for col in columns:
+                cached[col] = block[col].values.astype(np.float64)
+
+    def prepare(self, action):
+        '''
+        validate an action, return (Signal, indicator column, params)
+        '''
+        signal = getSignal(action['method'])
+        indicatorID = signal.indicator(self.data_table, action['indicator_id'])
+        return signal, indicatorID, signal.validate(action['params'])
+
+    @traced('signal.engine', 'signal')
+    def evaluate(self, actions):
+        '''
+        actions (list): `weigh_target` actions (dict) of vectorizable signals,
+            or their (Signal, indicator column, params) of `prepare`, not validated again
+        return list of np.array of dates, in the order of actions
+        '''
+        prepared = [
+            self.prepare(action) if isinstance(action, dict) else action
+            for action in actions
+        ]
+        needs = [signal.needs(params) for signal, _, params in prepared]
+
+        requirements = {}
+        for (_, col, _), keys in zip(prepared, needs):
+            for key in keys:
+                columns = requirements.setdefault(key, [])
+                if col not in columns:
+                    columns.append(col)
+        self._compute(requirements)
+
+        index = self.data_table.indicator.index.values
+        dateLists = []
+        for (signal, col, params), keys in zip(prepared, needs):
+            blocks = [self._blocks[key][col] for key in keys]
+            rows = signal.evaluate(params, blocks)
+            dateLists.append(index[rows])
+        return dateLists
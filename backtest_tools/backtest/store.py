@@ -0,0 +1,253 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from .performance import PerformanceMixin
+from backtest_tools.exceptions import RequirementNotMeetException
+
+
+# on-disk layout of a result store (one directory):
+#
+#     manifest.json               version, strategy names, securities, stats
+#     <i>/prices.date.npy         int64 epoch ns
+#     <i>/prices.values.npy       float64 strategy prices
+#     <i>/drawdown.*.npy          same for stats.drawdown
+#     <i>/securities.*.npy        date, positions and prices (date x security)
+#     <i>/weights.*.npy           date, values (date x security)
+#     <i>/transactions.*.npy      date, security (index of securities), quantity, price
+#
+# every array is a plain .npy file, loaded with mmap_mode='r' only when needed
+STORE_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+def _stats_to_json(stats):
+    out = []
+    for k, v in stats.items():
+        if isinstance(v, pd.Timestamp):
+            out.append([k, 'date', v.isoformat()])
+        elif pd.isnull(v):
+            out.append([k, 'float', None])
+        else:
+            out.append([k, 'float', float(v)])
+    return out
+
+
+def _stats_from_json(items):
+    stats = pd.Series(
+        [
+            pd.Timestamp(v) if t == 'date' else (np.nan if v is None else v)
+            for _, t, v in items
+        ],
+        index=[k for k, _, _ in items], dtype=object
+    )
+    return stats
+
+
+def _save_array(folder, table, name, array):
+    np.save(os.path.join(folder, '%s.%s.npy' % (table, name)), np.asarray(array))
+
+
+def _dates(index):
+    return pd.DatetimeIndex(index).values.astype('datetime64[ns]').astype(np.int64)
+
+
+def saveResult(res, path):
+    '''
+    write prices, positions, weights, transactions and stats of every backtest
+    args:
+        res (BacktestResult or dict): result, or return of `runPortfolio`
+        path (str): directory of the store, created if not exists
+    '''
+    # bt Result is a dict too
+    if not hasattr(res, 'backtest_list'):
+        res = res['result']
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    manifest = {'version': STORE_VERSION, 'strategy': []}
+    for i, bkt in enumerate(res.backtest_list):
+        folder = os.path.join(path, str(i))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        s = bkt.strategy
+        securities = [x.name for x in s.securities]
+
+        _save_array(folder, 'prices', 'date', _dates(s.prices.index))
+        _save_array(folder, 'prices', 'values', s.prices.values.astype(np.float64))
+        drawdown = bkt.stats.drawdown
+        _save_array(folder, 'drawdown', 'date', _dates(drawdown.index))
+        _save_array(folder, 'drawdown', 'values', drawdown.values.astype(np.float64))
+
+        if securities:
+            positions = pd.DataFrame({x.name: x.positions for x in s.securities})[securities]
+            prices = pd.DataFrame({x.name: x.prices for x in s.securities})\
+                        .reindex(index=positions.index, columns=securities)
+        else:
+            positions = prices = pd.DataFrame(index=s.prices.index)
+        _save_array(folder, 'securities', 'date', _dates(positions.index))
+        _save_array(folder, 'securities', 'positions', positions.values.astype(np.float64))
+        _save_array(folder, 'securities', 'prices', prices.values.astype(np.float64))
+
+        weights = bkt.security_weights
+        _save_array(folder, 'weights', 'date', _dates(weights.index))
+        _save_array(folder, 'weights', 'values', weights.values.astype(np.float64))
+
+        if securities:
+            trans = res.get_transactions(bkt.name)
+            trans_date = trans.index.get_level_values(0)
+            trans_security = [securities.index(x) for x in trans.index.get_level_values(1)]
+        else:
+            trans = pd.DataFrame(columns=['price', 'quantity'])
+            trans_date, trans_security = [], []
+        _save_array(folder, 'transactions', 'date', _dates(trans_date))
+        _save_array(folder, 'transactions', 'security', np.array(trans_security, dtype=np.int64))
+        _save_array(folder, 'transactions', 'quantity', trans['quantity'].values.astype(np.float64))
+        _save_array(folder, 'transactions', 'price', trans['price'].values.astype(np.float64))
+
+        manifest['strategy'].append({
+            'name': str(bkt.name),
+            'folder': str(i),
+            'securities': securities,
+            'weights': [str(col) for col in weights.columns],
+            'stats': _stats_to_json(bkt.stats.stats),
+            'max_drawdown': float(bkt.stats.max_drawdown),
+        })
+
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    return True
+
+
+class _Lazy(object):
+    '''
+    load .npy arrays of one strategy folder on first access
+    '''
+    def __init__(self, folder, mmap=True):
+        self.folder = folder
+        self.mmap_mode = 'r' if mmap else None
+        self._arrays = {}
+
+    def __call__(self, table, name):
+        key = (table, name)
+        if key not in self._arrays:
+            self._arrays[key] = np.load(
+                os.path.join(self.folder, '%s.%s.npy' % key),
+                mmap_mode=self.mmap_mode
+            )
+        return self._arrays[key]
+
+    def index(self, table):
+        return pd.DatetimeIndex(self(table, 'date').astype('datetime64[ns]'))
+
+
+class StoredSecurity(object):
+    def __init__(self, name, column, lazy):
+        self.name = name
+        self._column = column
+        self._lazy = lazy
+
+    @property
+    def positions(self):
+        return pd.Series(
+            self._lazy('securities', 'positions')[:, self._column],
+            index=self._lazy.index('securities'), name=self.name
+        )
+
+    @property
+    def prices(self):
+        return pd.Series(
+            self._lazy('securities', 'prices')[:, self._column],
+            index=self._lazy.index('securities'), name=self.name
+        )
+
+
+class StoredStrategy(object):
+    def __init__(self, name, securities, lazy):
+        self.name = name
+        self._lazy = lazy
+        self.securities = [
+            StoredSecurity(sec, i, lazy) for i, sec in enumerate(securities)
+        ]
+
+    def get_transactions(self):
+        lazy = self._lazy
+        securities = np.array([x.name for x in self.securities], dtype=object)
+        index = pd.MultiIndex.from_arrays([
+            lazy.index('transactions'),
+            securities[lazy('transactions', 'security')],
+        ], names=['Date', 'Security'])
+        return pd.DataFrame({
+            'price': np.asarray(lazy('transactions', 'price')),
+            'quantity': np.asarray(lazy('transactions', 'quantity')),
+        }, index=index)
+
+    @property
+    def prices(self):
+        return pd.Series(
+            self._lazy('prices', 'values'),
+            index=self._lazy.index('prices'), name='price'
+        )
+
+
+class StoredStats(object):
+    def __init__(self, info, lazy):
+        self.stats = _stats_from_json(info['stats'])
+        self.max_drawdown = info['max_drawdown']
+        self._lazy = lazy
+
+    @property
+    def drawdown(self):
+        return pd.Series(
+            self._lazy('drawdown', 'values'), index=self._lazy.index('drawdown')
+        )
+
+
+class StoredBacktest(object):
+    def __init__(self, info, lazy):
+        self.name = info['name']
+        self._info = info
+        self._lazy = lazy
+        self.strategy = StoredStrategy(self.name, info['securities'], lazy)
+        self.stats = StoredStats(info, lazy)
+
+    @property
+    def security_weights(self):
+        return pd.DataFrame(
+            self._lazy('weights', 'values'),
+            index=self._lazy.index('weights'), columns=self._info['weights']
+        )
+
+
+class StoredResult(PerformanceMixin):
+    '''
+    read-only result loaded from `saveResult`,
+    provides what `PerformanceMixin` needs: backtest_list, backtests, get_transactions
+    '''
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != STORE_VERSION:
+            raise RequirementNotMeetException('unknown result store version %s\n' % manifest.get('version'))
+
+        self.path = path
+        self.backtest_list = [
+            StoredBacktest(info, _Lazy(os.path.join(path, info['folder']), mmap))
+            for info in manifest['strategy']
+        ]
+        self.backtests = {x.name: x for x in self.backtest_list}
+
+    def get_transactions(self, strategy_name=None):
+        if strategy_name is None:
+            strategy_name = self.backtest_list[0].name
+        return self.backtests[strategy_name].strategy.get_transactions()
+
+
+def loadResult(path, mmap=True):
+    '''
+    args:
+        path (str): directory written by `saveResult`
+        mmap (bool): memory-map arrays instead of reading them into memory
+    return StoredResult, arrays are loaded on first use
+    '''
+    return StoredResult(path, mmap=mmap)
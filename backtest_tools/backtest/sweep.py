@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import pandas as pd
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from .portfolio import runPortfolio
+from .composite import compileStrategy
+from .performance import _REPORT_FIELDS, _SERIES_FIELDS
+from backtest_tools.helper import _check_params
+from backtest_tools.data import getDataTable
+from backtest_tools.exceptions import RequirementNotMeetException
+
+
+# series in `getReport` are not part of the sweep table
+_FIELDS = [field for field in _REPORT_FIELDS if field not in _SERIES_FIELDS]
+_shared = {}
+
+
+def _expand_grid(grid):
+    '''
+    grid (dict): {action index: {param name: [values, ...]}}
+    return list of {(action index, param name): value}, in a fixed order
+    '''
+    keys, values = [], []
+    for idx in sorted(grid.keys()):
+        for name in sorted(grid[idx].keys()):
+            keys.append((idx, name))
+            values.append(list(grid[idx][name]))
+    return [dict(zip(keys, point)) for point in product(*values)]
+
+
+def _init_worker(data_table, params_template):
+    _shared['data_table'] = data_table
+    _shared['params'] = params_template
+
+
+def _run_point(point):
+    params = dict(_shared['params'])
+    params['data_table'] = _shared['data_table']
+    # the plan is compiled once, each point only copies and checks the actions it changes
+    # a point the backtest rejects is recorded, the other points still run,
+    # e.g. invalid params, or no closed trade for win_rate
+    try:
+        params['strategy'] = params['strategy'].update(point, step=2)
+        report = runPortfolio(params)['result'].getReport(fields=_FIELDS)
+    except (RequirementNotMeetException, ZeroDivisionError) as e:
+        report = dict.fromkeys(_FIELDS, np.nan)
+        report['error'] = '%s: %s' % (type(e).__name__, str(e).strip())
+        return report
+    report['error'] = None
+    return report
+
+
+def runSweep(params_template, grid, n_jobs=1):
+    '''
+    run `runPortfolio` over every combination of action parameters
+
+    Args:
+        params_template (dict): params of `runPortfolio`, 
+            strategy[2] should be `weigh_target`,
+            data_table can be a directory of `saveDataTable`,
+            then each process maps the same files instead of receiving a copy
+        grid (dict): parameters to sweep for each action
+            {
+                0: {'threshold': [40, 50, 60], 'n': [2, 3]},
+                1: {'ma': [10, 20]}
+            }
+            key is the index in strategy[2]['params']['action']
+        n_jobs (int): number of processes, None or -1 to use all cpus
+
+    return pd.DataFrame, one row per grid point with `getReport` metrics,
+        ordered as the grid expands no matter how many processes are used,
+        `error` holds the RequirementNotMeetException or ZeroDivisionError of a point
+        that failed, its metrics are NaN, other exceptions are raised
+    '''
+    _check_params(params_template, ['data_table', 'strategy'])
+    action = params_template['strategy'][2].get('params', {}).get('action')
+    if action is None:
+        raise RequirementNotMeetException('strategy[2] should be weigh_target with action\n')
+    for idx in grid.keys():
+        if not (isinstance(idx, int) and 0 <= idx < len(action)):
+            raise RequirementNotMeetException('no such action index %s\n' % idx)
+    if n_jobs is None or n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if not isinstance(n_jobs, int) or n_jobs < 1:
+        raise RequirementNotMeetException('n_jobs should be a positive int, None or -1\n')
+
+    # data table is built once and shared by every grid point
+    data_table = getDataTable(params_template['data_table'])
+    template = {k: v for k, v in params_template.items() if k != 'data_table'}
+    template['strategy'] = compileStrategy(template['strategy'])
+    points = _expand_grid(grid)
+
+    if n_jobs == 1 or len(points) <= 1:
+        _init_worker(data_table, template)
+        try:
+            reports = [_run_point(point) for point in points]
+        finally:
+            _shared.clear()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_worker,
+            initargs=(data_table, template)
+        ) as pool:
+            chunksize = max(1, len(points) // (n_jobs * 4))
+            # `map` keeps input order, so results do not depend on n_jobs
+            reports = list(pool.map(_run_point, points, chunksize=chunksize))
+
+    grid_df = pd.DataFrame([
+        {'%s.%s' % key: value for key, value in point.items()}
+        for point in points
+    ])
+    return pd.concat([grid_df, pd.DataFrame(reports)], axis=1)
@@ -0,0 +1,482 @@
+import math
+import uuid
+import numpy as np
+import pandas as pd
+import bt
+from bt.backtest import Result
+from .composite import compileStrategy
+from .performance import PerformanceMixin
+from .store import StoredBacktest, StoredStrategy
+from backtest_tools.data import getDataTable
+from backtest_tools.helper import _check_params
+from backtest_tools.exceptions import RequirementNotMeetException, EngineNotSupportedException
+from backtest_tools import profiling
+
+
+# strategies of the form [run_*] [select_all] weigh_target rebalance
+RUN_CLASSES = ['run_daily', 'run_weekly', 'run_monthly', 'run_quarterly', 'run_yearly']
+INITIAL_CAPITAL = 1000000.0
+INITIAL_PRICE = 100.
+# bt.core tolerance of is_zero, and np.isclose defaults used by bt allocate
+TOL = 1e-16
+ATOL = 1e-8
+
+
+def supports(strategy):
+    '''
+    strategy (list): `runPortfolio` params['strategy']
+    return True if the vectorized engine reproduces the strategy
+    '''
+    classes = [stra.get('class') for stra in strategy]
+    if classes and classes[0] in RUN_CLASSES:
+        classes = classes[1:]
+    if classes and classes[0] == 'select_all':
+        classes = classes[1:]
+    return classes == ['weigh_target', 'rebalance']
+
+
+def _is_zero(x):
+    return abs(x) < TOL
+
+
+def _is_close(a, b):
+    return abs(a - b) <= ATOL + TOL * abs(b)
+
+
+class VectorizedResult(Result, PerformanceMixin):
+    '''
+    same as `BacktestResult`, backtests hold arrays instead of bt nodes
+    '''
+    pass
+
+
+class VectorizedBacktest(StoredBacktest):
+    '''
+    what `VectorizedResult` and `getReport` need from a bt Backtest:
+    name, strategy, stats, security_weights
+    '''
+    def __init__(self, name, securities, arrays, prices, stat_prices):
+        self.name = name
+        self._info = {'name': name, 'securities': securities, 'weights': securities}
+        self._lazy = arrays
+        self.strategy = StoredStrategy(name, securities, arrays)
+        self._original_prices = prices
+        self._stat_prices = stat_prices
+        self.stats = stat_prices.calc_perf_stats()
+
+
+class _Arrays(object):
+    '''
+    in-memory arrays with the interface of `store._Lazy`
+    '''
+    def __init__(self):
+        self._arrays = {}
+        self._index = {}
+
+    def add(self, table, index, **arrays):
+        self._index[table] = index
+        for name, array in arrays.items():
+            self._arrays[(table, name)] = array
+
+    def __call__(self, table, name):
+        return self._arrays[(table, name)]
+
+    def index(self, table):
+        return self._index[table]
+
+
+def _period_keys(algo, index):
+    '''
+    period of each date as compared by the bt RunPeriod algo, None for other algos
+    '''
+    if isinstance(algo, bt.algos.RunDaily):
+        return index.normalize().values
+    if isinstance(algo, bt.algos.RunWeekly):
+        iso = index.isocalendar()
+        return iso['year'].values * 100 + iso['week'].values
+    if isinstance(algo, bt.algos.RunMonthly):
+        return index.year.values * 12 + index.month.values
+    if isinstance(algo, bt.algos.RunQuarterly):
+        return index.year.values * 4 + index.quarter.values
+    if isinstance(algo, bt.algos.RunYearly):
+        return index.year.values
+    return None
+
+
+def _run_flags(algo, index):
+    '''
+    dates the algo stack runs, same as bt RunPeriod without the added first row
+    '''
+    n = len(index)
+    if algo is None:
+        return np.ones(n, dtype=bool)
+    keys = _period_keys(algo, index)
+    if keys is None:
+        flags = np.zeros(n, dtype=bool)
+        stamps = list(index)
+        for i in range(1, n - 1):
+            other = stamps[i + 1] if algo._run_on_end_of_period else stamps[i - 1]
+            flags[i] = algo.compare_dates(stamps[i], other)
+    elif algo._run_on_end_of_period:
+        flags = np.append(keys[:-1] != keys[1:], False)
+    else:
+        flags = np.insert(keys[1:] != keys[:-1], 0, False)
+    if n:
+        flags[0] = algo._run_on_first_date
+        flags[-1] = algo._run_on_last_date
+    return flags
+
+
+def _quantity(amount, price, position, value, outlay=None):
+    '''
+    quantity bt SecurityBase.allocate trades for `amount` with integer positions,
+    outlay fn(quantity) with commissions, None for q * price
+    '''
+    if abs(amount) < TOL:
+        return 0.
+    if abs(amount + value) < TOL:
+        q = -position
+    else:
+        q = amount / price
+        if position > 0 or (abs(position) < TOL and amount > 0):
+            q = math.floor(q)
+        else:
+            q = math.ceil(q)
+    if abs(q) < TOL or math.isnan(q):
+        return 0.
+
+    if q != -position:
+        # commissions may push the outlay over amount, step back as bt does
+        full = outlay(q) if outlay else q * price
+        i = 0
+        last_q = q
+        last_short = full - amount
+        while abs(full - amount) > ATOL + TOL * abs(amount) and q != 0:
+            q = math.floor(q - (full - amount) / price)
+            if outlay:
+                full, more = outlay(q), outlay(q + 1)
+            else:
+                full, more = q * price, (q + 1) * price
+            if full < amount:
+                if more > amount:
+                    break
+                q += 1
+                full = more
+            i += 1
+            if i > 1e4 or last_q == q or abs(full - amount) > abs(last_short):
+                raise EngineNotSupportedException('quantity search does not converge\n')
+            last_q = q
+            last_short = full - amount
+    return float(q)
+
+
+def _order_quantity(targets, prices, position, value):
+    '''
+    quantity of each target before the outlay search of bt allocate, arrays broadcast,
+    value the strategy value before the trades
+    '''
+    with np.errstate(all='ignore'):
+        held = position != 0
+        current = np.where(held, position * prices, 0.)
+        weight = np.where(held & ~(np.abs(value) < TOL), current / value, 0.)
+        amount = (targets - weight) * value
+        q = amount / prices
+        q = np.where((position > 0) | ((np.abs(position) < TOL) & (amount > 0)), np.floor(q), np.ceil(q))
+        q = np.where(np.abs(amount + current) < TOL, -position, q)
+        q = np.where(np.abs(amount) < TOL, 0., q)
+        q = np.where(np.abs(q) < TOL, 0., q)
+        q = np.where(np.isnan(q), 0., q)
+    return q
+
+
+def _block_values(prices, cash, position, order):
+    '''
+    strategy values of the rows with fixed positions,
+    summed in the order bt visits the securities
+    '''
+    val = np.full(len(prices), cash)
+    for j in order:
+        if position[j] != 0:
+            val = val + position[j] * prices[:, j]
+    return val
+
+
+def _first_trade(prices, targets, columns, val, position, created):
+    '''
+    first row where Rebalance trades, creates a security or fails with fixed positions,
+    len(prices) if none
+    '''
+    p = prices[:, columns]
+    pos = np.asarray(position)[columns]
+    new = ~np.asarray(created)[columns]
+    q = _order_quantity(targets, p, pos, val[:, None])
+    with np.errstate(invalid='ignore'):
+        bad = np.isnan(p) | (np.abs(p) < TOL)
+    hit = np.where(np.abs(targets) < TOL, ~new & (pos != 0), new | bad | (q != 0)).any(axis=1)
+    return int(np.argmax(hit)) if hit.any() else len(prices)
+
+
+def _simulate(prices, targets, columns, run, commission, capital):
+    '''
+    replay bt Rebalance on every run date
+    args:
+        prices (np.array): date x asset
+        targets (np.array): date x target, target weights
+        columns (list): asset position of each target column
+        run (np.array of bool): dates the algo stack runs
+        commission (function): fn(quantity, price), None for no commissions
+    return strategy values, strategy prices, positions (date x asset),
+        securities in the order bt creates them
+    the first row of each return is the row bt adds before the first date
+
+    rows between trades are valued with array ops, only run dates that trade
+    go through the scalar replay of bt
+    '''
+    n, m = prices.shape
+    run = np.asarray(run, dtype=bool)
+    position = [0.] * m
+    order = []
+    created = [False] * m
+
+    values = np.empty(n + 1)
+    strategy_prices = np.empty(n + 1)
+    positions = np.zeros((n + 1, m))
+    values[0] = value = capital
+    strategy_prices[0] = price = INITIAL_PRICE
+    cash = capital
+
+    def outlay(q, p):
+        if commission is None:
+            return q * p
+        q = float(q)
+        return q * p + 0. + commission(q, p)
+
+    def mark(row):
+        val = cash
+        for j in order:
+            if position[j] != 0:
+                val += position[j] * row[j]
+        if math.isnan(val):
+            raise EngineNotSupportedException('no price of an open position\n')
+        if val < 0 and not _is_zero(val):
+            raise EngineNotSupportedException('strategy goes bankrupt\n')
+        return val
+
+    def transact(j, q, p):
+        nonlocal cash
+        full = outlay(q, p)
+        if not math.isfinite(full):
+            raise EngineNotSupportedException('transaction outlay is not finite\n')
+        position[j] += q
+        cash += -full
+
+    def rebalance(t):
+        '''
+        scalar replay of row t, return True if it trades
+        '''
+        nonlocal value, price
+        row = prices[t].tolist()
+        last_value, last_price = value, price
+        if _is_zero(last_value):
+            raise EngineNotSupportedException('strategy value is zero\n')
+        value = base = mark(row)
+        price = last_price * (1 + (value / last_value - 1))
+        scale = not _is_zero(base)
+
+        traded = False
+        for w, j in zip(targets[t].tolist(), columns):
+            p = row[j]
+            held = position[j]
+            if abs(w) < TOL:
+                if created[j] and held != 0:
+                    transact(j, -held, p)
+                    traded = True
+                continue
+            if not created[j]:
+                created[j] = True
+                order.append(j)
+            if math.isnan(p) or abs(p) < TOL:
+                raise EngineNotSupportedException('no price to trade\n')
+            if held != 0:
+                current = held * p
+                amount = (w - (current / base if scale else 0.)) * base
+            else:
+                current = 0.
+                amount = (w - 0.) * base
+            q = _quantity(
+                amount, p, held, current,
+                None if commission is None else lambda q: outlay(q, p)
+            )
+            if q != 0:
+                transact(j, q, p)
+                traded = True
+
+        if traded:
+            val = mark(row)
+            if not _is_zero(value - val):
+                value = val
+                price = last_price * (1 + (value / last_value - 1))
+        values[t + 1] = value
+        strategy_prices[t + 1] = price
+        positions[t + 1] = position
+        return traded
+
+    def hold(t, e, val):
+        '''
+        rows t to e without trades, val the strategy values of the rows
+        '''
+        nonlocal value, price
+        last = np.insert(val[:-1], 0, value)
+        failed = np.abs(last) < TOL
+        failed |= np.isnan(val)
+        failed |= (val < 0) & ~(np.abs(val) < TOL)
+        if failed.any():
+            i = int(np.argmax(failed))
+            if _is_zero(last[i]):
+                raise EngineNotSupportedException('strategy value is zero\n')
+            mark(prices[t + i])
+        chain = np.multiply.accumulate(np.insert(1 + (val / last - 1), 0, price))
+        values[t + 1:e + 1] = val
+        strategy_prices[t + 1:e + 1] = chain[1:]
+        positions[t + 1:e + 1] = position
+        value, price = val[-1], chain[-1]
+
+    t, chunk, eager = 0, 16, False
+    while t < n:
+        if eager and run[t]:
+            # trades tend to follow trades, skip the look ahead
+            eager = rebalance(t)
+            t += 1
+            continue
+        e = min(n, t + chunk)
+        val = _block_values(prices[t:e], cash, position, order)
+        rows = np.flatnonzero(run[t:e])
+        stop = e
+        if len(rows):
+            i = _first_trade(prices[t + rows], targets[t + rows], columns, val[rows], position, created)
+            if i < len(rows):
+                stop = t + rows[i]
+        if stop > t:
+            hold(t, stop, val[:stop - t])
+        if stop < e:
+            eager = rebalance(stop)
+            t, chunk = stop + 1, 16
+        else:
+            t, chunk = e, chunk * 2
+    return values, strategy_prices, positions, order
+
+
+def _stat_prices(prices, positions):
+    '''
+    same as bt Backtest._compute_stat_prices,
+    start from the date before the first transaction
+    '''
+    changed = np.flatnonzero(
+        (np.diff(positions, axis=0, prepend=0) != 0).any(axis=1)
+    )
+    if len(changed):
+        return prices.iloc[max(changed[0] - 1, 0):]
+    return prices
+
+
+def _transactions(index, names, positions, prices):
+    '''
+    same rows and order as bt Strategy.get_transactions
+    '''
+    trades = np.diff(positions, axis=0, prepend=0)
+    rows, cols = np.nonzero(trades)
+    rank = np.argsort(np.argsort(np.array(names, dtype=object)))
+    order = np.lexsort((rank[cols], rows))
+    rows, cols = rows[order], cols[order]
+    return {
+        'date': index[rows],
+        'security': cols.astype(np.int64),
+        'quantity': trades[rows, cols],
+        'price': prices[rows, cols],
+    }
+
+
+@profiling.traced('vectorized', 'backtest')
+def runVectorized(params):
+    '''
+    run a `weigh_target` strategy without the bt algo stack,
+    same params and return as `runPortfolio`, the result gives the same `getReport`
+
+    params (dict): data_table, strategy,
+        start_date, end_date, commissions, riskfree_rate (optional)
+        strategy: [run_daily|weekly|monthly|quarterly|yearly] [select_all] weigh_target rebalance
+
+    raise EngineNotSupportedException when bt would run it differently,
+    e.g. other algos, missing prices of traded assets, bankruptcy
+    '''
+    _check_params(params, ['data_table', 'strategy'])
+    if not supports(params['strategy']):
+        raise EngineNotSupportedException(
+            'strategy %s is not supported by the vectorized engine\n' % [s.get('class') for s in params['strategy']]
+        )
+
+    plan = compileStrategy(params['strategy'])
+    data_table = getDataTable(params['data_table'])
+    run_algo = weigh = None
+    for stra, factory in zip(plan, plan.factories):
+        algo = factory(data_table=data_table, params=stra['params'])
+        if stra['class'] in RUN_CLASSES:
+            run_algo = algo
+        elif stra['class'] == 'weigh_target':
+            weigh = algo
+
+    start_date, end_date = data_table.date[0], data_table.date[-1]
+    if params.get('start_date'):
+        start_date = params['start_date']
+    if params.get('end_date'):
+        end_date = params['end_date']
+    asset = data_table.asset.loc[
+        (data_table.asset.index >= start_date) &
+        (data_table.asset.index <= end_date)
+    ]
+    if asset.empty:
+        raise RequirementNotMeetException('no asset data between %s and %s\n' % (start_date, end_date))
+    if asset.columns.duplicated().any():
+        raise EngineNotSupportedException('duplicated asset names\n')
+
+    weights = weigh.weights.reindex(asset.index)
+    if weights.isnull().values.any():
+        raise EngineNotSupportedException('weights do not cover every date\n')
+    unknown = [col for col in weights.columns if col not in asset.columns]
+    if unknown:
+        raise EngineNotSupportedException('no asset data for %s\n' % unknown)
+    columns = [asset.columns.get_loc(col) for col in weights.columns]
+
+    prices = asset.values.astype(np.float64)
+    values, strategy_prices, positions, order = _simulate(
+        prices, weights.values.astype(np.float64), columns,
+        _run_flags(run_algo, asset.index), params.get('commissions'), INITIAL_CAPITAL
+    )
+
+    # bt adds a row one day before the first date
+    index = asset.index.insert(0, asset.index[0] - pd.DateOffset(days=1))
+    names = [asset.columns[j] for j in order]
+    positions = positions[:, order]
+    security_prices = np.vstack([np.full((1, len(order)), np.nan), prices[:, order]])
+    security_values = np.where(positions != 0, positions * security_prices, 0.)
+
+    arrays = _Arrays()
+    arrays.add('prices', index, values=strategy_prices)
+    arrays.add('securities', index, positions=positions, prices=security_prices)
+    arrays.add('weights', index, values=security_values / values[:, None])
+    trans = _transactions(index, names, positions, security_prices)
+    arrays.add('transactions', pd.DatetimeIndex(trans.pop('date')), **trans)
+
+    name = uuid.uuid4()
+    strategy_prices = pd.Series(strategy_prices, index=index, name='price')
+    backtest = VectorizedBacktest(
+        name, names, arrays, strategy_prices, _stat_prices(strategy_prices, positions)
+    )
+    result = VectorizedResult(backtest)
+    if params.get('riskfree_rate'):
+        result.set_riskfree_rate(params['riskfree_rate'])
+
+    return {
+        'result': result,
+        'strategy': backtest
+    }
@@ -1,2 +1,3 @@
 from .get import getCorrelation
-from .get import Correlation
\ No newline at end of file
+from .get import Correlation
+from .screen import screenIndicators
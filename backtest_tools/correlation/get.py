@@ -1,6 +1,266 @@
-# TODO: implement correlation function
-def getCorrelation():
-    pass
+import numpy as np
+import pandas as pd
+from backtest_tools.data import getDataTable
+from backtest_tools.helper import _check_params
+from backtest_tools.exceptions import RequirementNotMeetException
+from backtest_tools.profiling import traced
+
+
+METHODS = ['pearson', 'spearman']
+# columns of each block of a matrix product, bounds the temporaries to rows x BLOCK
+BLOCK = 1024
+# a window variance is taken as sxx - sx * sx / w from running sums: both terms come out of
+# cumulative sums of the rows up to the window, their rounding is a few eps (2.2e-16) of the
+# running sum of squares times about sqrt(rows) (sequential np.cumsum), measured under 250 eps
+# on 50000 rows; a variance under VAR_RTOL of the running sum of squares (~4500 eps, enough up
+# to ~2e7 rows) is rounding of a constant window and its correlation is NaN, as in pandas
+VAR_RTOL = 1e-12
+
+
+def _values(frame):
+    return np.asarray(frame.values, dtype=np.float64)
+
+
+def _rank(frame):
+    '''
+    average rank of each column, NaN kept, for spearman
+    '''
+    return frame.rank(axis=0, method='average', na_option='keep')
+
+
+def _standardize(x):
+    '''
+    column z-scores (ddof 1), zero variance columns are NaN
+    '''
+    n = x.shape[0]
+    x = x - x.mean(axis=0)
+    std = np.sqrt((x * x).sum(axis=0) / (n - 1)) if n > 1 else np.zeros(x.shape[1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return x / np.where(std > 0, std, np.nan)
+
+
+def _pearson_complete(x, y, block):
+    '''
+    x (T x n), y (T x m) without NaN, return n x m
+    '''
+    n = x.shape[0]
+    zx, zy = _standardize(x), _standardize(y)
+    out = np.empty((x.shape[1], y.shape[1]))
+    for i in range(0, x.shape[1], block):
+        for j in range(0, y.shape[1], block):
+            out[i:i + block, j:j + block] = zx[:, i:i + block].T @ zy[:, j:j + block]
+    out /= max(n - 1, 1)
+    return np.clip(out, -1., 1., out=out)
+
+
+def _pearson_pairwise(x, y, block):
+    '''
+    x (T x n), y (T x m) with NaN, each pair on the rows where both have values,
+    same as pandas corr, from six blocked matrix products of the masked sums
+    '''
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    # center by the column means first, the sums cancel less
+    x = np.where(mx, x - np.nanmean(np.where(mx, x, np.nan), axis=0), 0.)
+    y = np.where(my, y - np.nanmean(np.where(my, y, np.nan), axis=0), 0.)
+    fx, fy = mx.astype(np.float64), my.astype(np.float64)
+    out = np.empty((x.shape[1], y.shape[1]))
+    for i in range(0, x.shape[1], block):
+        xi, fxi = x[:, i:i + block], fx[:, i:i + block]
+        for j in range(0, y.shape[1], block):
+            yj, fyj = y[:, j:j + block], fy[:, j:j + block]
+            n = fxi.T @ fyj
+            sx, sy = xi.T @ fyj, fxi.T @ yj
+            sxx, syy = (xi * xi).T @ fyj, fxi.T @ (yj * yj)
+            sxy = xi.T @ yj
+            with np.errstate(invalid='ignore', divide='ignore'):
+                cov = n * sxy - sx * sy
+                var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+                out[i:i + block, j:j + block] = np.where(
+                    (n > 1) & (var > 0), cov / np.sqrt(var), np.nan
+                )
+    return np.clip(out, -1., 1., out=out)
+
+
+def _pearson(x, y, block=BLOCK):
+    if np.isnan(x).any() or np.isnan(y).any():
+        return _pearson_pairwise(x, y, block)
+    return _pearson_complete(x, y, block)
+
+
+def _rolling(x, y, window, block=BLOCK):
+    '''
+    rolling correlation of each column of x (T x n) with the same column of y (T x n),
+    or with y (T x 1), from running sums, a window with NaN is NaN
+    '''
+    T, n = x.shape
+    out = np.full((T, n), np.nan)
+    if window < 2 or window > T:
+        return out
+    for j in range(0, n, block):
+        xj = x[:, j:j + block]
+        yj = y if y.shape[1] == 1 else y[:, j:j + block]
+        valid = ~(np.isnan(xj) | np.isnan(yj))
+        # center by the means, the running sums keep more precision
+        xj = np.where(valid, xj - np.nanmean(xj, axis=0), 0.)
+        yj = np.where(valid, yj - np.nanmean(yj, axis=0), 0.)
+
+        def window_sum(a):
+            '''
+            sum over each window and the running sum up to its last row
+            '''
+            c = np.cumsum(a, axis=0)
+            s = c[window - 1:].copy()
+            s[1:] -= c[:-window]
+            return s, c[window - 1:]
+
+        count, _ = window_sum(valid.astype(np.float64))
+        (sx, _), (sy, _) = window_sum(xj), window_sum(yj)
+        (sxx, cxx), (syy, cyy) = window_sum(xj * xj), window_sum(yj * yj)
+        sxy, _ = window_sum(xj * yj)
+        w = float(window)
+        cov = sxy - sx * sy / w
+        vx, vy = sxx - sx * sx / w, syy - sy * sy / w
+        defined = (count == window) & (vx > VAR_RTOL * cxx) & (vy > VAR_RTOL * cyy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = np.where(defined, cov / np.sqrt(vx * vy), np.nan)
+        out[window - 1:, j:j + block] = np.clip(r, -1., 1.)
+    return out
+
+
+def _lag_slices(T, lag):
+    '''
+    rows of x and y pairing x at t with y at t + lag
+    '''
+    if lag >= 0:
+        return slice(0, T - lag), slice(lag, T)
+    return slice(-lag, T), slice(0, T + lag)
+
 
 class Correlation(object):
-    pass
\ No newline at end of file
+    '''
+    correlations of the asset and indicator series of a DataTable
+
+    corr = Correlation(data_table)
+    corr.matrix('indicator', 'returns', method='spearman')
+    corr.rolling('indicator', 'returns', window=60)
+    corr.lagged('indicator', 'returns', lags=range(0, 21))
+
+    series are given by name:
+        'asset', 'indicator', 'returns' (asset pct_change), 'indicator_change' (indicator pct_change)
+    or as a DataFrame on the dates of the table
+    '''
+    def __init__(self, data_table, block=BLOCK):
+        self.data_table = getDataTable(data_table)
+        self.block = block
+        self._frames = {}
+
+    def frame(self, which):
+        if isinstance(which, pd.DataFrame):
+            return which
+        if isinstance(which, pd.Series):
+            return which.to_frame()
+        if which not in self._frames:
+            if which == 'asset':
+                frame = self.data_table.asset
+            elif which == 'indicator':
+                frame = self.data_table.indicator
+            elif which == 'returns':
+                frame = self.data_table.asset.pct_change().iloc[1:]
+            elif which == 'indicator_change':
+                frame = self.data_table.indicator.pct_change().iloc[1:]
+            else:
+                raise RequirementNotMeetException(
+                    'series should be asset, indicator, returns, indicator_change or a DataFrame\n'
+                )
+            if frame.empty:
+                raise RequirementNotMeetException('no %s in Data Table\n' % which)
+            self._frames[which] = frame
+        return self._frames[which]
+
+    def _pair(self, x, y, method):
+        if method not in METHODS:
+            raise RequirementNotMeetException('method should be one of %s\n' % METHODS)
+        fx = self.frame(x)
+        fy = fx if y is None else self.frame(y)
+        if not fx.index.equals(fy.index):
+            fx, fy = fx.align(fy, join='inner', axis=0)
+        if method == 'spearman':
+            fx, fy = _rank(fx), _rank(fy)
+        return fx, fy
+
+    @traced('Correlation.matrix', 'correlation')
+    def matrix(self, x='asset', y=None, method='pearson'):
+        '''
+        x, y: series, y defaults to x
+        method (str): 'pearson' or 'spearman'
+        return DataFrame, x columns by y columns
+        '''
+        fx, fy = self._pair(x, y, method)
+        out = _pearson(_values(fx), _values(fy), self.block)
+        return pd.DataFrame(out, index=fx.columns, columns=fy.columns)
+
+    @traced('Correlation.rolling', 'correlation')
+    def rolling(self, x, y, window, method='pearson'):
+        '''
+        x, y: series, y has one column or the same number of columns as x
+        window (int): rows of each window, a window with NaN is NaN
+        return DataFrame on the dates, correlation of each x column and its y column
+        spearman ranks the whole series once, not each window
+        '''
+        window = int(window)
+        fx, fy = self._pair(x, y, method)
+        if fy.shape[1] not in (1, fx.shape[1]):
+            raise RequirementNotMeetException('y should have one column or as many as x\n')
+        out = _rolling(_values(fx), _values(fy), window, self.block)
+        return pd.DataFrame(out, index=fx.index, columns=fx.columns)
+
+    @traced('Correlation.lagged', 'correlation')
+    def lagged(self, x='indicator', y='returns', lags=range(0, 11), method='pearson'):
+        '''
+        cross-correlation of x at t with y at t + lag, positive lag: x leads y
+        lags (list of int)
+        return DataFrame, index (x column, y column), one column for each lag
+        '''
+        if method not in METHODS:
+            raise RequirementNotMeetException('method should be one of %s\n' % METHODS)
+        fx, fy = self._pair(x, y, 'pearson')
+        X, Y = _values(fx), _values(fy)
+        T = X.shape[0]
+        out = {}
+        for lag in lags:
+            lag = int(lag)
+            if abs(lag) >= T - 1:
+                out[lag] = np.full(X.shape[1] * Y.shape[1], np.nan)
+                continue
+            rx, ry = _lag_slices(T, lag)
+            xs, ys = X[rx], Y[ry]
+            if method == 'spearman':
+                xs, ys = _values(_rank(pd.DataFrame(xs))), _values(_rank(pd.DataFrame(ys)))
+            out[lag] = _pearson(xs, ys, self.block).ravel()
+        index = pd.MultiIndex.from_product([fx.columns, fy.columns], names=['x', 'y'])
+        return pd.DataFrame(out, index=index)
+
+
+@traced('getCorrelation', 'correlation')
+def getCorrelation(params):
+    '''
+    args:
+        data_table: DataTable or `getDataTable` params
+        x, y (optional): series of `Correlation`, default 'asset' and x
+        method (optional): 'pearson' (default) or 'spearman'
+        window (optional, int): rolling correlation, see `Correlation.rolling`
+        lags (optional, list of int): lagged cross-correlation, see `Correlation.lagged`
+        block (optional, int): columns of each matrix product block
+    example:
+        getCorrelation({'data_table': data_table, 'x': 'indicator', 'y': 'returns', 'lags': [0, 1, 5]})
+    return DataFrame
+    '''
+    _check_params(params, ['data_table'])
+    corr = Correlation(params['data_table'], block=params.get('block') or BLOCK)
+    method = params.get('method') or 'pearson'
+    x = params.get('x', 'asset')
+    if params.get('window'):
+        return corr.rolling(x, params.get('y', 'returns'), params['window'], method=method)
+    if params.get('lags') is not None:
+        return corr.lagged(x, params.get('y', 'returns'), params['lags'], method=method)
+    return corr.matrix(x, params.get('y'), method=method)
@@ -0,0 +1,191 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from backtest_tools.data import getDataTable
+from backtest_tools.helper import _check_params, _valid_id
+from backtest_tools.exceptions import RequirementNotMeetException
+from backtest_tools.profiling import traced
+
+
+# cross sums of more lags than this are computed by FFT instead of a matrix of shifted returns
+FFT_LAGS = 64
+# indicator columns of each block, and of each task of the process pool
+BLOCK = 512
+_shared = {}
+
+
+def _forward_returns(price, horizon):
+    '''
+    return from t to t + horizon, known at t + horizon
+    '''
+    return price.shift(-horizon) / price - 1
+
+
+def _prefix(x):
+    '''
+    prefix sums along rows with a zero first row, sum of rows [a, b) is p[b] - p[a]
+    '''
+    p = np.zeros((x.shape[0] + 1,) + x.shape[1:])
+    np.cumsum(x, axis=0, out=p[1:])
+    return p
+
+
+def _cross_matrix(x, y, lags):
+    '''
+    sum over t of x[t] * y[t + lag], one product of x and the shifted copies of y
+    '''
+    T = len(y)
+    shifted = np.zeros((T, len(lags)))
+    for k, lag in enumerate(lags):
+        if lag >= 0:
+            shifted[:T - lag, k] = y[lag:]
+        else:
+            shifted[-lag:, k] = y[:T + lag]
+    return x.T @ shifted
+
+
+def _cross_fft(x, y, lags):
+    '''
+    same as `_cross_matrix` from the FFT of each column, for many lags
+    '''
+    T = len(y)
+    nfft = 1 << int(np.ceil(np.log2(2 * T - 1)))
+    fy = np.fft.rfft(y, nfft)
+    fx = np.fft.rfft(x, nfft, axis=0)
+    # circular cross-correlation, negative lags wrap to the end
+    cc = np.fft.irfft(np.conj(fx) * fy[:, None], nfft, axis=0)
+    rows = np.array([lag if lag >= 0 else nfft + lag for lag in lags])
+    return cc[rows].T
+
+
+def _lead_lag(x, y, lags, method='auto'):
+    '''
+    x (T x n) candidates, y (T,) target, both without NaN
+    return n x len(lags), corr(x[t], y[t + lag]) on the rows where both exist
+    '''
+    T = len(y)
+    # correlation does not change with the means, centering keeps the sums small
+    x = x - x.mean(axis=0)
+    y = y - y.mean()
+    if method == 'auto':
+        method = 'fft' if len(lags) > FFT_LAGS else 'matrix'
+    sxy = _cross_fft(x, y, lags) if method == 'fft' else _cross_matrix(x, y, lags)
+
+    px, pxx = _prefix(x), _prefix(x * x)
+    py, pyy = _prefix(y), _prefix(y * y)
+    out = np.full((x.shape[1], len(lags)), np.nan)
+    for k, lag in enumerate(lags):
+        # rows of x paired with y[t + lag]
+        a, b = max(0, -lag), min(T, T - lag)
+        n = b - a
+        if n < 3:
+            continue
+        sx, sxx = px[b] - px[a], pxx[b] - pxx[a]
+        sy, syy = py[b + lag] - py[a + lag], pyy[b + lag] - pyy[a + lag]
+        cov = n * sxy[:, k] - sx * sy
+        var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[:, k] = np.where(var > 0, cov / np.sqrt(var), np.nan)
+    return np.clip(out, -1., 1., out=out)
+
+
+def _init_worker(x, y, lags, method):
+    _shared.update(x=x, y=y, lags=lags, method=method)
+
+
+def _screen_block(bounds):
+    start, end = bounds
+    x = np.asarray(_shared['x'][:, start:end], dtype=np.float64)
+    return _lead_lag(x, _shared['y'], _shared['lags'], _shared['method'])
+
+
+@traced('screenIndicators', 'correlation')
+def screenIndicators(params):
+    '''
+    rank indicators by correlation with the forward returns of one asset
+
+    args:
+        data_table: DataTable, `getDataTable` params, or a directory of `saveDataTable`
+        asset_id: the asset
+        indicator_id (optional, list): candidates, default every indicator of the table
+        lags (optional, list of int): indicator at t against the forward return at t + lag,
+            default range(0, 21)
+        horizon (optional, int): periods of the forward return, default 1
+        k (optional, int): number of (indicator, lag) returned, default 20
+        absolute (optional, bool): rank by |correlation|, default True
+        method (optional): 'matrix', 'fft', or 'auto' (fft for more than FFT_LAGS lags)
+        n_jobs (optional, int): processes for blocks of BLOCK indicators,
+            None or -1 to use all cpus, default 1
+    example:
+        top = screenIndicators({'data_table': data_table, 'asset_id': 2, 'lags': range(1, 11), 'k': 5})
+        for row in top.itertuples():
+            portfolio.addAction('buy', row.indicator_id, ...)
+    return DataFrame of indicator_id, lag, correlation, nobs, sorted by rank
+    '''
+    _check_params(params, ['data_table', 'asset_id'])
+    data_table = getDataTable(params['data_table'])
+    assetID = _valid_id(params['asset_id'])
+    if assetID not in (data_table.use_id.get('asset') or []):
+        raise RequirementNotMeetException('asset ID %s not in Data Table\n' % assetID)
+    if data_table.indicator.empty:
+        raise RequirementNotMeetException('no indicator in Data Table\n')
+
+    indicator = data_table.indicator
+    if params.get('indicator_id') is not None:
+        columns = [_valid_id(ID) for ID in params['indicator_id']]
+        unknown = [col for col in columns if col not in indicator.columns]
+        if unknown:
+            raise RequirementNotMeetException('indicator ID %s not in Data Table\n' % unknown)
+        indicator = indicator[columns]
+
+    lags = [int(lag) for lag in params.get('lags', range(0, 21))]
+    horizon = int(params.get('horizon', 1))
+    k = int(params.get('k', 20))
+    method = params.get('method', 'auto')
+    if method not in ['auto', 'matrix', 'fft']:
+        raise RequirementNotMeetException('method should be auto, matrix or fft\n')
+    if not lags or horizon < 1 or k < 1:
+        raise RequirementNotMeetException('lags should not be empty, horizon and k should be positive\n')
+
+    # rows with a forward return, the last `horizon` rows have none
+    y = _forward_returns(data_table.asset[assetID], horizon).values[:-horizon]
+    x = indicator.values[:len(y)]
+    if len(y) < 3:
+        raise RequirementNotMeetException('not enough dates for horizon %s\n' % horizon)
+    if np.isnan(y).any() or np.isnan(x).any():
+        raise RequirementNotMeetException('asset and indicator should have no NaN\n')
+
+    n_jobs = params.get('n_jobs', 1)
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    bounds = [(s, min(s + BLOCK, x.shape[1])) for s in range(0, x.shape[1], BLOCK)]
+    if n_jobs == 1 or len(bounds) <= 1:
+        _init_worker(x, y, lags, method)
+        try:
+            blocks = [_screen_block(b) for b in bounds]
+        finally:
+            _shared.clear()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_worker,
+            initargs=(x, y, lags, method)
+        ) as pool:
+            blocks = list(pool.map(_screen_block, bounds))
+    corr = np.vstack(blocks)
+
+    score = np.abs(corr) if params.get('absolute', True) else corr.copy()
+    score = np.where(np.isnan(score), -np.inf, score).ravel()
+    k = min(k, int(np.isfinite(score).sum()))
+    top = np.argpartition(-score, k - 1)[:k] if k else np.array([], dtype=np.int64)
+    top = top[np.argsort(-score[top], kind='stable')]
+    rows, cols = np.unravel_index(top, corr.shape)
+    lag = np.array(lags)[cols]
+    T = len(y)
+    return pd.DataFrame({
+        'indicator_id': indicator.columns[rows],
+        'lag': lag,
+        'correlation': corr[rows, cols],
+        'nobs': T - np.abs(lag),
+    })
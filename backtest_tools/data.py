@@ -1,5 +1,13 @@
+import os
+import json
+import hashlib
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
 from .helper import _check_params
+from .exceptions import RequirementNotMeetException
+from .profiling import traced
+from .source import AsyncDataSource
 
 
 class DataTable(object):
@@ -9,6 +17,22 @@ class DataTable(object):
         self.asset = pd.DataFrame()
         self.indicator = pd.DataFrame()
         self.date = pd.Series()
+        self.align = 'inner'
+
+    def __getstate__(self):
+        # a table loaded by `loadDataTable` and not changed since is pickled as its path,
+        # so other processes map the same files instead of copying the arrays
+        stored = self.__dict__.get('_stored')
+        if stored is not None and stored[2] is self.asset and stored[3] is self.indicator:
+            return {'_stored_path': stored[0], '_stored_mmap': stored[1]}
+        state = dict(self.__dict__)
+        state.pop('_stored', None)
+        return state
+
+    def __setstate__(self, state):
+        if '_stored_path' in state:
+            state = _load_table(state['_stored_path'], state['_stored_mmap']).__dict__
+        self.__dict__.update(state)
 
     def set_frequency(self):
         '''
@@ -32,48 +56,573 @@ class DataTable(object):
             ]
         return True
 
+    @traced('DataTable.check_validation', 'data')
     def check_validation(self):
         '''
         * check asset and indicator have the same frequency
         * check date is pandas datetime object
-        * check asset and indicator have same date
+        * align asset and indicator dates by `self.align`, see `_align_frames`
         * check asset and indicator have no NaN
         * check asset and indicator's columns are all string
         '''
         self.asset.index = pd.DatetimeIndex(self.asset.index)
         self.asset.columns = [str(col) for col in self.asset.columns]
-
         if isinstance(self.frequency, str):
-            self.asset = self.asset.apply(pd.to_numeric)
-            self.asset = self.asset.resample(self.frequency).last()
-            self.asset = self.asset.dropna()
-            self.date = self.asset.index
-            
-        if not self.indicator.empty:
-            self.indicator.index = pd.DatetimeIndex(self.indicator.index)
-            self.indicator.columns = [
-                str(col) for col in self.indicator.columns
-            ]
+            self.asset = _to_numeric(self.asset)
+            if not _is_binned(self.asset.index, self.frequency):
+                self.asset = self.asset.resample(self.frequency).last()
 
+        indicator = None
+        if not self.indicator.empty:
+            indicator = self.indicator
+            indicator.index = pd.DatetimeIndex(indicator.index)
+            indicator.columns = [str(col) for col in indicator.columns]
             if isinstance(self.frequency, str):
-                self.indicator = self.indicator.apply(pd.to_numeric)
-                self.indicator = self.indicator.resample(self.frequency).last()
-                self.indicator = self.indicator.dropna()
-
-            self.date = sorted(
-                list(set(self.asset.index).intersection(self.indicator.index))
-            )
-            self.indicator = self.indicator.loc[
-                self.indicator.index.isin(self.date)
-            ].replace({0: 0.000001}).sort_index()
-        
-        self.asset = self.asset.loc[
-            self.asset.index.isin(self.date)
-        ].sort_index()
+                indicator = _to_numeric(indicator)
+                if not _is_binned(indicator.index, self.frequency):
+                    indicator = indicator.resample(self.frequency).last()
+            elif not indicator.index.is_monotonic_increasing:
+                indicator = indicator.sort_index()
+        if not isinstance(self.frequency, str) and not self.asset.index.is_monotonic_increasing:
+            self.asset = self.asset.sort_index()
+
+        self.asset, indicator, self.date = _align_frames(self.asset, indicator, self.align)
+        if indicator is not None:
+            self.indicator = indicator
         return True
 
 
-def getDataTable(params):
+ALIGN_POLICIES = ['inner', 'asset', 'outer']
+
+
+def _to_numeric(frame):
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in frame.dtypes):
+        return frame
+    return frame.apply(pd.to_numeric)
+
+
+def _complete_dates(frame):
+    return frame.index[frame.notnull().all(axis=1).values]
+
+
+def _take(frame, date):
+    '''
+    rows of `frame` at `date`, `date` is a subset of the sorted frame index,
+    no copy when they are the same
+    '''
+    if frame.index.equals(date):
+        return frame
+    rows = frame.index.asi8.searchsorted(date.asi8)
+    return frame.take(rows)
+
+
+def _take_ffill(frame, date):
+    '''
+    rows of `frame` at `date`, each column carries its last value forward,
+    NaN before the first value of a column
+    '''
+    values = frame.values.astype(np.float64, copy=False)
+    n = len(frame.index)
+    last = np.where(np.isnan(values), -1, np.arange(n)[:, None])
+    np.maximum.accumulate(last, axis=0, out=last)
+    rows = frame.index.asi8.searchsorted(date.asi8, side='right') - 1
+    source = np.where(rows[:, None] >= 0, last[np.maximum(rows, 0)], -1)
+    out = values[np.maximum(source, 0), np.arange(values.shape[1])[None, :]]
+    out[source < 0] = np.nan
+    return pd.DataFrame(out, index=date, columns=frame.columns)
+
+
+def _align_frames(asset, indicator, how='inner'):
+    '''
+    asset, indicator (pd.DataFrame): float frames sorted by date, indicator may be None
+    how (str):
+        'inner': dates where every asset and indicator has value (default)
+        'asset': dates where every asset has value, indicators forward-filled to them
+        'outer': dates where any asset or indicator has value, both forward-filled
+        dates before every series has a value are dropped
+    return asset, indicator, date, each frame is copied at most once,
+        indicator value 0 is replaced by 0.000001
+    '''
+    if how not in ALIGN_POLICIES:
+        raise RequirementNotMeetException('align should be one of %s\n' % ALIGN_POLICIES)
+
+    if indicator is None or indicator.empty:
+        date = _complete_dates(asset)
+        return _take(asset, date), indicator, date
+
+    if how == 'inner':
+        date = _complete_dates(asset).intersection(_complete_dates(indicator))
+        asset, indicator = _take(asset, date), _take(indicator, date)
+    elif how == 'asset':
+        date = _complete_dates(asset)
+        indicator = _take_ffill(indicator, date)
+        date = _complete_dates(indicator)
+        asset, indicator = _take(asset, date), _take(indicator, date)
+    else:
+        date = asset.index.union(indicator.index)
+        asset, indicator = _take_ffill(asset, date), _take_ffill(indicator, date)
+        keep = asset.notnull().all(axis=1).values & indicator.notnull().all(axis=1).values
+        date = date[keep]
+        asset, indicator = _take(asset, date), _take(indicator, date)
+
+    indicator.mask(indicator == 0, 0.000001, inplace=True)
+    return asset, indicator, date
+
+
+class DataTableCache(object):
+    '''
+    LRU cache of built DataTable, keyed by the content of `getDataTable` params
+    (name, frequency and a hash of each asset / indicator frame)
+
+    Args:
+        * maxsize (int): maximum number of DataTable kept
+        * max_bytes (int): maximum memory of all cached asset + indicator frames
+
+    cached DataTable is shared by every caller, treat it as read-only
+    '''
+    def __init__(self, maxsize=32, max_bytes=2 ** 30):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+        self._nbytes = OrderedDict()
+
+    @staticmethod
+    def _hash_frame(df):
+        if isinstance(df, pd.Series):
+            df = df.to_frame()
+        h = hashlib.sha1()
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        h.update(repr([
+            (str(col), str(dtype)) for col, dtype in df.dtypes.items()
+        ]).encode())
+        return h.hexdigest()
+
+    @classmethod
+    def key(cls, params):
+        '''
+        return hashable key of `getDataTable` params
+        '''
+        key = []
+        for field in ['asset', 'indicator']:
+            dictList = params.get(field) or []
+            if isinstance(dictList, dict):
+                dictList = [dictList]
+            key.append(tuple(
+                (str(d.get('name')), d.get('freq'), cls._hash_frame(d['df']))
+                for d in dictList
+            ))
+        key.append(params.get('align', 'inner'))
+        return tuple(key)
+
+    def get(self, key):
+        if key in self._tables:
+            self.hits += 1
+            self._tables.move_to_end(key)
+            return self._tables[key]
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def _sizeof(data_table):
+        nbytes = int(data_table.asset.memory_usage(index=True).sum())
+        if not data_table.indicator.empty:
+            nbytes += int(data_table.indicator.memory_usage(index=True).sum())
+        return nbytes
+
+    def put(self, key, data_table):
+        nbytes = self._sizeof(data_table)
+        if nbytes > self.max_bytes or self.maxsize <= 0:
+            return
+        self._tables[key] = data_table
+        self._nbytes[key] = nbytes
+        self._tables.move_to_end(key)
+        while len(self._tables) > self.maxsize or\
+                sum(self._nbytes.values()) > self.max_bytes:
+            oldest = next(iter(self._tables))
+            del self._tables[oldest]
+            del self._nbytes[oldest]
+
+    def clear(self):
+        self._tables.clear()
+        self._nbytes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._tables),
+            'maxsize': self.maxsize,
+            'nbytes': sum(self._nbytes.values()),
+            'max_bytes': self.max_bytes,
+        }
+
+
+class ResampleCache(DataTableCache):
+    '''
+    LRU cache of resampled series, keyed by (hash of the source frame, target frequency, aggregation),
+    so a series used at several frequencies is only resampled once for each of them
+
+    Args:
+        * maxsize (int): maximum number of resampled frames kept
+        * max_bytes (int): maximum memory of all cached frames
+
+    cached frames are shared by every caller, treat them as read-only
+    '''
+    def __init__(self, maxsize=1024, max_bytes=2 ** 30):
+        super(ResampleCache, self).__init__(maxsize=maxsize, max_bytes=max_bytes)
+
+    @staticmethod
+    def _sizeof(frame):
+        return int(frame.memory_usage(index=True).sum())
+
+    def resample(self, dfs, freq, digests=None):
+        '''
+        dfs (list of pd.DataFrame or pd.Series): source series, indexed by date
+        freq (str): pandas rule of `DataTable.set_frequency`
+        digests (list of str): optional hash of each of `dfs`, e.g. from `DataTableCache.key`
+        return list of `dfs` resampled to `freq`, last value of each bin,
+            series not cached yet are resampled together
+        '''
+        dfs = [df.to_frame() if isinstance(df, pd.Series) else df for df in dfs]
+        digests = digests or [None] * len(dfs)
+        keys = [(h or self._hash_frame(df), freq, 'last') for df, h in zip(dfs, digests)]
+        frames = [self.get(key) for key in keys]
+        missing = [i for i, frame in enumerate(frames) if frame is None]
+        if missing:
+            for i, frame in zip(missing, _resample_all([dfs[i] for i in missing], freq)):
+                frames[i] = frame
+                self.put(keys[i], frame)
+        return frames
+
+
+def _resample_all(dfs, freq):
+    '''
+    resample `dfs` in one pass, return one frame for each of them,
+    on the bins from its first to its last value
+    '''
+    binned = pd.concat(dfs, axis=1)
+    binned = _to_numeric(binned)
+    if not isinstance(binned.index, pd.DatetimeIndex):
+        binned.index = pd.DatetimeIndex(binned.index)
+    binned = binned.resample(freq).last()
+    notnull = binned.notnull().values
+
+    frames = []
+    start = 0
+    for df in dfs:
+        end = start + df.shape[1]
+        rows = np.flatnonzero(notnull[:, start:end].any(axis=1))
+        first, last = (rows[0], rows[-1] + 1) if len(rows) else (0, 0)
+        frames.append(binned.iloc[first:last, start:end])
+        start = end
+    return frames
+
+
+def _is_binned(index, freq):
+    '''
+    True if every date of `index` is a distinct bin label of `freq`,
+    resampling it again only adds empty bins
+    '''
+    if freq not in StreamBlock.PERIOD or not isinstance(index, pd.DatetimeIndex):
+        return False
+    if not (index.is_monotonic_increasing and index.is_unique):
+        return False
+    labels = index.to_period(StreamBlock.PERIOD[freq]).to_timestamp(
+        how=StreamBlock.LABEL.get(freq, 'start')
+    ).normalize()
+    return labels.equals(index)
+
+
+class StreamBlock(object):
+    '''
+    float64 block (date x series) built from chunks of series,
+    each chunk is resampled to `freq` when it arrives and written into its rows,
+    so only the resampled values are kept
+
+    Args:
+        * freq (str): pandas rule of `DataTable.set_frequency`, e.g. 'D', 'W-Mon', 'MS'
+        * rows, columns (int): initial capacity, doubled when exceeded
+
+    chunks of the same series should come in time order
+    '''
+    # period of each resample rule, consecutive bins have consecutive ordinals,
+    # the resample label is the start of the period, or the end for weeks ending on Monday
+    PERIOD = {'D': 'D', 'W-Mon': 'W-MON', 'MS': 'M', 'QS': 'Q', 'YS': 'A'}
+    LABEL = {'W-Mon': 'end'}
+
+    def __init__(self, freq, rows=1024, columns=16):
+        if freq not in self.PERIOD:
+            raise RequirementNotMeetException('no such frequency %s\n' % freq)
+        self.freq = freq
+        self.names = []
+        self._column = {}
+        self._last = {}
+        self._origin = None
+        self._nrows = 0
+        self._values = np.full((max(rows, 1), max(columns, 1)), np.nan, order='F')
+
+    def _grow(self, rows, columns, shift=0):
+        capacity, width = self._values.shape
+        if rows <= capacity and columns <= width and shift == 0:
+            return
+        new_rows = max(rows, capacity * 2) if rows > capacity else capacity
+        new_cols = max(columns, width * 2) if columns > width else width
+        values = np.full((new_rows, new_cols), np.nan, order='F')
+        used = len(self.names)
+        values[shift:shift + self._nrows, :used] = self._values[:self._nrows, :used]
+        self._values = values
+
+    def _column_of(self, name):
+        if name not in self._column:
+            self._grow(self._nrows, len(self.names) + 1)
+            self._column[name] = len(self.names)
+            self.names.append(name)
+        return self._column[name]
+
+    def _row_of(self, first, last):
+        '''
+        first, last (int): period ordinals of a chunk
+        return row of `first`, rows before the block shift the block down
+        '''
+        if self._origin is None:
+            self._origin = first
+        if first < self._origin:
+            shift = self._origin - first
+            self._grow(self._nrows + shift, len(self.names), shift=shift)
+            self._origin = first
+            self._nrows += shift
+        end = last - self._origin + 1
+        self._grow(end, len(self.names))
+        self._nrows = max(self._nrows, end)
+        return first - self._origin
+
+    def append(self, name, chunk):
+        '''
+        name (str): series name
+        chunk (pd.Series): values indexed by date
+        '''
+        name = str(name)
+        if chunk.empty:
+            return
+        chunk = pd.to_numeric(chunk)
+        chunk.index = pd.DatetimeIndex(chunk.index)
+        if not chunk.index.is_monotonic_increasing:
+            chunk = chunk.sort_index()
+        if name in self._last and chunk.index[0] < self._last[name]:
+            raise RequirementNotMeetException('chunks of %s are not in time order\n' % name)
+        self._last[name] = chunk.index[-1]
+
+        binned = chunk.resample(self.freq).last()
+        ordinal = binned.index.to_period(self.PERIOD[self.freq]).asi8
+        col = self._column_of(name)
+        start = self._row_of(ordinal[0], ordinal[-1])
+        end = start + len(binned)
+
+        values = binned.values.astype(np.float64)
+        notnull = ~np.isnan(values)
+        # the first bin may continue the last bin of the previous chunk
+        self._values[start:end, col][notnull] = values[notnull]
+
+    def frame(self):
+        '''
+        return DataFrame on the block without copy, bins without data are all NaN
+        '''
+        index = pd.DatetimeIndex([])
+        if self._origin is not None:
+            index = pd.PeriodIndex(
+                ordinal=np.arange(self._origin, self._origin + self._nrows),
+                freq=self.PERIOD[self.freq]
+            ).to_timestamp(how=self.LABEL.get(self.freq, 'start')).normalize()
+        return pd.DataFrame(
+            self._values[:self._nrows, :len(self.names)],
+            index=index, columns=list(self.names), copy=False
+        )
+
+
+def _is_stream(source):
+    if isinstance(source, dict):
+        return False
+    if isinstance(source, list) and all(isinstance(x, dict) for x in source):
+        return False
+    return True
+
+
+def _iter_chunks(source, chunksize):
+    '''
+    yield (name, pd.Series) from (name, chunk) pairs or csv paths,
+    a csv file is read `chunksize` rows at a time, date in the first column,
+    one value column is named after the file, otherwise after the columns
+    '''
+    if isinstance(source, (str, os.PathLike)):
+        source = [source]
+    for item in source:
+        if isinstance(item, (str, os.PathLike)):
+            stem = os.path.splitext(os.path.basename(str(item)))[0]
+            for chunk in pd.read_csv(item, index_col=0, parse_dates=True, chunksize=chunksize):
+                if len(chunk.columns) == 1:
+                    yield stem, chunk.iloc[:, 0]
+                else:
+                    for col in chunk.columns:
+                        yield col, chunk[col]
+        else:
+            name, chunk = item
+            if isinstance(chunk, pd.DataFrame):
+                if len(chunk.columns) != 1:
+                    raise RequirementNotMeetException('chunk of %s should have one column\n' % name)
+                chunk = chunk.iloc[:, 0]
+            yield name, chunk
+
+
+def _stream_table(params):
+    '''
+    DataTable from streamed asset and indicator, same result as the DataFrame inputs
+    '''
+    data_table = DataTable()
+    data_table.frequency = [params.get('freq', 'D')]
+    data_table.set_frequency()
+    data_table.align = params.get('align', 'inner')
+    chunksize = params.get('chunksize', 100000)
+
+    frames = {'indicator': None}
+    for field in ['asset', 'indicator']:
+        if not params.get(field):
+            continue
+        block = StreamBlock(data_table.frequency, rows=params.get('rows', 1024))
+        for name, chunk in _iter_chunks(params[field], chunksize):
+            block.append(name, chunk)
+        frames[field] = block.frame()
+
+    asset, indicator, date = _align_frames(
+        frames['asset'], frames['indicator'], data_table.align
+    )
+    if indicator is not None:
+        data_table.indicator = indicator
+    data_table.asset = asset
+    data_table.date = date
+    data_table.use_id = {
+        'asset': list(asset.columns),
+        'indicator': list(indicator.columns) if indicator is not None else None
+    }
+    return data_table
+
+
+# on-disk layout of a stored DataTable (one directory):
+#
+#     manifest.json     version, use_id, frequency, asset / indicator columns
+#     date.npy          int64 epoch ns, the aligned dates
+#     asset.npy         float64 (date x asset), column-major
+#     indicator.npy     float64 (date x indicator), column-major, if any
+TABLE_VERSION = 1
+TABLE_MANIFEST = 'manifest.json'
+
+
+def saveDataTable(data_table, path):
+    '''
+    write a built DataTable as .npy files and a manifest
+    args:
+        data_table (DataTable or dict): DataTable, or params of `getDataTable`
+        path (str): directory, created if not exists
+    '''
+    data_table = getDataTable(data_table)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    date = pd.DatetimeIndex(data_table.asset.index)
+    np.save(os.path.join(path, 'date.npy'), date.values.astype('datetime64[ns]').astype(np.int64))
+    np.save(os.path.join(path, 'asset.npy'), np.asfortranarray(data_table.asset.values, dtype=np.float64))
+    indicator = None
+    if not data_table.indicator.empty:
+        if not data_table.indicator.index.equals(date):
+            raise RequirementNotMeetException('asset and indicator should have the same dates\n')
+        np.save(os.path.join(path, 'indicator.npy'), np.asfortranarray(data_table.indicator.values, dtype=np.float64))
+        indicator = [str(col) for col in data_table.indicator.columns]
+
+    manifest = {
+        'version': TABLE_VERSION,
+        'use_id': data_table.use_id,
+        'frequency': data_table.frequency,
+        'asset': [str(col) for col in data_table.asset.columns],
+        'indicator': indicator,
+    }
+    with open(os.path.join(path, TABLE_MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    return True
+
+
+def _load_table(path, mmap=True):
+    with open(os.path.join(path, TABLE_MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != TABLE_VERSION:
+        raise RequirementNotMeetException('unknown data table version %s\n' % manifest.get('version'))
+    mmap_mode = 'r' if mmap else None
+
+    date = pd.DatetimeIndex(np.load(os.path.join(path, 'date.npy')).astype('datetime64[ns]'))
+    data_table = DataTable()
+    data_table.use_id = manifest['use_id']
+    data_table.frequency = manifest['frequency']
+    data_table.date = date
+    data_table.asset = pd.DataFrame(
+        np.load(os.path.join(path, 'asset.npy'), mmap_mode=mmap_mode),
+        index=date, columns=manifest['asset'], copy=False
+    )
+    if manifest['indicator'] is not None:
+        data_table.indicator = pd.DataFrame(
+            np.load(os.path.join(path, 'indicator.npy'), mmap_mode=mmap_mode),
+            index=date, columns=manifest['indicator'], copy=False
+        )
+    data_table._stored = (path, mmap, data_table.asset, data_table.indicator)
+    return data_table
+
+
+def loadDataTable(path, mmap=True):
+    '''
+    args:
+        path (str): directory written by `saveDataTable`
+        mmap (bool): memory-map the matrices, read-only and shared between processes
+    return DataTable, `check_validation` is not run again
+    '''
+    return _load_table(path, mmap=mmap)
+
+
+def _fetch_inputs(params):
+    '''
+    return params with `df` of the asset / indicator dicts fetched from params['source']
+    '''
+    source = params['source']
+    if not isinstance(source, AsyncDataSource):
+        source = AsyncDataSource(source)
+    params = dict(params)
+    fields = {}
+    for field in ['asset', 'indicator']:
+        dictList = params.get(field) or []
+        fields[field] = [dictList] if isinstance(dictList, dict) else list(dictList)
+
+    missing = [
+        (field, i) for field, dictList in fields.items()
+        for i, d in enumerate(dictList) if d.get('df') is None
+    ]
+    records = source.fetch_all([
+        {'id': fields[field][i].get('id', fields[field][i].get('name'))} for field, i in missing
+    ])
+    for (field, i), record in zip(missing, records):
+        d = fields[field][i]
+        fields[field][i] = dict(d, df=record['data'], freq=d.get('freq') or record['info']['frequency'])
+    for field, dictList in fields.items():
+        if params.get(field):
+            params[field] = dictList
+    return params
+
+
+table_cache = DataTableCache()
+resample_cache = ResampleCache()
+
+
+@traced('getDataTable', 'data')
+def getDataTable(params, use_cache=True):
     '''
     args:
         asset (list of dict): backtesting asset
@@ -81,62 +630,108 @@ def getDataTable(params):
     example:
         params = {
             'asset': [{'name': 2, 'df': df, 'freq': 'M'}, ...],
-            'indicator': [{'name': 2, 'df': df, 'freq': 'M'}, ...]
+            'indicator': [{'name': 2, 'df': df, 'freq': 'M'}, ...],
+            'align': 'inner',   # optional, 'inner', 'asset' or 'outer', see `_align_frames`
         }
+        use_cache (bool): reuse DataTable built from the same inputs, 
+            and series already resampled to the same frequency,
+            see `table_cache.info()` and `resample_cache.info()` for hits and misses
+    streaming:
+        asset, indicator can also be an iterable / generator of (name, chunk)
+        or csv paths, each chunk is resampled when it arrives, see `StreamBlock`
+        params = {
+            'asset': ((name, chunk) for ...) or ['a.csv', 'b.csv'],
+            'indicator': ...,
+            'freq': 'D',            # frequency of all streamed series
+            'chunksize': 100000,    # optional, rows read from csv at a time
+            'rows': 1024,           # optional, initial rows of the block
+        }
+        streamed inputs are read once and never cached
+    data source:
+        dicts without `df` are fetched by `id` (default `name`) from params['source'],
+        see `backtest_tools.source`, e.g. a `CachedDataSource`
+        params = {
+            'asset': [{'name': 2}, ...],
+            'indicator': [{'name': 'cpi', 'id': 7, 'freq': 'M'}, ...],  # freq defaults to the source's
+            'source': CachedDataSource(SQLiteDataSource('series.db'), 'cache'),
+        }
+    params can also be a directory written by `saveDataTable`, see `loadDataTable`
     return DataTable object
     '''
+    if isinstance(params, DataTable):
+        return params
+    if isinstance(params, (str, os.PathLike)):
+        return loadDataTable(params)
+    if isinstance(params, dict) and params.get('asset') is not None\
+            and _is_stream(params['asset']):
+        return _stream_table(params)
 
     _check_params(
         params=params, 
         list_to_check=['asset']
     )
+    if params.get('source') is not None:
+        params = _fetch_inputs(params)
+
+    key = None
+    if use_cache:
+        key = table_cache.key(params)
+        data_table = table_cache.get(key)
+        if data_table is not None:
+            return data_table
 
     data_table = DataTable()
-    asset, indicator, freq = [], [], []
-    ass_name, ind_name = [], []
+    freq = []
 
     assetList = params['asset']
     if isinstance(assetList, dict):
         assetList = [params['asset']]
-
-    for asset_dict in assetList:
-        _check_params(
-            params=asset_dict, 
-            list_to_check=['name', 'df', 'freq']
-        )
-        asset.append(asset_dict['df'])
-        freq.append(asset_dict['freq'])
-        ass_name.append(str(asset_dict['name']))
-    asset = pd.concat(asset, axis=1)
-    asset.columns = ass_name
-
+    indicatorList = []
     if params.get('indicator'):
         if isinstance(params['indicator'], list):
             indicatorList = params['indicator']
         else:
             indicatorList = [params['indicator']]
 
-        for ind_dict in indicatorList:
-            _check_params(
-                params=ind_dict, 
-                list_to_check=['name', 'df', 'freq']
-            )
-            indicator.append(ind_dict['df'])
-            freq.append(ind_dict['freq'])
-            ind_name.append(str(ind_dict['name']))
-        data_table.indicator = pd.concat(indicator, axis=1)
+    for d in list(assetList) + list(indicatorList):
+        _check_params(
+            params=d, 
+            list_to_check=['name', 'df', 'freq']
+        )
+        freq.append(d['freq'])
+    data_table.frequency = freq
+    data_table.set_frequency()
+
+    # resampled series are cached on their own, so they are reused by tables of other series,
+    # without cache the whole table is resampled by `check_validation`
+    digests = [[None] * len(assetList), [None] * len(indicatorList)]
+    if key is not None:
+        digests = [[k[2] for k in key[0]], [k[2] for k in key[1]]]
+
+    def frames(dictList, digest):
+        if not use_cache:
+            return [d['df'] for d in dictList]
+        return resample_cache.resample([d['df'] for d in dictList], data_table.frequency, digest)
+
+    ass_name = [str(d['name']) for d in assetList]
+    asset = pd.concat(frames(assetList, digests[0]), axis=1)
+    asset.columns = ass_name
+
+    ind_name = None
+    if indicatorList:
+        ind_name = [str(d['name']) for d in indicatorList]
+        data_table.indicator = pd.concat(frames(indicatorList, digests[1]), axis=1)
         data_table.indicator.columns = ind_name
-    else:
-        ind_name = None
 
     data_table.use_id = {
         'asset': ass_name, 
         'indicator': ind_name
     }
-    data_table.frequency = freq
+    data_table.align = params.get('align', 'inner')
     data_table.asset = asset
     data_table.date = asset.index
 
-    data_table.set_frequency()
     data_table.check_validation()
+    if use_cache:
+        table_cache.put(key, data_table)
     return data_table
\ No newline at end of file
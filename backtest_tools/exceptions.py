@@ -1,5 +1,8 @@
 class RequirementNotMeetException(Exception):
     pass
 
+class EngineNotSupportedException(RequirementNotMeetException):
+    pass
+
 class RuntimeWarning(Warning):
     pass
\ No newline at end of file
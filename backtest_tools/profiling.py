@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from bt.core import Algo
+
+
+# trace receiving the records, None when tracing is disabled
+_active = None
+
+
+class Trace(object):
+    '''
+    records of traced stages
+
+    Attributes:
+        * events (list): one dict for each call of a traced stage
+            name, category, start (s, from trace start), seconds, alloc_bytes
+        * stats (dict): name -> calls, seconds, max_seconds, alloc_bytes, category
+            per-bar algos are only counted in stats, not in events
+    '''
+    def __init__(self, allocations=False):
+        self.allocations = allocations
+        self.events = []
+        self.stats = {}
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    def _record(self, name, category, start, seconds, alloc, aggregate):
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = {
+                'category': category, 'calls': 0, 'seconds': 0.,
+                'max_seconds': 0., 'alloc_bytes': 0 if self.allocations else None
+            }
+        stat['calls'] += 1
+        stat['seconds'] += seconds
+        stat['max_seconds'] = max(stat['max_seconds'], seconds)
+        if alloc is not None:
+            stat['alloc_bytes'] += alloc
+        if not aggregate:
+            self.events.append({
+                'name': name, 'category': category,
+                'start': start - self._origin, 'seconds': seconds,
+                'alloc_bytes': alloc, 'tid': threading.get_ident(),
+            })
+
+    @contextmanager
+    def span(self, name, category='function', aggregate=False):
+        mem = tracemalloc.get_traced_memory()[0] if self.allocations else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            alloc = None
+            if mem is not None:
+                alloc = tracemalloc.get_traced_memory()[0] - mem
+            self._record(name, category, start, seconds, alloc, aggregate)
+
+    @contextmanager
+    def activate(self):
+        '''
+        record into this trace within the block, e.g. for `getReport`
+        '''
+        global _active
+        previous = _active
+        _active = self
+        started = False
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started = True
+        try:
+            yield self
+        finally:
+            if started:
+                tracemalloc.stop()
+            _active = previous
+
+    def summary(self):
+        return {
+            name: dict(stat) for name, stat in
+            sorted(self.stats.items(), key=lambda x: -x[1]['seconds'])
+        }
+
+    def to_json(self, path=None):
+        data = {'stats': self.summary(), 'events': self.events}
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(data, f, indent=2)
+        return data
+
+    def to_chrome(self, path=None):
+        '''
+        chrome://tracing or Perfetto format, times in microseconds
+        '''
+        pid = os.getpid()
+        data = {
+            'traceEvents': [
+                {
+                    'name': e['name'], 'cat': e['category'], 'ph': 'X',
+                    'ts': e['start'] * 1e6, 'dur': e['seconds'] * 1e6,
+                    'pid': pid, 'tid': e['tid'],
+                    'args': {} if e['alloc_bytes'] is None else {'alloc_bytes': e['alloc_bytes']},
+                }
+                for e in self.events
+            ],
+            'displayTimeUnit': 'ms',
+            'otherData': {'stats': self.summary()},
+        }
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(data, f)
+        return data
+
+
+def enabled():
+    return _active is not None
+
+
+def current():
+    return _active
+
+
+@contextmanager
+def tracing(allocations=False):
+    '''
+    with tracing() as trace:
+        res = runPortfolio(params)
+        res['result'].getReport()
+    trace.to_chrome('trace.json')
+
+    allocations (bool): also record net allocated bytes with tracemalloc, slower
+    '''
+    trace = Trace(allocations=allocations)
+    with trace.activate():
+        yield trace
+
+
+def traced(name=None, category='function', aggregate=False):
+    '''
+    decorator recording each call when tracing is enabled,
+    only one global lookup when it is not
+    '''
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _active
+            if trace is None:
+                return func(*args, **kwargs)
+            with trace.span(label, category, aggregate):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedAlgo(Algo):
+    '''
+    wrap a bt Algo to count calls and time of each bar
+    '''
+    def __init__(self, algo, name=None):
+        super(TracedAlgo, self).__init__(name=name or algo.name)
+        self.algo = algo
+        if hasattr(algo, 'run_always'):
+            self.run_always = algo.run_always
+
+    def __call__(self, target):
+        trace = _active
+        if trace is None:
+            return self.algo(target)
+        with trace.span('algo.' + self.name, 'algo', aggregate=True):
+            return self.algo(target)
@@ -0,0 +1,513 @@
+import os
+import json
+import time
+import shutil
+import random
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from .helper import _check_params
+from .exceptions import RequirementNotMeetException
+from .profiling import traced
+
+
+# a source returns one record for each `stat_param` ({'id': ...}) of `Portfolio.indicator`,
+# same as the record of ChartStat.formatter:
+#     {'id': id, 'info': {'frequency': 'D'}, 'data': pd.DataFrame indexed by date}
+
+
+class DataSource(object):
+    '''
+    interface of the data source of `Portfolio.train`
+
+    subclasses implement `fetch`, blocking sources are run in threads by `AsyncDataSource`,
+    sources with their own asyncio client can override `afetch` instead
+    '''
+    def fetch(self, stat_param):
+        raise NotImplementedError
+
+    async def afetch(self, stat_param):
+        return self.fetch(stat_param)
+
+    def fetch_since(self, stat_param, start):
+        '''
+        record of the rows after `start`,
+        sources able to query by date override it
+        '''
+        record = self.fetch(stat_param)
+        data = record['data']
+        return dict(record, data=data.loc[data.index > start])
+
+    def fetch_all(self, stat_params):
+        '''
+        return records in the order of `stat_params`
+        '''
+        return [self.fetch(stat_param) for stat_param in stat_params]
+
+
+class FileDataSource(DataSource):
+    '''
+    one csv file for each series, `<root>/<id>.csv`, dates in the first column,
+    and an optional `<root>/<id>.json` of its info, e.g. {"frequency": "M"}
+
+    Args:
+        * root (str): directory of the files
+        * frequency (str): frequency of series without info file
+    '''
+    def __init__(self, root, frequency='D'):
+        self.root = root
+        self.frequency = frequency
+
+    def _path(self, ID, ext):
+        return os.path.join(self.root, '%s.%s' % (ID, ext))
+
+    def fetch(self, stat_param):
+        _check_params(stat_param, ['id'])
+        ID = stat_param['id']
+        path = self._path(ID, 'csv')
+        if not os.path.exists(path):
+            raise RequirementNotMeetException('no data of %s in %s\n' % (ID, self.root))
+        info = {'frequency': self.frequency}
+        if os.path.exists(self._path(ID, 'json')):
+            with open(self._path(ID, 'json')) as f:
+                info.update(json.load(f))
+        data = pd.read_csv(path, index_col=0, parse_dates=True)
+        return {'id': ID, 'info': info, 'data': data}
+
+    def save(self, ID, df, frequency=None):
+        '''
+        write a series, e.g. to build a test source
+        '''
+        os.makedirs(self.root, exist_ok=True)
+        df.to_csv(self._path(ID, 'csv'))
+        if frequency is not None:
+            with open(self._path(ID, 'json'), 'w') as f:
+                json.dump({'frequency': frequency}, f)
+
+
+class SQLiteDataSource(DataSource):
+    '''
+    series in one SQLite file, tables
+        series (id, date, value), info (id, frequency)
+    each fetch opens its own connection, so it can run in many threads
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE IF NOT EXISTS series (id TEXT, date TEXT, value REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS series_id ON series (id, date)')
+        conn.execute('CREATE TABLE IF NOT EXISTS info (id TEXT PRIMARY KEY, frequency TEXT)')
+        return conn
+
+    def _query(self, stat_param, start=None):
+        _check_params(stat_param, ['id'])
+        ID = stat_param['id']
+        sql = 'SELECT date, value FROM series WHERE id = ?'
+        args = (str(ID),)
+        if start is not None:
+            sql += ' AND date > ?'
+            args += (pd.Timestamp(start).isoformat(),)
+        conn = self._connect()
+        try:
+            info = conn.execute('SELECT frequency FROM info WHERE id = ?', (str(ID),)).fetchone()
+            if info is None:
+                raise RequirementNotMeetException('no data of %s in %s\n' % (ID, self.path))
+            data = pd.read_sql_query(
+                sql + ' ORDER BY date', conn, params=args,
+                index_col='date', parse_dates=['date']
+            )
+        finally:
+            conn.close()
+        data.index.name = None
+        return {'id': ID, 'info': {'frequency': info[0]}, 'data': data}
+
+    def fetch(self, stat_param):
+        return self._query(stat_param)
+
+    def fetch_since(self, stat_param, start):
+        return self._query(stat_param, start)
+
+    def save(self, ID, df, frequency='D'):
+        '''
+        write a series, replace the one of the same id
+        '''
+        if isinstance(df, pd.DataFrame):
+            df = df.iloc[:, 0]
+        rows = [
+            (str(ID), pd.Timestamp(date).isoformat(), float(value))
+            for date, value in df.items()
+        ]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM series WHERE id = ?', (str(ID),))
+                conn.executemany('INSERT INTO series VALUES (?, ?, ?)', rows)
+                conn.execute('INSERT OR REPLACE INTO info VALUES (?, ?)', (str(ID), frequency))
+        finally:
+            conn.close()
+
+
+class AsyncDataSource(DataSource):
+    '''
+    fetch all series of `Portfolio.train` concurrently with asyncio
+
+    Args:
+        * source (DataSource): blocking `fetch` is run in a thread pool,
+            or its `afetch` is awaited when the source overrides it
+        * max_concurrency (int): maximum fetches in flight
+        * retries (int): retries of a failed fetch, `RequirementNotMeetException` is not retried
+        * backoff (float): seconds before the first retry, doubled for each retry, with jitter
+        * timeout (float): optional seconds of each attempt
+
+    source = AsyncDataSource(SQLiteDataSource('series.db'), max_concurrency=8)
+    Portfolio(asset=[1, 2], source=source).train()
+    '''
+    def __init__(self, source, max_concurrency=8, retries=2, backoff=0.5, timeout=None):
+        if max_concurrency < 1:
+            raise RequirementNotMeetException('max_concurrency should be at least 1\n')
+        self.source = source
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def fetch(self, stat_param):
+        return self.source.fetch(stat_param)
+
+    def fetch_since(self, stat_param, start):
+        return self.source.fetch_since(stat_param, start)
+
+    def _native(self):
+        return type(self.source).afetch is not DataSource.afetch
+
+    async def _attempt(self, stat_param, executor):
+        if self._native():
+            call = self.source.afetch(stat_param)
+        else:
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(executor, self.source.fetch, stat_param)
+        if self.timeout is None:
+            return await call
+        return await asyncio.wait_for(call, self.timeout)
+
+    async def _fetch(self, stat_param, semaphore, executor):
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    return await self._attempt(stat_param, executor)
+            except RequirementNotMeetException:
+                raise
+            except Exception:
+                if attempt == self.retries:
+                    raise
+            # wait outside the semaphore, other series keep fetching
+            await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    async def afetch_all(self, stat_params):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return await asyncio.gather(*[
+                self._fetch(stat_param, semaphore, executor) for stat_param in stat_params
+            ])
+
+    async def afetch(self, stat_param):
+        return (await self.afetch_all([stat_param]))[0]
+
+    @traced('AsyncDataSource.fetch_all', 'data')
+    def fetch_all(self, stat_params):
+        '''
+        return records in the order of `stat_params`,
+        also works when called from a running event loop, e.g. in Jupyter
+        '''
+        coro = self.afetch_all(list(stat_params))
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        # the loop of this thread is busy, run on a loop of another thread
+        with ThreadPoolExecutor(max_workers=1) as runner:
+            return runner.submit(asyncio.run, coro).result()
+
+
+class CachedDataSource(DataSource):
+    '''
+    persistent local cache of the series of `source`, keyed by id and frequency,
+    one directory of columnar arrays for each series under `root`:
+        date.npy (int64 ns), values.npy (float64, date x column), meta.json
+
+    a series older than `ttl` is refreshed by appending the rows after its last date,
+    rows already cached are not fetched again,
+    a fetch without frequency matches only an id cached at a single frequency
+    series are read, written and fetched concurrently,
+    threads asking for the same missing or stale series wait for a single fetch
+
+    Args:
+        * source (DataSource): the source to cache
+        * root (str): cache directory, kept across processes
+        * ttl (float): seconds a series is fresh, None never refresh
+        * max_bytes (int): maximum size of the arrays, least recently used series are evicted
+
+    source = CachedDataSource(SQLiteDataSource('series.db'), '~/.cache/series', ttl=12 * 3600)
+    Portfolio(asset=[1, 2], source=source).train()
+    source.info()
+    '''
+    def __init__(self, source, root, ttl=24 * 3600, max_bytes=2 ** 30):
+        self.source = source
+        self.root = os.path.expanduser(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.appended_rows = 0
+        self.evictions = 0
+        # the lock covers the in-memory index and the counters only,
+        # files are read and written outside, renames of series directories hold `_swap_lock`
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._entries = {}
+        # (id, frequency) -> Event of the thread fetching it from the source
+        self._inflight = {}
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name, 'meta.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    meta = json.load(f)
+                self._entries[(meta['id'], meta['frequency'])] = meta
+        self._delete(self._evict_size())
+
+    @staticmethod
+    def _dirname(ID, frequency):
+        return hashlib.sha1(repr((str(ID), frequency)).encode()).hexdigest()[:20]
+
+    def _find(self, ID, frequency=None):
+        '''
+        without frequency, only a series cached at a single frequency matches,
+        several frequencies of the id are ambiguous and fetched from the source again
+        '''
+        if frequency is not None:
+            return self._entries.get((str(ID), frequency))
+        found = [meta for (key, _), meta in self._entries.items() if key == str(ID)]
+        return found[0] if len(found) == 1 else None
+
+    def _touch(self, meta):
+        '''
+        write the access time back to meta.json, so the eviction order holds across processes
+        '''
+        meta['accessed'] = time.time()
+        path = os.path.join(self.root, meta['dir'], 'meta.json')
+        tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with self._swap_lock:
+            with self._lock:
+                # refreshed or evicted meanwhile, its meta.json is not this one anymore
+                if self._entries.get((meta['id'], meta['frequency'])) is not meta:
+                    return
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(meta, f)
+                os.replace(tmp, path)
+            except OSError:
+                # removed by another process, the next fetch is a miss
+                pass
+
+    def _read(self, meta):
+        '''
+        return the record, None if the files are gone, e.g. evicted meanwhile
+        '''
+        path = os.path.join(self.root, meta['dir'])
+        try:
+            index = pd.DatetimeIndex(np.load(os.path.join(path, 'date.npy')))
+            values = np.load(os.path.join(path, 'values.npy'))
+        except (OSError, ValueError):
+            return None
+        data = pd.DataFrame(values, index=index, columns=meta['columns'])
+        return {'id': meta['record_id'], 'info': dict(meta['info']), 'data': data}
+
+    def _write(self, record, fetched_at):
+        '''
+        write the record to a new directory and swap it in, readers never see half a series
+        '''
+        ID, info, data = record['id'], record['info'], record['data']
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+        frequency = info.get('frequency')
+        dirname = self._dirname(ID, frequency)
+        path = os.path.join(self.root, dirname)
+        tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        date = pd.DatetimeIndex(data.index).asi8
+        values = np.asarray(data.apply(pd.to_numeric).values, dtype=np.float64)
+        np.save(os.path.join(tmp, 'date.npy'), date)
+        np.save(os.path.join(tmp, 'values.npy'), values)
+        meta = {
+            'id': str(ID), 'record_id': ID, 'frequency': frequency, 'info': info,
+            'columns': [str(col) for col in data.columns], 'dir': dirname,
+            'rows': len(date), 'nbytes': int(date.nbytes + values.nbytes),
+            'last_date': int(date[-1]) if len(date) else None,
+            'fetched_at': fetched_at, 'accessed': time.time(),
+        }
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        old = path + '.%d.%d.old' % (os.getpid(), threading.get_ident())
+        with self._swap_lock:
+            if os.path.exists(path):
+                os.rename(path, old)
+            os.rename(tmp, path)
+            with self._lock:
+                self._entries[(meta['id'], frequency)] = meta
+        shutil.rmtree(old, ignore_errors=True)
+        return meta
+
+    def _stale(self, meta):
+        return self.ttl is not None and time.time() - meta['fetched_at'] > self.ttl
+
+    def fetch(self, stat_param):
+        _check_params(stat_param, ['id'])
+        ID, frequency = stat_param['id'], stat_param.get('frequency')
+        key = (str(ID), frequency)
+        while True:
+            with self._lock:
+                meta = self._find(ID, frequency)
+                fresh = meta is not None and not self._stale(meta)
+                pending = None
+                if not fresh:
+                    pending = self._inflight.get(key)
+                    if pending is None:
+                        self._inflight[key] = threading.Event()
+            if fresh:
+                record = self._read(meta)
+                if record is not None:
+                    with self._lock:
+                        self.hits += 1
+                    self._touch(meta)
+                    return record
+                # the files are gone, forget the series and fetch it again
+                with self._lock:
+                    if self._entries.get((meta['id'], meta['frequency'])) is meta:
+                        del self._entries[(meta['id'], meta['frequency'])]
+                continue
+            if pending is not None:
+                # another thread is fetching the same series, read its result
+                pending.wait()
+                continue
+            try:
+                return self._update(stat_param, meta)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key).set()
+
+    def _update(self, stat_param, meta):
+        '''
+        fetch a missing series, or append the rows after the last date of a stale one
+        '''
+        record = self._read(meta) if meta is not None else None
+        if record is None:
+            record = self.source.fetch(stat_param)
+            self._write(record, time.time())
+            with self._lock:
+                self.misses += 1
+                removed = self._evict_size()
+            self._delete(removed)
+            return record
+
+        fetched_at = time.time()
+        since = pd.Timestamp(meta['last_date']) if meta['last_date'] is not None else pd.Timestamp.min
+        new = self.source.fetch_since(stat_param, since)
+        data = new['data']
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+        data = data.loc[pd.DatetimeIndex(data.index) > since]
+        if not data.empty:
+            data.columns = record['data'].columns
+            record['data'] = pd.concat([record['data'], data.apply(pd.to_numeric)])
+        record['info'] = dict(record['info'], **new['info'])
+        self._write(record, fetched_at)
+        with self._lock:
+            self.refreshes += 1
+            self.appended_rows += len(data)
+            removed = self._evict_size()
+        self._delete(removed)
+        return record
+
+    def fetch_since(self, stat_param, start):
+        record = self.fetch(stat_param)
+        data = record['data']
+        return dict(record, data=data.loc[data.index > start])
+
+    def _remove(self, key):
+        '''
+        drop a series from the index, with the lock held, return its directory
+        '''
+        meta = self._entries.pop(key)
+        self.evictions += 1
+        return meta['dir']
+
+    def _delete(self, dirnames):
+        '''
+        remove the directories of dropped series, unless written again meanwhile
+        '''
+        if not dirnames:
+            return
+        with self._swap_lock:
+            with self._lock:
+                used = set(meta['dir'] for meta in self._entries.values())
+            for dirname in dirnames:
+                if dirname not in used:
+                    shutil.rmtree(os.path.join(self.root, dirname), ignore_errors=True)
+
+    def _evict_size(self):
+        '''
+        with the lock held, drop the least recently used series over `max_bytes`,
+        return their directories
+        '''
+        entries = sorted(self._entries.items(), key=lambda x: x[1]['accessed'])
+        nbytes = sum(meta['nbytes'] for _, meta in entries)
+        removed = []
+        for key, meta in entries:
+            if nbytes <= self.max_bytes:
+                break
+            removed.append(self._remove(key))
+            nbytes -= meta['nbytes']
+        return removed
+
+    def evict(self):
+        '''
+        remove series older than `ttl`, then the least recently used ones over `max_bytes`
+        '''
+        with self._lock:
+            removed = [
+                self._remove(key) for key, meta in list(self._entries.items()) if self._stale(meta)
+            ]
+            removed += self._evict_size()
+        self._delete(removed)
+
+    def clear(self):
+        with self._lock:
+            removed = [self._remove(key) for key in list(self._entries)]
+            self.hits = self.misses = self.refreshes = 0
+            self.appended_rows = self.evictions = 0
+        self._delete(removed)
+
+    def info(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'appended_rows': self.appended_rows,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'nbytes': sum(meta['nbytes'] for meta in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+            }
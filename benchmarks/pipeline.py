@@ -0,0 +1,235 @@
+'''
+benchmark of the runPortfolio pipeline on synthetic data, no data source needed
+
+    getDataTable -> weigh_target -> composite -> bt Backtest.run -> getReport
+
+usage:
+    python benchmarks/pipeline.py --assets 10 --years 5 --actions 20 --output bench.json
+    python benchmarks/pipeline.py --compare bench.json --tolerance 0.2
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bt
+import uuid
+from bt.core import Strategy
+from bt.algos import run_always
+from bt.backtest import Backtest
+from backtest_tools.data import getDataTable
+from backtest_tools.backtest import strategy as algo_factory
+from backtest_tools.backtest.signal_engine import signal_cache
+from backtest_tools.backtest.portfolio import RunBacktest
+
+
+METHODS = [
+    ('trade_at_threshold', lambda rng: {'threshold': float(rng.uniform(40, 60)), 'n': int(rng.randint(1, 5)), 'sign': int(rng.choice([1, -1]))}),
+    ('continuous_growth', lambda rng: {'n': int(rng.randint(2, 5)), 'sign': int(rng.choice([1, -1]))}),
+    ('cumulative_return_threshold', lambda rng: {'threshold': float(rng.uniform(-0.05, 0.05)), 'n': int(rng.randint(2, 10)), 'sign': int(rng.choice([1, -1]))}),
+    ('ma_crossover_ma', lambda rng: {'ma1': int(rng.randint(3, 10)), 'ma2': int(rng.randint(10, 40)), 'sign': int(rng.choice([1, -1]))}),
+    ('ma_crossover_price', lambda rng: {'ma': int(rng.randint(5, 60)), 'sign': int(rng.choice([1, -1]))}),
+]
+
+
+def synthetic_prices(n_assets, n_days, seed=0, start='2000-01-03'):
+    '''
+    geometric random walk, one column for each asset, business days
+    '''
+    rng = np.random.RandomState(seed)
+    index = pd.bdate_range(start, periods=n_days)
+    returns = rng.normal(0.0003, 0.015, size=(n_days, n_assets))
+    prices = 100 * np.exp(np.cumsum(returns, axis=0))
+    return pd.DataFrame(prices, index=index, columns=range(n_assets))
+
+
+def synthetic_indicators(n_indicators, n_days, seed=1, start='2000-01-03'):
+    '''
+    mean reverting series around 50, one column for each indicator
+    '''
+    rng = np.random.RandomState(seed)
+    index = pd.bdate_range(start, periods=n_days)
+    values = np.empty((n_days, n_indicators))
+    values[0] = 50
+    shocks = rng.normal(0, 2, size=(n_days, n_indicators))
+    for i in range(1, n_days):
+        values[i] = values[i - 1] + 0.1 * (50 - values[i - 1]) + shocks[i]
+    return pd.DataFrame(values, index=index, columns=range(n_indicators))
+
+
+def synthetic_params(n_assets, years, n_actions, n_indicators=None, seed=0):
+    '''
+    return params of `runPortfolio` with synthetic asset and indicator data
+    '''
+    rng = np.random.RandomState(seed)
+    n_days = int(years * 252)
+    n_indicators = n_indicators or max(1, n_assets)
+    prices = synthetic_prices(n_assets, n_days, seed)
+    indicators = synthetic_indicators(n_indicators, n_days, seed + 1)
+
+    asset = [
+        {'name': 'a%d' % i, 'df': prices[[i]], 'freq': 'D'} for i in range(n_assets)
+    ]
+    indicator = [
+        {'name': 'i%d' % i, 'df': indicators[[i]], 'freq': 'D'} for i in range(n_indicators)
+    ]
+    action = []
+    for _ in range(n_actions):
+        method, make = METHODS[rng.randint(len(METHODS))]
+        action.append({
+            'asset_id': 'a%d' % rng.randint(n_assets),
+            'indicator_id': 'i%d' % rng.randint(n_indicators),
+            'method': method,
+            'strategy': str(rng.choice(['buy', 'sell', 'hold'])),
+            'params': make(rng),
+        })
+    return {
+        'data_table': {'asset': asset, 'indicator': indicator},
+        'strategy': [
+            {'class': 'run_daily', 'params': {}},
+            {'class': 'select_all', 'params': {}},
+            {'class': 'weigh_target', 'params': {'action': action}},
+            {'class': 'rebalance', 'params': {}},
+        ],
+    }
+
+
+class StageTimer(object):
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = {}
+
+    def run(self, name, func, *args, **kwargs):
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        out = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.stages.setdefault(name, []).append({'seconds': elapsed, 'peak_bytes': peak})
+        return out
+
+
+def build_strategy(data_table, strategy, weigh):
+    '''
+    same Strategy as `composite`, the weigh_target algo of its own stage is reused
+    '''
+    algos = []
+    for stra in strategy:
+        if stra['class'] == 'weigh_target':
+            algos.append(weigh)
+            continue
+        func = run_always(getattr(algo_factory, stra['class']))
+        algos.append(func(data_table=data_table, params=stra.get('params') or {}))
+    return Strategy(name=uuid.uuid4(), algos=algos, children=None)
+
+
+def run_once(params, timer):
+    # every repeat evaluates the signals, not the dates cached by the last one
+    signal_cache.clear()
+    data_table = timer.run('getDataTable', getDataTable, params['data_table'], use_cache=False)
+    weigh = timer.run(
+        'weigh_target', run_always(algo_factory.weigh_target), data_table, params['strategy'][2]['params']
+    )
+    # only the rest of the stack, weigh_target is timed above
+    comp = timer.run('composite', build_strategy, data_table, params['strategy'], weigh)
+    trade = Backtest(
+        comp, data_table.asset, initial_capital=1000000.0, progress_bar=False
+    )
+    result = timer.run('backtest', RunBacktest, trade)
+    timer.run('getReport', result.getReport)
+
+
+def summarize(stages):
+    summary = {}
+    for name, runs in stages.items():
+        seconds = [r['seconds'] for r in runs]
+        peaks = [r['peak_bytes'] for r in runs if r['peak_bytes'] is not None]
+        summary[name] = {
+            'median_seconds': float(np.median(seconds)),
+            'min_seconds': float(np.min(seconds)),
+            'peak_bytes': int(max(peaks)) if peaks else None,
+            'runs': len(runs),
+        }
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    '''
+    return list of stages slower than baseline by more than `tolerance`
+    '''
+    slower = []
+    for name, stat in summary.items():
+        base = baseline.get('stages', {}).get(name)
+        if base is None:
+            continue
+        ratio = stat['median_seconds'] / max(base['median_seconds'], 1e-9)
+        if ratio > 1 + tolerance:
+            slower.append({'stage': name, 'ratio': ratio})
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assets', type=int, default=5)
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--actions', type=int, default=20)
+    parser.add_argument('--indicators', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, faster and less intrusive')
+    parser.add_argument('--output', default=None, help='write results as json')
+    parser.add_argument('--compare', default=None, help='baseline json, exit 1 if any stage is slower')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    params = synthetic_params(args.assets, args.years, args.actions, args.indicators, args.seed)
+    timer = StageTimer(memory=not args.no_memory)
+    for _ in range(args.repeat):
+        run_once(params, timer)
+
+    results = {
+        'config': {
+            'assets': args.assets, 'years': args.years, 'actions': args.actions,
+            'indicators': args.indicators or args.assets, 'repeat': args.repeat,
+            'seed': args.seed, 'memory': not args.no_memory,
+        },
+        'environment': {
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'bt': getattr(bt, '__version__', None),
+        },
+        'stages': summarize(timer.stages),
+    }
+    results['total_median_seconds'] = sum(s['median_seconds'] for s in results['stages'].values())
+
+    for name, stat in results['stages'].items():
+        peak = '-' if stat['peak_bytes'] is None else '%.1f MB' % (stat['peak_bytes'] / 2 ** 20)
+        print('%-14s %10.4f s  %12s' % (name, stat['median_seconds'], peak))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(results['stages'], baseline, args.tolerance)
+        for s in slower:
+            print('regression: %s is %.2fx slower than baseline' % (s['stage'], s['ratio']))
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
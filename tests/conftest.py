@@ -0,0 +1,82 @@
+import os
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+warnings.filterwarnings('ignore')
+
+
+METHODS = [
+    ('trade_at_threshold', lambda rng: {'threshold': float(rng.uniform(40, 60)), 'n': int(rng.randint(1, 5)), 'sign': int(rng.choice([1, -1]))}),
+    ('continuous_growth', lambda rng: {'n': int(rng.randint(2, 5)), 'sign': int(rng.choice([1, -1]))}),
+    ('cumulative_return_threshold', lambda rng: {'threshold': float(rng.uniform(-0.05, 0.05)), 'n': int(rng.randint(2, 10)), 'sign': int(rng.choice([1, -1]))}),
+    ('ma_crossover_ma', lambda rng: {'ma1': int(rng.randint(3, 10)), 'ma2': int(rng.randint(10, 40)), 'sign': int(rng.choice([1, -1]))}),
+    ('ma_crossover_price', lambda rng: {'ma': int(rng.randint(5, 60)), 'sign': int(rng.choice([1, -1]))}),
+]
+
+
+def synthetic_prices(n_assets, n_days, seed=0, start='2000-01-03'):
+    '''
+    geometric random walk, one column for each asset, business days
+    '''
+    rng = np.random.RandomState(seed)
+    index = pd.bdate_range(start, periods=n_days)
+    returns = rng.normal(0.0003, 0.015, size=(n_days, n_assets))
+    return pd.DataFrame(100 * np.exp(np.cumsum(returns, axis=0)), index=index, columns=range(n_assets))
+
+
+def synthetic_indicators(n_indicators, n_days, seed=1, start='2000-01-03'):
+    '''
+    mean reverting series around 50, one column for each indicator
+    '''
+    rng = np.random.RandomState(seed)
+    index = pd.bdate_range(start, periods=n_days)
+    values = np.empty((n_days, n_indicators))
+    values[0] = 50
+    shocks = rng.normal(0, 2, size=(n_days, n_indicators))
+    for i in range(1, n_days):
+        values[i] = values[i - 1] + 0.1 * (50 - values[i - 1]) + shocks[i]
+    return pd.DataFrame(values, index=index, columns=range(n_indicators))
+
+
+def make_params(n_assets, years, n_actions, n_indicators=None, seed=0):
+    '''
+    params of `runPortfolio` with synthetic asset and indicator data,
+    run_daily select_all weigh_target rebalance
+    '''
+    rng = np.random.RandomState(seed)
+    n_days = int(years * 252)
+    n_indicators = n_indicators or max(1, n_assets)
+    prices = synthetic_prices(n_assets, n_days, seed)
+    indicators = synthetic_indicators(n_indicators, n_days, seed + 1)
+    action = []
+    for _ in range(n_actions):
+        method, make = METHODS[rng.randint(len(METHODS))]
+        action.append({
+            'asset_id': 'a%d' % rng.randint(n_assets),
+            'indicator_id': 'i%d' % rng.randint(n_indicators),
+            'method': method,
+            'strategy': str(rng.choice(['buy', 'sell', 'hold'])),
+            'params': make(rng),
+        })
+    return {
+        'data_table': {
+            'asset': [{'name': 'a%d' % i, 'df': prices[[i]], 'freq': 'D'} for i in range(n_assets)],
+            'indicator': [{'name': 'i%d' % i, 'df': indicators[[i]], 'freq': 'D'} for i in range(n_indicators)],
+        },
+        'strategy': [
+            {'class': 'run_daily', 'params': {}},
+            {'class': 'select_all', 'params': {}},
+            {'class': 'weigh_target', 'params': {'action': action}},
+            {'class': 'rebalance', 'params': {}},
+        ],
+    }
+
+
+@pytest.fixture
+def synthetic_params():
+    return make_params
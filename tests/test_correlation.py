@@ -0,0 +1,86 @@
+'''
+rolling and lagged correlations match pandas
+'''
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_tools.correlation import Correlation
+from backtest_tools.data import getDataTable
+
+
+def _frame(seed, n, T=1500, level=100.):
+    rng = np.random.RandomState(seed)
+    index = pd.bdate_range('2001-01-01', periods=T)
+    values = level + rng.normal(0, 1, (T, n)).cumsum(axis=0)
+    # constant windows, in one column and in all of them
+    values[200:300, 0] = values[199, 0]
+    values[700:760] = values[699]
+    return pd.DataFrame(values, index=index, columns=['c%d' % i for i in range(n)])
+
+
+@pytest.fixture
+def corr(synthetic_params):
+    return Correlation(getDataTable(synthetic_params(2, 1, 0)['data_table']))
+
+
+def _spread(frame, window):
+    return (frame.rolling(window).max() - frame.rolling(window).min()).values
+
+
+def _assert_rolling(result, x, y, window):
+    '''
+    constant windows are NaN, windows that vary match pandas
+    '''
+    result = result.values
+    # pandas keeps online sums, centered it does not lose the digits of the level
+    x, y = x - x.mean(), y - y.mean()
+    for i in range(x.shape[1]):
+        yi = y.iloc[:, 0 if y.shape[1] == 1 else i]
+        expected = x.iloc[:, i].rolling(window).corr(yi).values
+        sx, sy = _spread(x.iloc[:, i], window), _spread(yi, window)
+        constant = (sx == 0) | (sy == 0)
+        assert np.isnan(result[constant, i]).all()
+        # a window varying by less than the rounding of the running sums is left out
+        varies = (sx > 1e-3) & (sy > 1e-3)
+        assert varies.sum() > len(x) / 2
+        np.testing.assert_allclose(result[varies, i], expected[varies], atol=1e-7)
+        assert np.isnan(result[:window - 1, i]).all()
+
+
+@pytest.mark.parametrize('window', [5, 20, 60])
+@pytest.mark.parametrize('level', [100., 1e4])
+def test_rolling_matches_pandas(corr, window, level):
+    x, y = _frame(0, 4, level=level), _frame(1, 4, level=level)
+    _assert_rolling(corr.rolling(x, y, window), x, y, window)
+    # one y column for every x column
+    _assert_rolling(corr.rolling(x, y.iloc[:, [1]], window), x, y.iloc[:, [1]], window)
+
+
+def test_rolling_with_nan(corr):
+    x, y = _frame(2, 3), _frame(3, 3)
+    x.iloc[50:55, 1] = np.nan
+    y.iloc[900, 2] = np.nan
+    result = corr.rolling(x, y, 20)
+    _assert_rolling(result, x, y, 20)
+    assert result.iloc[50:74, 1].isnull().all() and result.iloc[900:920, 2].isnull().all()
+    assert result.iloc[74:200, 1].notnull().all()
+
+
+@pytest.mark.parametrize('method', ['pearson', 'spearman'])
+def test_lagged_matches_pandas(corr, method):
+    x, y = _frame(4, 3).pct_change().iloc[1:], _frame(5, 2).pct_change().iloc[1:]
+    lags = [-3, -1, 0, 1, 5]
+    result = corr.lagged(x, y, lags=lags, method=method)
+    for a in x.columns:
+        for b in y.columns:
+            for lag in lags:
+                expected = x[a].corr(y[b].shift(-lag), method=method)
+                np.testing.assert_allclose(result.loc[(a, b), lag], expected, atol=1e-10)
+
+
+def test_lagged_constant_is_nan(corr):
+    x = _frame(6, 2)
+    x['flat'] = 1.
+    result = corr.lagged(x, x.iloc[:, [0]], lags=[0, 2])
+    assert result.loc[('flat', 'c0')].isnull().all()
+    assert not result.loc[('c1', 'c0')].isnull().any()
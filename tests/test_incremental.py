@@ -0,0 +1,56 @@
+'''
+extendPortfolio continues a run as if the whole history was run at once
+'''
+import copy
+import numpy as np
+import pytest
+from backtest_tools.backtest import runPortfolio, snapshotPortfolio, extendPortfolio
+from backtest_tools.exceptions import RequirementNotMeetException
+
+
+def _cut(params, n):
+    cut = copy.deepcopy({k: v for k, v in params.items() if k != 'data_table'})
+    cut['data_table'] = {
+        key: [dict(item, df=item['df'].iloc[:n]) for item in items]
+        for key, items in params['data_table'].items()
+    }
+    return cut
+
+
+def _positions(strategy):
+    return {x.name: x.position for x in strategy.securities if x.position != 0}
+
+
+@pytest.mark.parametrize('run', ['run_daily', 'run_weekly', 'run_monthly'])
+@pytest.mark.parametrize('commissions', [None, lambda q, p: abs(q) * p * 0.001])
+def test_extend_matches_full_run(synthetic_params, run, commissions):
+    params = synthetic_params(3, 2, 10, seed=7)
+    params['strategy'][0]['class'] = run
+    params['commissions'] = commissions
+    full = runPortfolio(copy.deepcopy(params))['strategy'].strategy
+    n = len(full.prices) - 1
+
+    part = _cut(params, n - 100)
+    snapshot = snapshotPortfolio(runPortfolio(copy.deepcopy(part)), part)
+    # one long and one single-date extension, then the rest
+    for end in [n - 10, n - 9, n]:
+        out = extendPortfolio(snapshot, _cut(params, end)['data_table'])
+        snapshot = out['snapshot']
+
+    assert out['equity'].index.equals(full.prices.index)
+    np.testing.assert_allclose(out['equity'].values, full.prices.values, rtol=1e-10)
+    assert _positions(out['strategy'].strategy) == _positions(full)
+
+
+def test_snapshot_needs_a_run_algo(synthetic_params):
+    params = synthetic_params(2, 1, 4)
+    params['strategy'][0]['params'] = {'run_on_last_date': True}
+    with pytest.raises(RequirementNotMeetException):
+        snapshotPortfolio(runPortfolio(copy.deepcopy(params)), params)
+
+
+def test_snapshot_needs_bt_engine(synthetic_params):
+    params = synthetic_params(2, 1, 4)
+    params['engine'] = 'vectorized'
+    with pytest.raises(RequirementNotMeetException):
+        snapshotPortfolio(runPortfolio(copy.deepcopy(params)), params)
@@ -0,0 +1,69 @@
+'''
+event kernels give the same rows on every backend
+'''
+import numpy as np
+import pytest
+from backtest_tools.backtest import kernels
+from backtest_tools.exceptions import RequirementNotMeetException
+
+
+@pytest.fixture(autouse=True)
+def backend():
+    name = kernels.get_backend()
+    yield
+    kernels.set_backend(name)
+
+
+def _series(seed):
+    rng = np.random.RandomState(seed)
+    x = np.round(rng.normal(0, 1, 300).cumsum(), 1)
+    # NaN as from rolling windows and shifts, constant stretches for ties
+    x[:5] = np.nan
+    x[rng.randint(5, 300, 10)] = np.nan
+    x[100:120] = 0.
+    return x
+
+
+CASES = [(seed, sign, inclusive) for seed in range(5) for sign in [1, -1] for inclusive in [True, False]]
+
+
+@pytest.mark.parametrize('seed, sign, inclusive', CASES)
+def test_numpy_matches_loop(seed, sign, inclusive):
+    x, y = _series(seed), _series(seed + 100)
+    for threshold in [0., 0.5, np.nanmedian(x)]:
+        np.testing.assert_array_equal(
+            kernels._threshold_events_numpy(x, threshold, sign, inclusive),
+            kernels._threshold_events_loop(x, threshold, sign, inclusive),
+        )
+    np.testing.assert_array_equal(
+        kernels._crossover_events_numpy(x, y, sign), kernels._crossover_events_loop(x, y, sign)
+    )
+    np.testing.assert_array_equal(
+        kernels._crossover_events_numpy(x, x, sign), kernels._crossover_events_loop(x, x, sign)
+    )
+
+
+@pytest.mark.parametrize('seed, sign, inclusive', CASES)
+def test_numba_matches_numpy(seed, sign, inclusive):
+    pytest.importorskip('numba')
+    x, y = _series(seed), _series(seed + 100)
+    kernels.set_backend('numpy')
+    expected = kernels.threshold_events(x, 0.5, sign, inclusive), kernels.crossover_events(x, y, sign)
+    kernels.set_backend('numba')
+    np.testing.assert_array_equal(kernels.threshold_events(x, 0.5, sign, inclusive), expected[0])
+    np.testing.assert_array_equal(kernels.crossover_events(x, y, sign), expected[1])
+
+
+def test_without_numba(monkeypatch):
+    monkeypatch.delitem(kernels._KERNELS, 'numba', raising=False)
+    with pytest.raises(RequirementNotMeetException):
+        kernels.set_backend('numba')
+    kernels.set_backend('numpy')
+    assert kernels.get_backend() == 'numpy'
+    if kernels.numba is None:
+        assert 'numba' not in kernels._KERNELS
+
+
+def test_unknown_backend():
+    with pytest.raises(RequirementNotMeetException):
+        kernels.set_backend('cuda')
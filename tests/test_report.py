@@ -0,0 +1,62 @@
+'''
+getReport(batch=True) gives the report of each strategy
+'''
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_tools import runPortfolio
+from backtest_tools.backtest.portfolio import BacktestResult
+from backtest_tools.backtest.performance import _REPORT_FIELDS, _SERIES_FIELDS, _DASH_FIELDS
+
+SCALAR_FIELDS = [f for f in _REPORT_FIELDS if f not in _SERIES_FIELDS]
+
+
+@pytest.fixture(scope='module')
+def result():
+    from conftest import make_params
+    backtests = [
+        runPortfolio(make_params(3, years, 4, seed=seed))['strategy']
+        for seed, years in [(0, 2), (2, 1.5), (3, 0.5)]
+    ]
+    # a strategy without any trade
+    params = make_params(3, 1, 0, seed=4)
+    params['strategy'][2]['params']['action'] = [{
+        'asset_id': 'a0', 'indicator_id': 'i0', 'method': 'trade_at_threshold',
+        'strategy': 'buy', 'params': {'threshold': 1e9, 'n': 1, 'sign': 1},
+    }]
+    backtests.append(runPortfolio(params)['strategy'])
+    return BacktestResult(*backtests)
+
+
+def _same(batch, single):
+    assert set(batch) == set(single)
+    for field, value in single.items():
+        if isinstance(value, str) or value is None:
+            assert batch[field] == value, field
+        else:
+            assert not isinstance(batch[field], str), field
+            np.testing.assert_allclose(float(batch[field]), float(value), rtol=1e-9, err_msg=field)
+
+
+@pytest.mark.parametrize('fields', [
+    None,
+    ['kelly', 'win_rate', 'yearly_volatility'],
+    ['return_of_investment', 'yearly_volatility', 'max_dropdown', 'sharp_ratio'],
+])
+def test_batch_matches_each_strategy(result, fields):
+    batch = result.getReport(fields=fields, batch=True)
+    names = [bkt.name for bkt in result.backtest_list]
+    assert list(batch.index) == names
+    for name in names:
+        single = result.getReport(name, fields=fields or SCALAR_FIELDS)
+        if 'message' not in single:
+            single['message'] = 'succeed'
+        _same(batch.loc[name].to_dict(), single)
+
+
+def test_missing_stats_are_dashed(result):
+    batch = result.getReport(batch=True)
+    traded = batch['message'] == 'succeed'
+    # under a year of returns has no yearly volatility
+    assert (batch.loc[traded, 'yearly_volatility'] == '-').any()
+    assert not batch.loc[traded, _DASH_FIELDS + ['sharp_ratio']].isnull().any().any()
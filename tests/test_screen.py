@@ -0,0 +1,71 @@
+'''
+screenIndicators gives the same correlations by FFT or matrix, serial or in a process pool
+'''
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_tools.correlation import screen, screenIndicators
+
+LAGS = list(range(-30, 31))
+
+
+def _reference(x, y, lags):
+    out = np.full((x.shape[1], len(lags)), np.nan)
+    T = len(y)
+    for k, lag in enumerate(lags):
+        a, b = max(0, -lag), min(T, T - lag)
+        for i in range(x.shape[1]):
+            out[i, k] = np.corrcoef(x[a:b, i], y[a + lag:b + lag])[0, 1]
+    return out
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fft_matches_matrix(seed):
+    rng = np.random.RandomState(seed)
+    T, n = 400 + 37 * seed, 25
+    y = rng.normal(0, 0.01, T)
+    x = 50 + rng.normal(0, 2, (T, n)).cumsum(axis=0)
+    # one indicator leads the target by 3
+    x[3:, 0] += 1e3 * y[:-3]
+    matrix = screen._lead_lag(x, y, LAGS, 'matrix')
+    fft = screen._lead_lag(x, y, LAGS, 'fft')
+    np.testing.assert_allclose(fft, matrix, atol=1e-10)
+    np.testing.assert_allclose(matrix, _reference(x, y, LAGS), atol=1e-10)
+    assert LAGS[np.nanargmax(matrix[0])] == -3
+    assert screen._lead_lag(x, y, LAGS, 'auto').shape == (n, len(LAGS))
+
+
+def _screen(params, **kwargs):
+    args = {'data_table': params['data_table'], 'asset_id': 'a0', 'lags': LAGS, 'k': 10 ** 6}
+    args.update(kwargs)
+    return screenIndicators(args).set_index(['indicator_id', 'lag']).sort_index()
+
+
+@pytest.fixture
+def params(synthetic_params):
+    return synthetic_params(1, 2, 0, n_indicators=40, seed=3)
+
+
+@pytest.mark.parametrize('horizon', [1, 5])
+def test_screen_fft_matches_matrix(params, horizon):
+    matrix = _screen(params, method='matrix', horizon=horizon)
+    fft = _screen(params, method='fft', horizon=horizon)
+    assert len(matrix) == 40 * len(LAGS)
+    assert fft.index.equals(matrix.index)
+    np.testing.assert_allclose(fft['correlation'], matrix['correlation'], atol=1e-10)
+    pd.testing.assert_series_equal(fft['nobs'], matrix['nobs'])
+
+
+def test_screen_pool_matches_serial(params, monkeypatch):
+    serial = screenIndicators({'data_table': params['data_table'], 'asset_id': 'a0', 'lags': LAGS, 'k': 50})
+    # blocks of 7 indicators, 6 tasks for the pool
+    monkeypatch.setattr(screen, 'BLOCK', 7)
+    blocked = screenIndicators({'data_table': params['data_table'], 'asset_id': 'a0', 'lags': LAGS, 'k': 50})
+    pooled = screenIndicators({
+        'data_table': params['data_table'], 'asset_id': 'a0', 'lags': LAGS, 'k': 50, 'n_jobs': 3
+    })
+    pd.testing.assert_frame_equal(pooled, blocked)
+    pd.testing.assert_frame_equal(pooled[['indicator_id', 'lag', 'nobs']], serial[['indicator_id', 'lag', 'nobs']])
+    np.testing.assert_allclose(pooled['correlation'], serial['correlation'], atol=1e-12)
+    scores = np.abs(pooled['correlation'].values)
+    assert (np.diff(scores) <= 0).all()
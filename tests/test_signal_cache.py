@@ -0,0 +1,122 @@
+'''
+memory and disk tiers of SignalCache, and when their keys change
+'''
+import copy
+import os
+import numpy as np
+import pytest
+from backtest_tools.data import getDataTable
+from backtest_tools.backtest import customized_strategy
+from backtest_tools.backtest.signal_engine import SignalCache, getSignal
+
+
+PARAMS = {'threshold': 50., 'n': 2, 'sign': 1}
+
+
+@pytest.fixture
+def data_table(synthetic_params):
+    return getDataTable(synthetic_params(2, 2, 0)['data_table'], use_cache=False)
+
+
+def _key(cache, data_table, indicator='i0', params=PARAMS):
+    signal = getSignal('trade_at_threshold')
+    return cache.key(data_table, signal, signal.indicator(data_table, indicator), signal.validate(params))
+
+
+def _column(data_table, indicator='i0'):
+    return data_table.indicator.columns.get_loc(getSignal('trade_at_threshold').indicator(data_table, indicator))
+
+
+def _dates(data_table, indicator='i0'):
+    return getSignal('trade_at_threshold')(data_table, indicator, dict(PARAMS))
+
+
+def test_memory_hit_and_miss(data_table):
+    cache = SignalCache()
+    key = _key(cache, data_table)
+    assert cache.get(key) is None
+    stored = cache.put(key, _dates(data_table))
+    assert not stored.flags.writeable
+    assert cache.get(key) is stored
+    assert cache.get(_key(cache, data_table, 'i1')) is None
+    assert cache.get(_key(cache, data_table, params=dict(PARAMS, n=3))) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_disk_hit_across_instances(data_table, tmp_path):
+    root = str(tmp_path / 'signals')
+    first = SignalCache(root=root)
+    key = _key(first, data_table)
+    stored = first.put(key, _dates(data_table))
+
+    second = SignalCache(root=root)
+    # the key does not depend on the table object, only on its contents
+    copied = copy.deepcopy(data_table)
+    loaded = second.get(_key(second, copied))
+    np.testing.assert_array_equal(loaded, stored)
+    assert not loaded.flags.writeable
+    assert second.disk_hits == 1
+    assert second.get(_key(second, copied)) is loaded
+    assert second.hits == 1
+
+
+def test_changed_column_invalidates(data_table, tmp_path):
+    cache = SignalCache(root=str(tmp_path))
+    key = _key(cache, data_table)
+    cache.put(key, _dates(data_table))
+    other = _key(cache, data_table, 'i1')
+
+    # same table and frame objects, contents changed in place
+    indicator = data_table.indicator
+    column = _column(data_table)
+    indicator.iloc[10:20, column] = indicator.iloc[10:20, column] + 5.
+    assert data_table.indicator is indicator
+    changed = _key(cache, data_table)
+    assert changed != key
+    assert cache.get(changed) is None
+    assert SignalCache(root=str(tmp_path)).get(changed) is None
+    # the other column did not change
+    assert _key(cache, data_table, 'i1') == other
+
+
+def test_weigh_target_recomputes_changed_table(data_table, monkeypatch):
+    cache = SignalCache()
+    monkeypatch.setattr(customized_strategy, 'signal_cache', cache)
+    params = {'action': [
+        {'asset_id': 'a0', 'indicator_id': 'i0', 'method': 'trade_at_threshold', 'strategy': 'buy', 'params': dict(PARAMS)},
+        {'asset_id': 'a1', 'indicator_id': 'i0', 'method': 'ma_crossover_price', 'strategy': 'sell', 'params': {'ma': 5, 'sign': 1}},
+    ]}
+    first = customized_strategy.weigh_target(data_table, copy.deepcopy(params)).weights
+    customized_strategy.weigh_target(data_table, copy.deepcopy(params))
+    assert cache.hits == 2
+
+    column = _column(data_table)
+    data_table.indicator.iloc[:, column] = 100. - data_table.indicator.iloc[:, column]
+    cached = customized_strategy.weigh_target(data_table, copy.deepcopy(params)).weights
+    fresh = customized_strategy.weigh_target(data_table, dict(copy.deepcopy(params), use_cache=False)).weights
+    assert cache.hits == 2
+    assert cached.equals(fresh)
+    assert not cached.equals(first)
+
+
+def test_disk_eviction_and_clear(data_table, tmp_path):
+    root = str(tmp_path)
+    cache = SignalCache(root=root, disk_bytes=4096)
+    for n in range(1, 30):
+        params = dict(PARAMS, n=n)
+        cache.put(_key(cache, data_table, params=params), _dates(data_table))
+    assert cache.info()['disk_nbytes'] <= 4096
+    assert sum(os.path.getsize(os.path.join(root, f)) for f in os.listdir(root)) <= 4096
+
+    cache.clear(disk=True)
+    assert not [f for f in os.listdir(root) if f.endswith('.npy')]
+    assert cache.get(_key(cache, data_table)) is None
+
+
+def test_unreadable_file_is_a_miss(data_table, tmp_path):
+    cache = SignalCache(root=str(tmp_path))
+    key = _key(cache, data_table)
+    cache.put(key, _dates(data_table))
+    with open(cache._path(key), 'wb') as f:
+        f.write(b'not an array')
+    assert SignalCache(root=str(tmp_path)).get(key) is None
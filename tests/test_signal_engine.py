@@ -0,0 +1,72 @@
+'''
+parity of the batched SignalEngine with the pandas function of each signal
+'''
+import copy
+from itertools import product
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_tools.data import getDataTable
+from backtest_tools.backtest import customized_strategy
+from backtest_tools.backtest.signal_engine import SignalEngine, SIGNALS
+
+
+GRID = {
+    'trade_at_threshold': {'threshold': [40., 50., 55.5], 'n': [1, 2, 4]},
+    'continuous_growth': {'n': [1, 2, 3, 5]},
+    'cumulative_return_threshold': {'threshold': [-0.02, 0., 0.03], 'n': [1, 3, 8]},
+    'ma_crossover_ma': {'ma1': [2, 5, 10], 'ma2': [3, 5, 30]},
+    'ma_crossover_price': {'ma': [1, 5, 20]},
+}
+
+
+@pytest.fixture
+def data_table(synthetic_params):
+    params = synthetic_params(2, 2, 0, n_indicators=1)['data_table']
+    df = params['indicator'][0]['df']
+    # ties and constant stretches for the equality cases
+    flat = df.copy()
+    flat.iloc[100:160] = 50.
+    params['indicator'] += [
+        {'name': 'rounded', 'df': df.round(-1), 'freq': 'D'},
+        {'name': 'flat', 'df': flat, 'freq': 'D'},
+    ]
+    return getDataTable(params, use_cache=False)
+
+
+def _actions(method):
+    grid = GRID[method]
+    names = sorted(grid)
+    for values in product(*[grid[name] for name in names]):
+        for sign in [1, -1]:
+            for indicator in ['i0', 'rounded', 'flat']:
+                params = dict(zip(names, values), sign=sign)
+                yield {'method': method, 'indicator_id': indicator, 'params': params, 'asset_id': 'a0', 'strategy': 'buy'}
+
+
+def _dates(dates):
+    return np.asarray(pd.DatetimeIndex(dates).values, dtype='datetime64[ns]')
+
+
+def test_grid_covers_every_vectorizable_signal():
+    assert sorted(GRID) == sorted(name for name, signal in SIGNALS.items() if signal.vectorizable)
+
+
+@pytest.mark.parametrize('method', sorted(GRID))
+def test_engine_matches_signal(data_table, method):
+    actions = list(_actions(method))
+    dateLists = SignalEngine(data_table).evaluate(copy.deepcopy(actions))
+    assert len(dateLists) == len(actions)
+    for action, dates in zip(actions, dateLists):
+        expected = getattr(customized_strategy, method)(
+            data_table=data_table, indicatorID=action['indicator_id'], params=copy.deepcopy(action['params'])
+        )
+        np.testing.assert_array_equal(_dates(dates), _dates(expected), err_msg=str(action))
+
+
+def test_mixed_batch_matches_single_actions(data_table):
+    actions = [action for method in sorted(GRID) for action in _actions(method)]
+    batch = SignalEngine(data_table).evaluate(copy.deepcopy(actions))
+    for action, dates in zip(actions, batch):
+        single = SignalEngine(data_table).evaluate([copy.deepcopy(action)])[0]
+        np.testing.assert_array_equal(_dates(dates), _dates(single), err_msg=str(action))
@@ -0,0 +1,119 @@
+'''
+CachedDataSource: lookup by frequency, persisted access times, concurrent fetches
+'''
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_tools.source import DataSource, CachedDataSource
+
+
+INDEX = pd.bdate_range('2015-01-01', periods=50)
+
+
+class CountingSource(DataSource):
+    def __init__(self, barrier=None, delay=0.):
+        self.calls = []
+        self.barrier = barrier
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def fetch(self, stat_param):
+        with self._lock:
+            self.calls.append(dict(stat_param))
+        if self.barrier is not None:
+            self.barrier.wait()
+        time.sleep(self.delay)
+        frequency = stat_param.get('frequency') or 'D'
+        scale = 2. if frequency == 'M' else 1.
+        data = pd.DataFrame({'v': np.arange(len(INDEX)) * scale}, index=INDEX)
+        return {'id': stat_param['id'], 'info': {'frequency': frequency}, 'data': data}
+
+
+def test_fetch_without_frequency(tmp_path):
+    source = CountingSource()
+    cache = CachedDataSource(source, str(tmp_path))
+    cache.fetch({'id': 1})
+    cache.fetch({'id': 1})
+    cache.fetch({'id': 1, 'frequency': 'D'})
+    assert len(source.calls) == 1
+    assert cache.info()['hits'] == 2
+
+    # with two frequencies cached the id is ambiguous, it is fetched again
+    monthly = cache.fetch({'id': 1, 'frequency': 'M'})
+    assert len(source.calls) == 2
+    cache.fetch({'id': 1})
+    assert len(source.calls) == 3
+    assert cache.fetch({'id': 1, 'frequency': 'M'})['data'].equals(monthly['data'])
+
+
+def test_access_time_survives_reopen(tmp_path):
+    source = CountingSource()
+    cache = CachedDataSource(source, str(tmp_path))
+    for ID in [1, 2, 3]:
+        cache.fetch({'id': ID})
+    time.sleep(0.01)
+    cache.fetch({'id': 1})
+
+    reopened = CachedDataSource(source, str(tmp_path))
+    accessed = {key[0]: meta['accessed'] for key, meta in reopened._entries.items()}
+    assert accessed['1'] == max(accessed.values())
+    assert accessed['1'] == cache._entries[('1', 'D')]['accessed']
+
+    # the least recently used series go first, also in another instance
+    nbytes = reopened._entries[('1', 'D')]['nbytes']
+    small = CachedDataSource(source, str(tmp_path), max_bytes=nbytes)
+    assert list(small._entries) == [('1', 'D')]
+    small.fetch({'id': 1})
+    assert len(source.calls) == 3
+
+
+def test_different_series_are_fetched_concurrently(tmp_path):
+    # the barrier only opens if all fetches reach the source at the same time
+    source = CountingSource(barrier=threading.Barrier(4, timeout=10))
+    cache = CachedDataSource(source, str(tmp_path))
+    errors = []
+
+    def fetch(ID):
+        try:
+            cache.fetch({'id': ID})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch, args=(ID,)) for ID in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.info()['misses'] == 4
+
+
+def test_same_series_is_fetched_once(tmp_path):
+    source = CountingSource(delay=0.2)
+    cache = CachedDataSource(source, str(tmp_path))
+    records = []
+    threads = [
+        threading.Thread(target=lambda: records.append(cache.fetch({'id': 7}))) for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(source.calls) == 1
+    assert len(records) == 5
+    for record in records:
+        pd.testing.assert_frame_equal(record['data'], records[0]['data'], check_freq=False)
+    assert cache.info()['hits'] == 4
+
+
+def test_refresh_appends_rows(tmp_path):
+    source = CountingSource()
+    cache = CachedDataSource(source, str(tmp_path), ttl=0)
+    cache.fetch({'id': 1})
+    time.sleep(0.01)
+    record = cache.fetch({'id': 1})
+    assert len(record['data']) == len(INDEX)
+    assert cache.info()['refreshes'] == 1
+    assert cache.info()['appended_rows'] == 0
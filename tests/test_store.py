@@ -0,0 +1,70 @@
+'''
+results written by saveResult read back with the same reports
+'''
+import math
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_tools.backtest import runPortfolio, Portfolio
+from backtest_tools.backtest.store import saveResult, loadResult, StoredResult
+
+
+def _equal(a, b):
+    if isinstance(a, dict):
+        assert sorted(a) == sorted(b)
+        for key in a:
+            _equal(a[key], b[key])
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            _equal(x, y)
+    elif isinstance(a, float) and math.isnan(a):
+        assert isinstance(b, float) and math.isnan(b)
+    else:
+        assert a == b
+
+
+@pytest.fixture
+def res(synthetic_params):
+    params = synthetic_params(3, 2, 8, seed=2)
+    params['riskfree_rate'] = 0.02
+    return runPortfolio(params)
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip_report(res, tmp_path, mmap):
+    saveResult(res, str(tmp_path))
+    stored = loadResult(str(tmp_path), mmap=mmap)
+    assert isinstance(stored, StoredResult)
+    _equal(stored.getReport(), res['result'].getReport())
+    pd.testing.assert_frame_equal(stored.get_transactions(), res['result'].get_transactions())
+
+
+def test_arrays_load_on_first_use(res, tmp_path):
+    saveResult(res['result'], str(tmp_path))
+    stored = loadResult(str(tmp_path))
+    lazy = stored.backtest_list[0]._lazy
+    assert lazy._arrays == {}
+
+    prices = stored.backtest_list[0].strategy.prices
+    assert sorted(lazy._arrays) == [('prices', 'date'), ('prices', 'values')]
+    assert isinstance(lazy('prices', 'values'), np.memmap)
+    original = res['result'].backtest_list[0].strategy.prices
+    np.testing.assert_array_equal(prices.values, original.values)
+    assert prices.index.equals(original.index)
+
+    assert not isinstance(loadResult(str(tmp_path), mmap=False).backtest_list[0]._lazy('prices', 'values'), np.memmap)
+
+
+def test_portfolio_save_formats(res, tmp_path):
+    pickled = str(tmp_path / 'res.pkl')
+    Portfolio.save(res, pickled)
+    assert os.path.isfile(pickled)
+    _equal(Portfolio.load(pickled)['result'].getReport(), res['result'].getReport())
+
+    store = str(tmp_path / 'store')
+    Portfolio.save(res, store, output='store')
+    loaded = Portfolio.load(store)
+    assert isinstance(loaded['result'], StoredResult)
+    _equal(loaded['result'].getReport(), res['result'].getReport())
@@ -0,0 +1,59 @@
+'''
+runSweep gives the same table for any n_jobs
+'''
+import pandas as pd
+import pytest
+from backtest_tools.data import saveDataTable
+from backtest_tools.backtest import sweep
+from backtest_tools.backtest.sweep import runSweep
+from backtest_tools.exceptions import RequirementNotMeetException
+
+
+GRID = {0: {'threshold': [45., 55.], 'n': [1, 2]}, 1: {'sign': [1, 2]}}
+
+
+@pytest.fixture
+def template(synthetic_params):
+    params = synthetic_params(3, 2, 4, seed=5)
+    action = params['strategy'][2]['params']['action']
+    # buy and close the same asset, so every valid point has closed trades
+    action[0].update(method='trade_at_threshold', strategy='buy', params={'threshold': 50., 'n': 1, 'sign': 1})
+    action[1].update(method='continuous_growth', strategy='hold', asset_id=action[0]['asset_id'], params={'n': 2, 'sign': 1})
+    return params
+
+
+def test_grid_order_and_errors(template):
+    table = runSweep(template, GRID)
+    assert len(table) == 8
+    assert list(table.columns[:3]) == ['0.n', '0.threshold', '1.sign']
+    assert list(table['1.sign']) == [1, 2] * 4
+    # sign 2 is rejected by the signal, the point is recorded instead of raised
+    failed = table['1.sign'] == 2
+    assert table.loc[failed, 'error'].str.startswith('RequirementNotMeetException').all()
+    assert table.loc[failed, 'return_of_investment'].isnull().all()
+    assert table.loc[~failed, 'error'].isnull().all()
+
+
+def test_other_errors_are_raised(template, monkeypatch):
+    def broken(params):
+        raise TypeError('broken')
+    monkeypatch.setattr(sweep, 'runPortfolio', broken)
+    with pytest.raises(TypeError):
+        runSweep(template, GRID)
+
+
+@pytest.mark.parametrize('saved', [False, True])
+def test_n_jobs_give_same_table(template, tmp_path, saved):
+    if saved:
+        path = str(tmp_path / 'table')
+        saveDataTable(template['data_table'], path)
+        template = dict(template, data_table=path)
+    serial = runSweep(template, GRID, n_jobs=1)
+    parallel = runSweep(template, GRID, n_jobs=3)
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+@pytest.mark.parametrize('n_jobs', [0, -2, 1.5])
+def test_invalid_n_jobs(template, n_jobs):
+    with pytest.raises(RequirementNotMeetException):
+        runSweep(template, GRID, n_jobs=n_jobs)
@@ -0,0 +1,100 @@
+'''
+parity of engine='vectorized' with the bt engine
+'''
+import copy
+import numpy as np
+import pandas as pd
+import pytest
+import bt
+from backtest_tools.backtest.portfolio import runPortfolio, BacktestResult
+from backtest_tools.backtest import vectorized
+from backtest_tools.backtest.vectorized import VectorizedResult
+from backtest_tools.exceptions import EngineNotSupportedException
+
+
+def _params(synthetic_params, case):
+    params = synthetic_params(4, 2, 12, seed=3)
+    strategy = params['strategy']
+    if case == 'commissions':
+        params['commissions'] = lambda q, p: max(1., abs(q) * p * 0.001)
+    elif case == 'dates':
+        params['start_date'] = '2000-06-01'
+        params['end_date'] = '2001-06-01'
+    elif case == 'run_weekly':
+        strategy[0] = {'class': 'run_weekly', 'params': {}}
+    elif case == 'run_monthly':
+        strategy[0] = {'class': 'run_monthly', 'params': {'run_on_end_of_period': True}}
+        params['riskfree_rate'] = 0.01
+    elif case == 'run_quarterly':
+        strategy[0] = {'class': 'run_quarterly', 'params': {'run_on_first_date': False}}
+    elif case == 'no_select_all':
+        del strategy[1]
+    return params
+
+
+def _run(params, engine):
+    params = copy.deepcopy(params)
+    params['engine'] = engine
+    return runPortfolio(params)['result']
+
+
+def _same(a, b):
+    if isinstance(a, (pd.Series, pd.DataFrame)):
+        assert a.index.equals(b.index)
+        np.testing.assert_allclose(
+            np.asarray(a.values, dtype=float), np.asarray(b.values, dtype=float), rtol=1e-10
+        )
+    elif isinstance(a, dict):
+        assert sorted(a) == sorted(b)
+        for key in a:
+            _same(a[key], b[key])
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            _same(x, y)
+    elif isinstance(a, (int, float, np.number)):
+        np.testing.assert_allclose(float(a), float(b), rtol=1e-10)
+    else:
+        assert a == b
+
+
+@pytest.mark.parametrize('case', ['default', 'commissions', 'dates', 'run_weekly', 'run_monthly', 'run_quarterly', 'no_select_all'])
+def test_vectorized_matches_bt(synthetic_params, case):
+    params = _params(synthetic_params, case)
+    bt_result = _run(params, 'bt')
+    vec_result = _run(params, 'vectorized')
+    assert isinstance(bt_result, BacktestResult)
+    assert isinstance(vec_result, VectorizedResult)
+
+    b, v = bt_result.backtest_list[0], vec_result.backtest_list[0]
+    _same(b.strategy.prices, v.strategy.prices)
+    assert [s.name for s in b.strategy.securities] == [s.name for s in v.strategy.securities]
+    for sb, sv in zip(b.strategy.securities, v.strategy.securities):
+        np.testing.assert_array_equal(sb.positions.values, sv.positions.values)
+    assert not bt_result.get_transactions().empty
+    _same(bt_result.get_transactions(), vec_result.get_transactions())
+    _same(bt_result.getReport(), vec_result.getReport())
+
+
+def test_unsupported_stack_falls_back_to_bt(synthetic_params):
+    params = synthetic_params(4, 2, 12, seed=3)
+    params['strategy'].insert(3, {'class': 'weigh_equally', 'params': {}})
+    assert not vectorized.supports(params['strategy'])
+    with pytest.raises(EngineNotSupportedException):
+        vectorized.runVectorized(copy.deepcopy(params))
+    result = _run(params, 'vectorized')
+    assert isinstance(result, BacktestResult)
+    assert hasattr(result.backtest_list[0].strategy, 'stack')
+
+
+@pytest.mark.parametrize('algo', [bt.algos.RunDaily, bt.algos.RunWeekly, bt.algos.RunMonthly, bt.algos.RunQuarterly, bt.algos.RunYearly])
+@pytest.mark.parametrize('kwargs', [{}, {'run_on_end_of_period': True}, {'run_on_first_date': False, 'run_on_last_date': True}])
+def test_run_flags_match_compare_dates(algo, kwargs):
+    algo = algo(**kwargs)
+    index = pd.bdate_range('2003-12-20', '2006-01-10')[::2]
+    expected = [algo._run_on_first_date]
+    for i in range(1, len(index) - 1):
+        other = index[i + 1] if algo._run_on_end_of_period else index[i - 1]
+        expected.append(algo.compare_dates(index[i], other))
+    expected.append(algo._run_on_last_date)
+    assert list(vectorized._run_flags(algo, index)) == expected
@@ -0,0 +1,74 @@
+'''
+parity of the event frame weights with the row by row loop
+'''
+import numpy as np
+import pandas as pd
+import pytest
+from backtest_tools.backtest.customized_strategy import _weight_by_event, _weight_by_loop
+
+
+def _asset(rng):
+    # business days, so calendar dates of the actions fall between rows
+    index = pd.bdate_range('2010-01-01', periods=60)
+    return pd.DataFrame(rng.uniform(10, 20, size=(len(index), 3)), index=index, columns=['a', 'b', 'c'])
+
+
+def _actions(rng, asset, n):
+    dates = pd.date_range(asset.index[0] - pd.Timedelta(days=5), asset.index[-1] + pd.Timedelta(days=5))
+    ids = list(asset.columns) + ['x', 'y']
+    actionList = [
+        [str(rng.choice(['buy', 'sell', 'hold'])), str(rng.choice(ids)), dates[rng.randint(len(dates))]]
+        for _ in range(n)
+    ]
+    # same date and asset in both orders of buy and sell
+    date = asset.index[rng.randint(len(asset.index))]
+    actionList += [['buy', 'a', date], ['sell', 'a', date], ['sell', 'b', date], ['buy', 'b', date]]
+    # stable sort by date as `_collect_actions`, ties keep their order
+    return sorted(actionList, key=lambda x: x[2])
+
+
+def _check(asset, actionList):
+    by_event = _weight_by_event(asset, actionList)
+    by_loop = _weight_by_loop(asset, actionList)
+    assert list(by_event.columns) == list(by_loop.columns)
+    assert by_event.index.equals(by_loop.index)
+    for col in by_loop.columns:
+        np.testing.assert_array_equal(
+            by_event[col].values.astype(float), by_loop[col].values.astype(float), err_msg=col
+        )
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_event_matches_loop(seed):
+    rng = np.random.RandomState(seed)
+    asset = _asset(rng)
+    _check(asset, _actions(rng, asset, rng.randint(1, 40)))
+
+
+def test_ties_keep_the_last_action():
+    rng = np.random.RandomState(0)
+    asset = _asset(rng)
+    date = asset.index[10]
+    for actionList in ([['buy', 'a', date], ['sell', 'a', date]], [['sell', 'a', date], ['buy', 'a', date]]):
+        _check(asset, actionList)
+        assert _weight_by_event(asset, actionList)['a'].iloc[-1] == (-1 if actionList[-1][0] == 'sell' else 1)
+
+
+def test_dates_outside_the_index_and_unknown_assets():
+    rng = np.random.RandomState(1)
+    asset = _asset(rng)
+    saturday = asset.index[asset.index.dayofweek == 4][0] + pd.Timedelta(days=1)
+    assert saturday not in asset.index
+    actionList = [
+        ['buy', 'a', asset.index[0] - pd.Timedelta(days=3)],
+        ['buy', 'x', saturday],
+        ['sell', 'b', saturday],
+        ['buy', 'c', asset.index[-1] + pd.Timedelta(days=3)],
+    ]
+    _check(asset, actionList)
+    assert 'x' in _weight_by_event(asset, actionList).columns
+
+
+def test_no_actions():
+    asset = _asset(np.random.RandomState(2))
+    _check(asset, [])